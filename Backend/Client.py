@@ -1,33 +1,174 @@
+import json
+import os
 import requests
 import time
 
+BASE_URL = 'http://localhost:8000/api'
+
+def poll_for_status(video_id, interval=5):
+    """Poll the status endpoint until processing finishes (fallback without events)"""
+    while True:
+        status_response = requests.get(f'{BASE_URL}/videos/{video_id}/status/')
+        status_data = status_response.json()
+        
+        if status_data['status'] in ('completed', 'failed'):
+            return status_data
+        
+        print(f"Current status: {status_data['status']}. Waiting...")
+        time.sleep(interval)  # Wait before checking again
+
+def stream_status_events(video_id, timeout=600, max_retries=5):
+    """
+    Follow the server-sent events of a submission until it completes or fails
+    
+    Dropped connections are resumed with a backoff; a stream the server
+    ends without a final status means events are not available.
+    
+    Returns:
+    dict: The final status, or None if the stream ended early
+    """
+    last_event = None
+    last_event_id = None
+    failures = 0
+    deadline = time.monotonic() + timeout
+    
+    while time.monotonic() < deadline:
+        headers = {'Accept': 'text/event-stream'}
+        if last_event_id:
+            # Resume after the last event seen if the connection dropped
+            headers['Last-Event-ID'] = last_event_id
+        
+        try:
+            with requests.get(f'{BASE_URL}/videos/{video_id}/events/', headers=headers,
+                              stream=True, timeout=(10, 60)) as response:
+                if response.status_code != 200:
+                    print(f"Status events unavailable: {response.status_code}")
+                    return None
+                
+                event_type, data = None, []
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('id:'):
+                        last_event_id = line[3:].strip()
+                    elif line.startswith('event:'):
+                        event_type = line[6:].strip()
+                    elif line.startswith('data:'):
+                        data.append(line[5:].strip())
+                    elif line == '' and data:
+                        # Blank line: end of one event
+                        if event_type == 'error':
+                            return None
+                        last_event = json.loads('\n'.join(data))
+                        failures = 0
+                        print(f"Current status: {last_event['status']} ({last_event.get('stage')})")
+                        if last_event['status'] in ('completed', 'failed'):
+                            return last_event
+                        event_type, data = None, []
+        except requests.RequestException as e:
+            failures += 1
+            if failures > max_retries:
+                print(f"Status event stream failed: {e}")
+                return None
+            print(f"Status event stream interrupted: {e}. Reconnecting...")
+            time.sleep(min(2 ** failures, 30))
+            continue
+        
+        # Closed by the server before the submission finished
+        print("Status event stream ended early")
+        return None
+    
+    return last_event
+
+def wait_for_completion(video_id):
+    """Wait for a submission to finish, pushed over server-sent events when available"""
+    status_data = stream_status_events(video_id)
+    if status_data is None or status_data['status'] not in ('completed', 'failed'):
+        status_data = poll_for_status(video_id)
+    return status_data
+
+def upload_video_resumable(video_path, form_type='personal_info', chunk_size=8 * 1024 * 1024,
+                           max_retries=5, upload_id=None):
+    """
+    Upload a video in chunks, resuming after dropped connections
+    
+    Parameters:
+    video_path (str): Path to the video
+    form_type (str): Form to extract
+    chunk_size (int): Bytes per request (at most the server's UPLOAD_CHUNK_MAX_BYTES)
+    max_retries (int): Consecutive failed chunks before giving up
+    upload_id (str, optional): Session to resume, from an earlier attempt
+    
+    Returns:
+    dict: The response to the last chunk (id, status, ...), or None on failure
+    """
+    size = os.path.getsize(video_path)
+    
+    if upload_id is None:
+        response = requests.post(f'{BASE_URL}/uploads/', data={
+            'filename': os.path.basename(video_path),
+            'size': size,
+            'form_type': form_type
+        })
+        if response.status_code != 201:
+            print(f"Upload failed: {response.text}")
+            return None
+        upload_id = response.json()['id']
+        offset = 0
+    else:
+        # Ask the server how much it already has
+        offset = int(requests.head(f'{BASE_URL}/uploads/{upload_id}/').headers['Upload-Offset'])
+    
+    upload_url = f'{BASE_URL}/uploads/{upload_id}/'
+    failures = 0
+    with open(video_path, 'rb') as video:
+        while True:
+            video.seek(offset)
+            chunk = video.read(chunk_size)
+            try:
+                response = requests.patch(upload_url, data=chunk, headers={
+                    'Upload-Offset': str(offset),
+                    'Content-Type': 'application/offset+octet-stream'
+                }, timeout=(10, 300))
+            except requests.RequestException as e:
+                failures += 1
+                if failures > max_retries:
+                    print(f"Upload failed at byte {offset}: {e}. Resume with upload_id={upload_id}")
+                    return None
+                print(f"Upload interrupted at byte {offset}: {e}. Resuming...")
+                time.sleep(min(2 ** failures, 30))
+                # Some of the chunk may have been committed
+                offset = int(requests.head(upload_url).headers['Upload-Offset'])
+                continue
+            
+            if response.status_code == 409:
+                offset = int(response.headers['Upload-Offset'])
+                continue
+            if response.status_code not in (200, 202):
+                print(f"Upload failed: {response.text}")
+                return None
+            
+            failures = 0
+            offset = int(response.headers['Upload-Offset'])
+            print(f"Uploaded {offset}/{size} bytes")
+            if offset == size:
+                return response.json()
+
 def upload_video_and_get_form_data(video_path, form_type='personal_info'):
     # Upload video
-    files = {'video_file': open(video_path, 'rb')}
-    data = {'form_type': form_type}
-    response = requests.post('http://localhost:8000/api/videos/', files=files, data=data)
-    
-    if response.status_code != 202:
-        print(f"Upload failed: {response.text}")
+    result = upload_video_resumable(video_path, form_type)
+    if result is None:
         return None
     
-    video_id = response.json()['id']
+    video_id = result['id']
     print(f"Video uploaded successfully. ID: {video_id}")
     
-    # Poll for processing completion
-    while True:
-        status_response = requests.get(f'http://localhost:8000/api/videos/{video_id}/status/')
-        status_data = status_response.json()
-        
-        if status_data['status'] == 'completed':
-            print("Processing completed!")
-            break
-        elif status_data['status'] == 'failed':
-            print(f"Processing failed: {status_data['error_message']}")
-            return None
-        
-        print(f"Current status: {status_data['status']}. Waiting...")
-        time.sleep(5)  # Wait for 5 seconds before checking again
+    # Wait for processing completion
+    status_data = wait_for_completion(video_id)
+    
+    if status_data['status'] == 'failed':
+        print(f"Processing failed: {status_data['error_message']}")
+        return None
+    
+    print("Processing completed!")
     
     # Get the form data
     if status_data['form_data_available']:
@@ -36,6 +177,61 @@ def upload_video_and_get_form_data(video_path, form_type='personal_info'):
         print("Form data not available")
         return None
 
-# Example usage
-form_data = upload_video_and_get_form_data('path/to/your/video.mp4', 'job_application')
-print("Extracted form data:", form_data)
+def submit_batch(video_paths, form_type='personal_info', files_per_request=20):
+    """
+    Submit many videos as one batch, a few files per request
+    
+    Returns:
+    str: The batch id, or None on failure
+    """
+    batch_id = None
+    for start in range(0, len(video_paths), files_per_request):
+        group_paths = video_paths[start:start + files_per_request]
+        handles = [open(path, 'rb') for path in group_paths]
+        try:
+            files = [('video_files', (os.path.basename(path), handle)) for path, handle in zip(group_paths, handles)]
+            # The first request creates the batch, the next ones add to it
+            url = f'{BASE_URL}/batches/{batch_id}/' if batch_id else f'{BASE_URL}/batches/'
+            response = requests.post(url, files=files, data={'form_type': form_type})
+        finally:
+            for handle in handles:
+                handle.close()
+        
+        if response.status_code != 202:
+            print(f"Batch submission failed: {response.text}")
+            return None
+        
+        batch_id = response.json()['id']
+        print(f"Submitted {start + len(group_paths)}/{len(video_paths)} videos: {response.json()['message']}")
+    
+    return batch_id
+
+def wait_for_batch(batch_id, interval=5):
+    """Wait until every video in a batch is completed or failed; one request per check"""
+    while True:
+        batch_status = requests.get(f'{BASE_URL}/batches/{batch_id}/').json()
+        if batch_status['done']:
+            return batch_status
+        
+        counts = batch_status['counts']
+        print(f"Batch progress: {batch_status['progress']:.0%} "
+              f"({counts['completed']} completed, {counts['failed']} failed). Waiting...")
+        time.sleep(interval)
+
+def process_batch_and_get_form_data(video_paths, form_type='personal_info'):
+    """Submit videos as a batch and return {video id: form data or None}"""
+    batch_id = submit_batch(video_paths, form_type)
+    if batch_id is None:
+        return None
+    
+    batch_status = wait_for_batch(batch_id)
+    for video in batch_status['videos']:
+        if video['status'] == 'failed':
+            print(f"Processing of {video['id']} failed: {video['error_message']}")
+    
+    return {video['id']: video['form_data'] for video in batch_status['videos']}
+
+if __name__ == '__main__':
+    # Example usage
+    form_data = upload_video_and_get_form_data('path/to/your/video.mp4', 'job_application')
+    print("Extracted form data:", form_data)
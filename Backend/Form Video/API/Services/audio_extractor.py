@@ -1,14 +1,67 @@
 # api/services/audio_extractor.py
+import hashlib
 import os
 import uuid
 import ffmpeg
 from django.conf import settings
 
+# Raw PCM format used for streaming: 16 kHz mono signed 16-bit little endian
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+class AudioStream:
+    """
+    Audio decoded by a running ffmpeg process, read from its stdout in
+    fixed-length chunks of raw PCM while ffmpeg is still decoding
+    """
+    
+    def __init__(self, process, chunk_seconds, audio_path=None):
+        self.process = process
+        self.chunk_bytes = int(chunk_seconds * SAMPLE_RATE) * SAMPLE_WIDTH
+        # Relative path (from MEDIA_ROOT) of the MP3 copy written alongside, if any
+        self.audio_path = audio_path
+        # Running hash of the decoded PCM, complete once the stream is exhausted
+        self._sha256 = hashlib.sha256()
+    
+    @property
+    def digest(self):
+        """SHA-256 hex digest of the PCM read so far"""
+        return self._sha256.hexdigest()
+    
+    def chunks(self):
+        """Yield PCM chunks (bytes) as they are decoded; the last one may be shorter"""
+        finished = False
+        try:
+            while True:
+                chunk = self.process.stdout.read(self.chunk_bytes)
+                if not chunk:
+                    finished = True
+                    break
+                self._sha256.update(chunk)
+                yield chunk
+        finally:
+            if finished:
+                self.close()
+            else:
+                self.abort()
+    
+    def close(self):
+        """Wait for ffmpeg to exit and raise if decoding failed"""
+        stderr = self.process.stderr.read() if self.process.stderr else b''
+        returncode = self.process.wait()
+        if returncode != 0:
+            print(f"Error extracting audio: {stderr.decode(errors='replace')}")
+            raise ffmpeg.Error('ffmpeg', None, stderr)
+    
+    def abort(self):
+        """Stop ffmpeg when the reader gives up before the end of the stream"""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
 class AudioExtractor:
     @staticmethod
-    def extract_audio(video_path):
-        """Extract audio from video file and save it"""
-        
+    def _output_path(video_path):
         # Get the filename without extension
         filename = os.path.basename(video_path).split('.')[0]
         
@@ -17,7 +70,13 @@ class AudioExtractor:
         os.makedirs(output_dir, exist_ok=True)
         
         # Generate unique output file path
-        output_path = os.path.join(output_dir, f"{filename}_{uuid.uuid4().hex}.mp3")
+        return os.path.join(output_dir, f"{filename}_{uuid.uuid4().hex}.mp3")
+    
+    @staticmethod
+    def extract_audio(video_path):
+        """Extract audio from video file and save it"""
+        
+        output_path = AudioExtractor._output_path(video_path)
         
         try:
             # Use ffmpeg to extract audio
@@ -35,3 +94,103 @@ class AudioExtractor:
         except ffmpeg.Error as e:
             print(f"Error extracting audio: {e.stderr.decode() if e.stderr else str(e)}")
             raise
+    
+    @staticmethod
+    def stream_audio(media_path, chunk_seconds=30, save_copy=True):
+        """
+        Decode the audio of a video (or audio) file to PCM on ffmpeg's stdout
+        
+        Parameters:
+        media_path (str): Absolute path to the input file
+        chunk_seconds (float): Length of the chunks yielded by the stream
+        save_copy (bool): Also write the usual MP3 to media/audio/extracted
+            from the same ffmpeg process
+        
+        Returns:
+        AudioStream: The running stream
+        """
+        source = ffmpeg.input(media_path).audio
+        outputs = [source.output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=str(SAMPLE_RATE))]
+        
+        output_path = None
+        if save_copy:
+            output_path = AudioExtractor._output_path(media_path)
+            outputs.append(source.output(output_path, acodec='libmp3lame', ac=1, ar='16000'))
+        
+        process = (
+            ffmpeg
+            .merge_outputs(*outputs)
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdout=True, pipe_stderr=True, overwrite_output=True)
+        )
+        
+        rel_path = os.path.relpath(output_path, settings.MEDIA_ROOT) if output_path else None
+        return AudioStream(process, chunk_seconds, audio_path=rel_path)
+    
+    @staticmethod
+    def read_pcm(media_path):
+        """Decode a whole file to 16 kHz mono PCM bytes"""
+        stream = AudioExtractor.stream_audio(media_path, chunk_seconds=60, save_copy=False)
+        return b''.join(stream.chunks())
+    
+    @staticmethod
+    def pcm_path(audio_path):
+        """Path of the raw PCM kept next to an extracted audio file"""
+        return os.path.splitext(audio_path)[0] + '.s16le'
+    
+    @staticmethod
+    def load_pcm(audio_path):
+        """PCM of an extracted audio file, from its kept PCM if there is one"""
+        try:
+            with open(AudioExtractor.pcm_path(audio_path), 'rb') as pcm_file:
+                return pcm_file.read()
+        except FileNotFoundError:
+            return AudioExtractor.read_pcm(audio_path)
+    
+    @staticmethod
+    def discard_pcm(audio_path):
+        """Remove the kept PCM of an extracted audio file once it is no longer needed"""
+        try:
+            os.remove(AudioExtractor.pcm_path(audio_path))
+        except FileNotFoundError:
+            pass
+    
+    @staticmethod
+    def extract_and_hash(video_path, keep_pcm=False):
+        """
+        Extract the MP3 and hash the audio in a single ffmpeg run over the video
+        
+        The hash is taken over the 16 kHz mono PCM decoded from the video, the
+        same PCM the streaming transcription path hashes, so a recording gets
+        the same audio_hash whether or not TRANSCRIPTION_STREAMING is on.
+        
+        Parameters:
+        video_path (str): Absolute path to the video file
+        keep_pcm (bool): Also write the decoded PCM next to the MP3 (see
+            load_pcm), so transcription does not decode it again
+        
+        Returns:
+        tuple: (MP3 path relative to MEDIA_ROOT, SHA-256 hex digest of the PCM)
+        """
+        stream = AudioExtractor.stream_audio(video_path, chunk_seconds=60, save_copy=True)
+        if not keep_pcm:
+            for _ in stream.chunks():
+                pass
+            return stream.audio_path, stream.digest
+        
+        pcm_path = AudioExtractor.pcm_path(os.path.join(settings.MEDIA_ROOT, stream.audio_path))
+        partial_path = pcm_path + '.part'
+        with open(partial_path, 'wb') as pcm_file:
+            for chunk in stream.chunks():
+                pcm_file.write(chunk)
+        # Only complete PCM is ever visible under pcm_path
+        os.replace(partial_path, pcm_path)
+        return stream.audio_path, stream.digest
+    
+    @staticmethod
+    def hash_audio(media_path):
+        """SHA-256 of the decoded 16 kHz mono PCM, independent of the container and codec"""
+        stream = AudioExtractor.stream_audio(media_path, chunk_seconds=60, save_copy=False)
+        for _ in stream.chunks():
+            pass
+        return stream.digest
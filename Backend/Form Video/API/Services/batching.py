@@ -0,0 +1,105 @@
+# api/services/batching.py
+# Micro-batching of inference requests coming from concurrent tasks
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .tracing import attached, current_trace
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and processes them together.
+    
+    The first pending item opens a batch window; the batch is dispatched when
+    it reaches max_batch_size or when max_wait seconds have passed, whichever
+    comes first. process_batch receives a list of items and must return one
+    result per item, in the same order. It runs attached to the stage trace
+    of the batch's first item, so a model loaded lazily by the batch shows
+    up as that stage's model_load.
+    """
+    
+    def __init__(self, process_batch, max_batch_size=8, max_wait=0.05, name='micro-batcher'):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self.name = name
+        
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'batches': 0,
+            'items': 0,
+            'max_batch_size_seen': 0,
+            'busy_seconds': 0.0,
+        }
+    
+    def submit(self, item):
+        """Queue an item and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, current_trace()))
+        return future
+    
+    def process(self, item, timeout=None):
+        """Queue an item and block until its batch has been processed"""
+        return self.submit(item).result(timeout=timeout)
+    
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['mean_batch_size'] = stats['items'] / stats['batches'] if stats['batches'] else 0.0
+        stats['pending'] = self._queue.qsize()
+        return stats
+    
+    def _ensure_worker(self):
+        # Started lazily so the thread belongs to the (forked) worker process
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+    
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Skip items whose caller has already given up
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            
+            started = time.perf_counter()
+            try:
+                with attached(batch[0][2]):
+                    results = self.process_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self.name}: got {len(results)} results for a batch of {len(batch)}"
+                    )
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            
+            with self._stats_lock:
+                self._stats['batches'] += 1
+                self._stats['items'] += len(batch)
+                self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], len(batch))
+                self._stats['busy_seconds'] += time.perf_counter() - started
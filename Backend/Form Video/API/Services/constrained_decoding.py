@@ -0,0 +1,268 @@
+# api/services/constrained_decoding.py
+# Schema-constrained JSON decoding for the form extraction model
+import re
+import torch
+
+from .prefix_cache import PromptPrefixCache
+
+NUMBER_START = re.compile(r'^\s?-?[\d.]+$')
+NUMBER_CONTINUE = re.compile(r'^[\d.]+$')
+
+
+class SchemaVocabulary:
+    """
+    Token classes of a tokenizer needed to constrain decoding: which tokens
+    can start or continue a number, end a value, or stand for a single JSON
+    delimiter. Built once per tokenizer (decoding the whole vocabulary).
+    """
+    
+    def __init__(self, tokenizer, logits_size):
+        self.texts = tokenizer.batch_decode([[token_id] for token_id in range(len(tokenizer))])
+        self.eos_token_id = tokenizer.eos_token_id
+        self.logits_size = max(logits_size, len(self.texts))
+        
+        self.number_start = self._mask(lambda text: bool(NUMBER_START.match(text)))
+        self.number_continue = self._mask(lambda text: bool(NUMBER_CONTINUE.match(text)))
+        self.value_end = self._mask(
+            lambda text: text.lstrip(' ').startswith((',', '}', '\n')) or text.startswith('\n')
+        )
+        
+        self.quote_ids = self._ids(lambda text: text.strip(' ') == '"')
+        self.null_ids = self._ids(lambda text: text.strip(' ') == 'null')
+        self.open_array_ids = self._ids(lambda text: text.strip(' ') == '[')
+        self.close_array_ids = self._ids(lambda text: text.strip(' ') == ']')
+        self.comma_ids = self._ids(lambda text: text.strip(' ') == ',')
+    
+    def _mask(self, predicate):
+        mask = torch.zeros(self.logits_size, dtype=torch.bool)
+        for token_id, text in enumerate(self.texts):
+            if text and predicate(text):
+                mask[token_id] = True
+        return mask
+    
+    def _ids(self, predicate):
+        return [token_id for token_id, text in enumerate(self.texts) if text and predicate(text)]
+
+
+class _DecodeState:
+    def __init__(self):
+        self.past_key_values = None
+        self.logits = None
+
+
+class SchemaConstrainedDecoder:
+    """
+    Fills a flat form schema by generating only the field values.
+    
+    The JSON scaffolding (braces, keys and separators) is written into the
+    context instead of being generated. For each field the model picks
+    between a value and null, then generates the value with tokens valid for
+    the field type ("string", "number" or "array" of strings) until the
+    value's closing delimiter. Decoding stops once the last field is filled,
+    so the result is always a dict with exactly the schema's keys.
+    """
+    
+    def __init__(self, model, tokenizer, vocabulary, device,
+                 max_string_tokens=64, max_number_tokens=12, max_array_items=10):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.vocabulary = vocabulary
+        self.device = device
+        self.max_string_tokens = max_string_tokens
+        self.max_number_tokens = max_number_tokens
+        self.max_array_items = max_array_items
+        self.generated_tokens = 0
+    
+    def decode(self, input_ids, form_schema, prefix_entry=None):
+        """
+        Extract the schema fields for a prompt
+        
+        Parameters:
+        input_ids (Tensor): Prompt token ids, shape [1, n]
+        form_schema (dict): Field name -> type ("string", "number", "array")
+        prefix_entry (PrefixEntry, optional): Cached prefill of the start of input_ids
+        
+        Returns:
+        dict: One value (or None) per schema field
+        """
+        self.generated_tokens = 0
+        state = _DecodeState()
+        if prefix_entry is not None:
+            state.past_key_values = PromptPrefixCache.fresh_cache(prefix_entry)
+            input_ids = input_ids[:, prefix_entry.input_ids.shape[1]:]
+        self._feed(state, input_ids)
+        
+        form_data = {}
+        fields = list(form_schema.items())
+        self._feed_text(state, '{\n')
+        for index, (field, field_type) in enumerate(fields):
+            self._feed_text(state, f'  "{field}":')
+            
+            if field_type == 'number':
+                form_data[field] = self._decode_number(state)
+            elif field_type == 'array':
+                form_data[field] = self._decode_array(state)
+            else:
+                form_data[field] = self._decode_string_or_null(state)
+            
+            # The closing brace is never needed: the object ends with the last field
+            if index < len(fields) - 1:
+                self._feed_text(state, ',\n')
+        
+        return form_data
+    
+    # Context updates
+    
+    def _feed(self, state, token_ids):
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=token_ids.to(self.device),
+                past_key_values=state.past_key_values,
+                use_cache=True
+            )
+        state.past_key_values = outputs.past_key_values
+        # Choices are made on the CPU against the precomputed vocabulary masks
+        state.logits = outputs.logits[0, -1].float().cpu()
+    
+    def _feed_text(self, state, text):
+        token_ids = self.tokenizer(text, add_special_tokens=False, return_tensors="pt").input_ids
+        self._feed(state, token_ids)
+    
+    def _feed_token(self, state, token_id):
+        self.generated_tokens += 1
+        self._feed(state, torch.tensor([[token_id]]))
+    
+    # Choices between delimiters
+    
+    def _best_of(self, state, token_ids):
+        if not token_ids:
+            return None, float('-inf')
+        scores = state.logits[token_ids]
+        best = int(torch.argmax(scores))
+        return token_ids[best], float(scores[best])
+    
+    def _choose(self, state, options):
+        """Feed the most likely token among groups of candidates, return the group name"""
+        best_name, best_token, best_score = None, None, float('-inf')
+        for name, token_ids in options.items():
+            token_id, score = self._best_of(state, token_ids)
+            if token_id is not None and score > best_score:
+                best_name, best_token, best_score = name, token_id, score
+        if best_token is not None:
+            self._feed_token(state, best_token)
+        return best_name
+    
+    # Values
+    
+    def _decode_string_or_null(self, state):
+        choice = self._choose(state, {
+            'string': self.vocabulary.quote_ids,
+            'null': self.vocabulary.null_ids,
+        })
+        if choice != 'string':
+            return None
+        value = self._decode_string_body(state).strip()
+        return value or None
+    
+    def _decode_string_body(self, state):
+        """Generate string content after an opening quote, through the closing quote"""
+        pieces = []
+        for _ in range(self.max_string_tokens):
+            logits = state.logits.clone()
+            if self.vocabulary.eos_token_id is not None:
+                logits[self.vocabulary.eos_token_id] = float('-inf')
+            token_id = int(torch.argmax(logits))
+            text = self.vocabulary.texts[token_id] if token_id < len(self.vocabulary.texts) else ''
+            
+            if '"' in text:
+                pieces.append(text.split('"', 1)[0])
+                # Keep the context clean: only the closing quote, not what followed it
+                if text == '"':
+                    self._feed_token(state, token_id)
+                else:
+                    self._feed_text(state, '"')
+                return ''.join(pieces)
+            
+            pieces.append(text)
+            self._feed_token(state, token_id)
+        
+        # Too long: close the string ourselves
+        self._feed_text(state, '"')
+        return ''.join(pieces)
+    
+    def _decode_number(self, state):
+        checkpoint = self._checkpoint(state)
+        pieces = []
+        for step in range(self.max_number_tokens):
+            allowed = self.vocabulary.number_start if step == 0 else self.vocabulary.number_continue
+            # The value can only end once it holds a digit ("-" or "." alone is not a number)
+            if any(char.isdigit() for char in ''.join(pieces)):
+                allowed = allowed | self.vocabulary.value_end
+            if step == 0:
+                allowed = allowed.clone()
+                allowed[self.vocabulary.null_ids] = True
+            
+            logits = state.logits.masked_fill(~allowed[:state.logits.shape[0]], float('-inf'))
+            token_id = int(torch.argmax(logits))
+            text = self.vocabulary.texts[token_id]
+            
+            if bool(self.vocabulary.value_end[token_id]) or text.strip() == 'null':
+                break
+            pieces.append(text)
+            self._feed_token(state, token_id)
+        
+        number = ''.join(pieces).strip()
+        try:
+            return int(number)
+        except ValueError:
+            pass
+        try:
+            return float(number)
+        except ValueError:
+            # Nothing usable was generated (e.g. "1.2." cut at the token limit):
+            # drop it from the context so later fields follow valid JSON
+            self._rollback(state, checkpoint)
+            self._feed_text(state, ' null')
+            return None
+    
+    def _checkpoint(self, state):
+        length = state.past_key_values.get_seq_length() if state.past_key_values is not None else 0
+        return length, state.logits
+    
+    def _rollback(self, state, checkpoint):
+        """Forget every token fed since the checkpoint"""
+        length, logits = checkpoint
+        extra = state.past_key_values.get_seq_length() - length
+        if extra > 0:
+            # A negative length drops that many tokens from the end
+            state.past_key_values.crop(-extra)
+        state.logits = logits
+    
+    def _decode_array(self, state):
+        choice = self._choose(state, {
+            'array': self.vocabulary.open_array_ids,
+            'null': self.vocabulary.null_ids,
+        })
+        if choice != 'array':
+            return None
+        
+        items = []
+        first = True
+        while len(items) < self.max_array_items:
+            separator = self.vocabulary.quote_ids if first else self.vocabulary.comma_ids
+            choice = self._choose(state, {
+                'item': separator,
+                'end': self.vocabulary.close_array_ids,
+            })
+            if choice != 'item':
+                return items
+            if not first:
+                self._feed_text(state, ' "')
+            first = False
+            
+            value = self._decode_string_body(state).strip()
+            if value:
+                items.append(value)
+        
+        self._feed_text(state, ']')
+        return items
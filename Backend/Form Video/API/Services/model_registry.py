@@ -0,0 +1,142 @@
+# api/services/model_registry.py
+# Process-wide registry so each model is loaded once per worker process
+import os
+import threading
+import time
+
+from .tracing import span
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def current_rss_bytes():
+    """Resident set size of the current process in bytes (0 if unknown)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    
+    if resource is not None:
+        # ru_maxrss is the peak, in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if peak > 1 << 32 else peak * 1024
+    return 0
+
+
+class ModelRegistry:
+    """
+    Keeps loaded models and tokenizers resident for the lifetime of the process.
+    
+    Services ask the registry for an entry by key and pass a loader that is
+    only called the first time the key is requested. Later calls (from any
+    service instance or task in the same process) get the same object back.
+    Models go through get(), which accounts their load time and memory;
+    other per-process singletons go through get_or_create().
+    """
+    
+    def __init__(self):
+        self._entries = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+    
+    def get(self, key, loader):
+        """
+        Return the model entry for key, loading it with loader() if needed.
+        
+        The load is timed, its resident memory recorded in stats() and its
+        time counted as a 'model_load' span of the current stage.
+        
+        Parameters:
+        key (tuple): Identifies the entry, e.g. ('llama', 'model', path)
+        loader (callable): Builds the entry when it is not resident yet
+        
+        Returns:
+        object: The resident entry
+        """
+        return self._get(key, loader, instrumented=True)
+    
+    def get_or_create(self, key, factory):
+        """
+        Return the process-wide singleton for key, creating it with factory()
+        if needed. For plain objects (clients, batchers, caches) rather than
+        models: nothing is timed, printed or counted in stats().
+        """
+        return self._get(key, factory, instrumented=False)
+    
+    def _get(self, key, loader, instrumented):
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        
+        # Only one thread loads a given key, the others wait for it
+        with key_lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+            
+            if not instrumented:
+                entry = loader()
+                self._entries[key] = entry
+                return entry
+            
+            rss_before = current_rss_bytes()
+            started = time.perf_counter()
+            # Counted as model load, not inference, in the current stage's timings
+            with span('model_load'):
+                entry = loader()
+            load_seconds = time.perf_counter() - started
+            rss_after = current_rss_bytes()
+            
+            self._stats[key] = {
+                'load_seconds': load_seconds,
+                'rss_delta_bytes': max(rss_after - rss_before, 0),
+                'rss_after_bytes': rss_after,
+                'loaded_at': time.time(),
+            }
+            self._entries[key] = entry
+        
+        print(
+            f"Loaded {self.format_key(key)} in {load_seconds:.2f}s "
+            f"(+{self._stats[key]['rss_delta_bytes'] / 1e6:.1f} MB, "
+            f"resident {rss_after / 1e6:.1f} MB)"
+        )
+        return entry
+    
+    def is_loaded(self, key):
+        return key in self._entries
+    
+    def stats(self):
+        """Load time and memory figures for every resident entry"""
+        return {
+            self.format_key(key): dict(values)
+            for key, values in self._stats.items()
+        }
+    
+    def evict(self, key):
+        """Drop an entry so the next get() reloads it"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._stats.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+    
+    @staticmethod
+    def format_key(key):
+        if isinstance(key, tuple):
+            return ':'.join(str(part) for part in key)
+        return str(key)
+
+
+# Shared by every service in this process
+model_registry = ModelRegistry()
@@ -0,0 +1,279 @@
+# api/services/pipeline_metrics.py
+# Prometheus text exposition of pipeline timings, computed from the database
+import math
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from ..models import VideoSubmission, PipelineMetric
+
+# Upper bounds (seconds) of the histogram buckets; the +Inf bucket is the
+# series' _count
+BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Quantiles of the stage durations and queue waits in the window
+QUANTILES = (0.5, 0.9, 0.99)
+
+STAGES = ('audio_extraction', 'transcription', 'translation', 'form_extraction')
+
+def _series(**labels):
+    """Prometheus label text of a series (stage="translation",le="5.0")"""
+    return ','.join(f'{key}="{value}"' for key, value in labels.items())
+
+class MetricRecorder:
+    """
+    Adds to the cumulative series stored in PipelineMetric.
+    
+    Called by the workers when a stage succeeds, fails or is re-enqueued.
+    Series rows are created on first use and then only incremented with
+    UPDATE ... SET value = value + x, so concurrent workers never lose an
+    increment. A histogram observation is one UPDATE over the buckets whose
+    bound it falls under, plus its _sum and _count.
+    """
+    
+    # Series this process knows to exist
+    _known = set()
+    _known_lock = threading.Lock()
+    
+    def _ensure(self, rows):
+        missing = [row for row in rows if (row.name, row.series) not in self._known]
+        if missing:
+            PipelineMetric.objects.bulk_create(missing, ignore_conflicts=True)
+            with self._known_lock:
+                self._known.update((row.name, row.series) for row in missing)
+    
+    def add(self, name, amount=1, stage='', **labels):
+        """Add amount to a counter (or sum) series"""
+        series = _series(stage=stage, **labels) if stage else _series(**labels)
+        self._ensure([PipelineMetric(name=name, series=series, stage=stage)])
+        PipelineMetric.objects.filter(name=name, series=series).update(value=F('value') + amount)
+    
+    def observe(self, name, stage, value):
+        """Record one observation of a per-stage histogram"""
+        self._ensure([
+            PipelineMetric(
+                name=f'{name}_bucket', series=_series(stage=stage, le=repr(float(bound))),
+                stage=stage, le=bound
+            )
+            for bound in BUCKETS
+        ])
+        PipelineMetric.objects.filter(
+            name=f'{name}_bucket', stage=stage, le__gte=value
+        ).update(value=F('value') + 1)
+        self.add(f'{name}_sum', value, stage=stage)
+        self.add(f'{name}_count', 1, stage=stage)
+    
+    def record_stage(self, trace):
+        """Duration, queue wait and spans of a successful stage attempt"""
+        with transaction.atomic():
+            self.observe('formvideo_stage_duration_seconds', trace.stage, trace.seconds)
+            if trace.queued_since is not None:
+                queue_wait = max((trace.started_at - trace.queued_since).total_seconds(), 0.0)
+                self.observe('formvideo_stage_queue_wait_seconds', trace.stage, queue_wait)
+            for name, seconds in trace.spans.items():
+                self.add('formvideo_stage_span_seconds_sum', seconds, stage=trace.stage, span=name)
+                self.add('formvideo_stage_span_seconds_count', 1, stage=trace.stage, span=name)
+    
+    def record_failure(self, stage, final):
+        """A failed stage attempt: retried, or the last one, failing the submission"""
+        if final:
+            self.add('formvideo_stage_failures_total', stage=stage)
+        else:
+            self.add('formvideo_stage_retries_total', stage=stage)
+    
+    def record_requeue(self):
+        self.add('formvideo_pipeline_requeues_total')
+
+class WindowSummary:
+    """Quantiles of the values observed in one scrape's window"""
+    
+    def __init__(self):
+        self.values = []
+    
+    def observe(self, value):
+        self.values.append(value)
+    
+    def quantile(self, q):
+        # Nearest rank; NaN when nothing was observed
+        if not self.values:
+            return math.nan
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+    
+    def lines(self, name, labels):
+        label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        for q in QUANTILES:
+            value = self.quantile(q)
+            yield f'{name}{{{label_text},quantile="{q}"}} {"NaN" if math.isnan(value) else f"{value:.6f}"}'
+
+class PipelineMetrics:
+    """
+    Metrics of the processing pipeline in the Prometheus text format.
+    
+    Workers run in other processes (and hosts), so instead of in-process
+    counters the cumulative series (duration and queue-wait histograms, span
+    sums, retries, failures and requeues) are kept in PipelineMetric by
+    MetricRecorder; they aggregate across workers and never reset, so
+    rate() and histogram_quantile() apply.
+    
+    Alongside them, formvideo_recent_* gauges give quantiles and counts over
+    the submissions updated in the last METRICS_WINDOW_SECONDS (at most
+    METRICS_MAX_SUBMISSIONS of them, newest first), computed on each scrape
+    from VideoSubmission.timings. Submission counts by status cover the
+    whole table.
+    """
+    
+    def __init__(self):
+        self.window_seconds = settings.METRICS_WINDOW_SECONDS
+        self.max_submissions = settings.METRICS_MAX_SUBMISSIONS
+    
+    def collect(self):
+        """
+        Returns:
+        dict: Cumulative series, and window summaries and totals by stage,
+        ready for render()
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.window_seconds)
+        rows = (
+            VideoSubmission.objects
+            .filter(updated_at__gte=cutoff)
+            .order_by('-updated_at')
+            .values_list('timings', 'requeue_count')[:self.max_submissions]
+        )
+        
+        durations = {stage: WindowSummary() for stage in STAGES}
+        queue_waits = {stage: WindowSummary() for stage in STAGES}
+        span_seconds = {}
+        retries = {stage: 0 for stage in STAGES}
+        requeues = 0
+        
+        for timings, requeue_count in rows:
+            requeues += requeue_count
+            for stage, entry in (timings or {}).items():
+                if stage not in durations:
+                    continue
+                durations[stage].observe(entry['seconds'])
+                if entry.get('queue_wait_seconds') is not None:
+                    queue_waits[stage].observe(entry['queue_wait_seconds'])
+                # Attempts before the one that succeeded
+                retries[stage] += max(entry.get('attempt', 1) - 1, 0)
+                for name, seconds in entry.get('spans', {}).items():
+                    totals = span_seconds.setdefault((stage, name), [0.0, 0])
+                    totals[0] += seconds
+                    totals[1] += 1
+        
+        statuses = dict(
+            VideoSubmission.objects.order_by().values_list('status').annotate(count=Count('id'))
+        )
+        cumulative = {
+            (name, series): value
+            for name, series, value in PipelineMetric.objects.values_list('name', 'series', 'value')
+        }
+        return {
+            'cumulative': cumulative,
+            'durations': durations,
+            'queue_waits': queue_waits,
+            'span_seconds': span_seconds,
+            'retries': retries,
+            'requeues': requeues,
+            'statuses': statuses,
+        }
+    
+    def render(self):
+        """The metrics as a Prometheus text exposition (version 0.0.4)"""
+        metrics = self.collect()
+        totals = metrics['cumulative']
+        lines = []
+        
+        lines.append('# HELP formvideo_stage_duration_seconds Duration of successful pipeline stage attempts.')
+        lines.append('# TYPE formvideo_stage_duration_seconds histogram')
+        for stage in STAGES:
+            lines.extend(self._histogram_lines(totals, 'formvideo_stage_duration_seconds', stage))
+        
+        lines.append('# HELP formvideo_stage_queue_wait_seconds Time from enqueue to the start of a stage.')
+        lines.append('# TYPE formvideo_stage_queue_wait_seconds histogram')
+        for stage in STAGES:
+            lines.extend(self._histogram_lines(totals, 'formvideo_stage_queue_wait_seconds', stage))
+        
+        lines.append('# HELP formvideo_stage_span_seconds Time spent in spans (model_load, inference, ffmpeg, ...) of successful stage attempts.')
+        lines.append('# TYPE formvideo_stage_span_seconds summary')
+        for (name, series), value in sorted(totals.items()):
+            if name == 'formvideo_stage_span_seconds_sum':
+                lines.append(f'{name}{{{series}}} {value:.6f}')
+                lines.append(f'formvideo_stage_span_seconds_count{{{series}}} {int(totals.get(("formvideo_stage_span_seconds_count", series), 0))}')
+        
+        lines.append('# HELP formvideo_stage_retries_total Failed stage attempts that were retried.')
+        lines.append('# TYPE formvideo_stage_retries_total counter')
+        for stage in STAGES:
+            lines.append(f'formvideo_stage_retries_total{{stage="{stage}"}} {self._count(totals, "formvideo_stage_retries_total", stage)}')
+        
+        lines.append('# HELP formvideo_stage_failures_total Last attempts of stages that failed, failing the submission.')
+        lines.append('# TYPE formvideo_stage_failures_total counter')
+        for stage in STAGES:
+            lines.append(f'formvideo_stage_failures_total{{stage="{stage}"}} {self._count(totals, "formvideo_stage_failures_total", stage)}')
+        
+        lines.append('# HELP formvideo_pipeline_requeues_total Pipelines re-enqueued by the stuck submission sweeper.')
+        lines.append('# TYPE formvideo_pipeline_requeues_total counter')
+        lines.append(f"formvideo_pipeline_requeues_total {int(totals.get(('formvideo_pipeline_requeues_total', ''), 0))}")
+        
+        window = f'{self.window_seconds}s'
+        
+        lines.append(f'# HELP formvideo_recent_stage_duration_seconds Duration of successful stage attempts of submissions updated in the last {window}.')
+        lines.append('# TYPE formvideo_recent_stage_duration_seconds gauge')
+        for stage, summary in metrics['durations'].items():
+            lines.extend(summary.lines('formvideo_recent_stage_duration_seconds', {'stage': stage}))
+        
+        lines.append(f'# HELP formvideo_recent_stage_completions Successful stage attempts of submissions updated in the last {window}.')
+        lines.append('# TYPE formvideo_recent_stage_completions gauge')
+        for stage, summary in metrics['durations'].items():
+            lines.append(f'formvideo_recent_stage_completions{{stage="{stage}"}} {len(summary.values)}')
+        
+        lines.append(f'# HELP formvideo_recent_stage_queue_wait_seconds Time from enqueue to the start of a stage, for submissions updated in the last {window}.')
+        lines.append('# TYPE formvideo_recent_stage_queue_wait_seconds gauge')
+        for stage, summary in metrics['queue_waits'].items():
+            lines.extend(summary.lines('formvideo_recent_stage_queue_wait_seconds', {'stage': stage}))
+        
+        lines.append(f'# HELP formvideo_recent_stage_span_seconds Time spent in spans (model_load, inference, ffmpeg, ...) of stages of submissions updated in the last {window}.')
+        lines.append('# TYPE formvideo_recent_stage_span_seconds gauge')
+        for (stage, name), (total, _) in sorted(metrics['span_seconds'].items()):
+            lines.append(f'formvideo_recent_stage_span_seconds{{stage="{stage}",span="{name}"}} {total:.6f}')
+        
+        lines.append(f'# HELP formvideo_recent_stage_spans Spans (model_load, inference, ffmpeg, ...) entered by stages of submissions updated in the last {window}.')
+        lines.append('# TYPE formvideo_recent_stage_spans gauge')
+        for (stage, name), (_, count) in sorted(metrics['span_seconds'].items()):
+            lines.append(f'formvideo_recent_stage_spans{{stage="{stage}",span="{name}"}} {count}')
+        
+        lines.append(f'# HELP formvideo_recent_stage_retries Failed attempts of stages that later succeeded, for submissions updated in the last {window}.')
+        lines.append('# TYPE formvideo_recent_stage_retries gauge')
+        for stage, count in metrics['retries'].items():
+            lines.append(f'formvideo_recent_stage_retries{{stage="{stage}"}} {count}')
+        
+        lines.append(f'# HELP formvideo_recent_pipeline_requeues Sweeper re-enqueues of submissions updated in the last {window}.')
+        lines.append('# TYPE formvideo_recent_pipeline_requeues gauge')
+        lines.append(f"formvideo_recent_pipeline_requeues {metrics['requeues']}")
+        
+        lines.append('# HELP formvideo_submissions Submissions by status.')
+        lines.append('# TYPE formvideo_submissions gauge')
+        for status, _ in VideoSubmission.STATUS_CHOICES:
+            lines.append(f'formvideo_submissions{{status="{status}"}} {metrics["statuses"].get(status, 0)}')
+        
+        return '\n'.join(lines) + '\n'
+    
+    @staticmethod
+    def _count(totals, name, stage):
+        return int(totals.get((name, _series(stage=stage)), 0))
+    
+    @staticmethod
+    def _histogram_lines(totals, name, stage):
+        # Buckets are stored cumulative; +Inf is every observation
+        for bound in BUCKETS:
+            series = _series(stage=stage, le=repr(float(bound)))
+            yield f'{name}_bucket{{{series}}} {int(totals.get((f"{name}_bucket", series), 0))}'
+        count = int(totals.get((f'{name}_count', _series(stage=stage)), 0))
+        yield f'{name}_bucket{{{_series(stage=stage, le="+Inf")}}} {count}'
+        yield f'{name}_sum{{{_series(stage=stage)}}} {totals.get((f"{name}_sum", _series(stage=stage)), 0.0):.6f}'
+        yield f'{name}_count{{{_series(stage=stage)}}} {count}'
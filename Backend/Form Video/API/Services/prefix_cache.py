@@ -0,0 +1,75 @@
+# api/services/prefix_cache.py
+# Reuse of the attention cache for the static part of a prompt
+import copy
+import threading
+from collections import OrderedDict, namedtuple
+
+import torch
+
+# input_ids: prefix token ids, shape [1, n]
+# past_key_values: model cache after prefilling those n tokens
+PrefixEntry = namedtuple('PrefixEntry', ['input_ids', 'past_key_values'])
+
+
+class PromptPrefixCache:
+    """
+    LRU cache of prefilled past-key-values for prompt prefixes.
+    
+    Requests that share a prefix (the instructions and form schema) only need
+    to prefill their own suffix (the transcript); the prefix cache entry is
+    copied for each request because generation extends it in place.
+    """
+    
+    def __init__(self, max_entries=16):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, model, tokenizer, prefix, device):
+        """
+        Return the PrefixEntry for key, prefilling the prefix on a miss
+        
+        Parameters:
+        key (tuple): Identifies the prefix, e.g. (model_name, form_type, fingerprint)
+        model: Causal LM used to prefill the prefix
+        tokenizer: Tokenizer matching the model
+        prefix (str): The static prompt text
+        device (str): Device the prefix ids are placed on
+        
+        Returns:
+        PrefixEntry: The cached prefix ids and past-key-values
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        input_ids = tokenizer(prefix, return_tensors="pt").input_ids.to(device)
+        with torch.no_grad():
+            outputs = model(input_ids=input_ids, use_cache=True)
+        entry = PrefixEntry(input_ids, outputs.past_key_values)
+        
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+    
+    @staticmethod
+    def fresh_cache(entry):
+        """A private copy of the entry's cache that generation may extend"""
+        return copy.deepcopy(entry.past_key_values)
+    
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
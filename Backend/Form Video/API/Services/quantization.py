@@ -0,0 +1,71 @@
+# api/services/quantization.py
+# Numeric precision of the transformer models, chosen per deployment
+import torch
+from django.conf import settings
+
+# 'auto' is fp16 on a GPU and fp32 on CPU; 'int8' is dynamic quantization of
+# the linear layers, which only runs on CPU
+PRECISIONS = ('auto', 'fp32', 'fp16', 'bf16', 'int8')
+
+DTYPES = {
+    'fp32': torch.float32,
+    'fp16': torch.float16,
+    'bf16': torch.bfloat16,
+}
+
+def resolve_precision(precision, device):
+    """
+    Turn a configured precision into the one actually used on device
+    
+    Parameters:
+    precision (str): One of PRECISIONS
+    device (str): 'cuda' or 'cpu'
+    
+    Returns:
+    str: 'fp32', 'fp16', 'bf16' or 'int8'
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown model precision {precision!r}, expected one of {', '.join(PRECISIONS)}")
+    if precision == 'auto':
+        # Half precision matmuls are slow (or unsupported) on most CPUs
+        return 'fp16' if device == 'cuda' else 'fp32'
+    return precision
+
+def device_for(precision, device):
+    """Device a model of this (resolved) precision runs on"""
+    return 'cpu' if precision == 'int8' else device
+
+def quantize_dynamic_int8(model):
+    """
+    Quantize the weights of every nn.Linear (attention, MLP and output
+    projections) to int8; activations are quantized on the fly per batch
+    """
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_pretrained(model_class, model_name, precision, device):
+    """
+    Load a model in the given (resolved) precision
+    
+    Parameters:
+    model_class: transformers auto class, e.g. AutoModelForCausalLM
+    model_name (str): Model path or hub id
+    precision (str): 'fp32', 'fp16', 'bf16' or 'int8'
+    device (str): 'cuda' or 'cpu'; int8 models always run on CPU
+    
+    Returns:
+    The model, in eval mode
+    """
+    if device_for(precision, device) == 'cpu' and settings.INFERENCE_CPU_THREADS:
+        torch.set_num_threads(settings.INFERENCE_CPU_THREADS)
+    
+    if precision == 'int8':
+        # Quantization starts from the fp32 weights
+        model = model_class.from_pretrained(model_name, torch_dtype=torch.float32)
+        return quantize_dynamic_int8(model)
+    
+    if device == 'cuda':
+        model = model_class.from_pretrained(model_name, torch_dtype=DTYPES[precision], device_map="auto")
+    else:
+        model = model_class.from_pretrained(model_name, torch_dtype=DTYPES[precision]).to(device)
+    return model.eval()
@@ -0,0 +1,192 @@
+# api/services/result_cache.py
+# Content-addressed reuse of finished results for duplicate media
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from ..models import VideoSubmission, Transcription, FormData, ResultCacheEntry
+
+def hash_uploaded_file(uploaded_file):
+    """SHA-256 of an uploaded file, read in chunks; the file is rewound afterwards"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Index from media content hashes to the submission that produced results
+    for them.
+    
+    Entries are keyed by (kind, content_hash, form_type), where kind is
+    'video' (hash of the uploaded bytes) or 'audio' (hash of the decoded PCM,
+    which also matches re-encoded or re-muxed copies of the same recording).
+    Entries expire RESULT_CACHE_TTL_SECONDS after they were stored; past
+    RESULT_CACHE_MAX_ENTRIES the least recently used ones are evicted.
+    """
+    
+    def __init__(self):
+        self.enabled = settings.RESULT_CACHE_ENABLED
+        self.ttl = timedelta(seconds=settings.RESULT_CACHE_TTL_SECONDS)
+        self.max_entries = settings.RESULT_CACHE_MAX_ENTRIES
+    
+    def _live_entries(self):
+        return ResultCacheEntry.objects.filter(created_at__gte=timezone.now() - self.ttl)
+    
+    def lookup(self, kind, content_hash, form_type):
+        """
+        Find a live entry whose source submission still has its results
+        
+        Returns:
+        ResultCacheEntry or None
+        """
+        if not self.enabled or not content_hash:
+            return None
+        
+        entry = (
+            self._live_entries()
+            .select_related('source')
+            .filter(kind=kind, content_hash=content_hash, form_type=form_type)
+            .first()
+        )
+        if entry is None:
+            return None
+        
+        source = entry.source
+        if source.status != VideoSubmission.STATUS_COMPLETED or not FormData.objects.filter(video=source).exists():
+            # The results it pointed to are gone
+            entry.delete()
+            return None
+        
+        ResultCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+        return entry
+    
+    def lookup_many(self, kind, keys):
+        """
+        lookup() for many (content_hash, form_type) pairs in one query
+        
+        Returns:
+        dict: (content_hash, form_type) -> ResultCacheEntry, for the hits only
+        """
+        keys = {(content_hash, form_type) for content_hash, form_type in keys if content_hash}
+        if not self.enabled or not keys:
+            return {}
+        
+        candidates = (
+            self._live_entries()
+            .select_related('source', 'source__form_data')
+            .filter(kind=kind, content_hash__in={content_hash for content_hash, _ in keys})
+        )
+        entries = {}
+        for entry in candidates:
+            key = (entry.content_hash, entry.form_type)
+            source = entry.source
+            if key in keys and source.status == VideoSubmission.STATUS_COMPLETED and hasattr(source, 'form_data'):
+                entries[key] = entry
+        
+        if entries:
+            ResultCacheEntry.objects.filter(pk__in=[entry.pk for entry in entries.values()]).update(
+                hits=F('hits') + 1, last_used_at=timezone.now()
+            )
+        return entries
+    
+    def store(self, video_submission):
+        """Index a completed submission under its video and audio hashes"""
+        if not self.enabled:
+            return
+        
+        hashes = [
+            (ResultCacheEntry.KIND_VIDEO, video_submission.content_hash),
+            (ResultCacheEntry.KIND_AUDIO, video_submission.audio_hash),
+        ]
+        now = timezone.now()
+        for kind, content_hash in hashes:
+            if not content_hash:
+                continue
+            # A re-stored entry keeps the hits it already counted
+            ResultCacheEntry.objects.update_or_create(
+                kind=kind,
+                content_hash=content_hash,
+                form_type=video_submission.form_type,
+                defaults={'source': video_submission, 'created_at': now, 'last_used_at': now}
+            )
+        
+        self.evict()
+    
+    def evict(self):
+        """Delete expired entries, then the least recently used ones over the limit"""
+        expired, _ = ResultCacheEntry.objects.filter(created_at__lt=timezone.now() - self.ttl).delete()
+        
+        overflow = 0
+        count = ResultCacheEntry.objects.count()
+        if count > self.max_entries:
+            stale = ResultCacheEntry.objects.order_by('last_used_at').values_list('pk', flat=True)[:count - self.max_entries]
+            overflow, _ = ResultCacheEntry.objects.filter(pk__in=list(stale)).delete()
+        return expired + overflow
+    
+    @staticmethod
+    def apply(entry, video_submission, copy_transcription=True):
+        """
+        Complete a submission with a copy of the results of the entry's source
+        
+        Parameters:
+        entry (ResultCacheEntry): Entry returned by lookup()
+        video_submission (VideoSubmission): The duplicate submission
+        copy_transcription (bool): Also copy the transcript and its
+            translation (False when the submission already transcribed its
+            own audio, which the source's translation may not match)
+        """
+        source = entry.source
+        update_fields = ['cache_hit', 'cached_from', 'stage', 'status', 'updated_at']
+        with transaction.atomic():
+            if copy_transcription and hasattr(source, 'transcription'):
+                Transcription.objects.update_or_create(
+                    video=video_submission,
+                    defaults={
+                        'text': source.transcription.text,
+                        'language': source.transcription.language,
+                        'segments': source.transcription.segments,
+                    }
+                )
+            FormData.objects.update_or_create(
+                video=video_submission,
+                defaults={'json_data': source.form_data.json_data}
+            )
+            
+            if copy_transcription:
+                video_submission.translated_text = source.translated_text
+                update_fields.append('translated_text')
+            video_submission.cache_hit = entry.kind
+            video_submission.cached_from = source
+            video_submission.stage = VideoSubmission.STAGE_FORM_EXTRACTED
+            video_submission.status = VideoSubmission.STATUS_COMPLETED
+            video_submission.save(update_fields=update_fields)
+    
+    def stats(self):
+        """Entry counts and hit rates over the submissions of the last TTL window"""
+        since = timezone.now() - self.ttl
+        submissions = VideoSubmission.objects.filter(created_at__gte=since).aggregate(
+            total=Count('id'),
+            video_hits=Count('id', filter=Q(cache_hit=ResultCacheEntry.KIND_VIDEO)),
+            audio_hits=Count('id', filter=Q(cache_hit=ResultCacheEntry.KIND_AUDIO)),
+        )
+        entries = ResultCacheEntry.objects.aggregate(entries=Count('id'), hits=Sum('hits'))
+        
+        total = submissions['total']
+        hits = submissions['video_hits'] + submissions['audio_hits']
+        return {
+            'enabled': self.enabled,
+            'ttl_seconds': int(self.ttl.total_seconds()),
+            'max_entries': self.max_entries,
+            'entries': entries['entries'],
+            'entry_hits': entries['hits'] or 0,
+            'submissions': total,
+            'video_hits': submissions['video_hits'],
+            'audio_hits': submissions['audio_hits'],
+            'hit_rate': hits / total if total else 0.0,
+        }
@@ -0,0 +1,110 @@
+# api/services/rule_extraction.py
+# Rule-based first tier of form extraction: regular expressions for fields
+# that are stated in predictable phrasing
+import re
+
+MONTHS = (
+    r'(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+    r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)'
+)
+DATE = (
+    rf'(?:\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?{MONTHS},?\s+\d{{4}}'
+    rf'|{MONTHS}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}'
+    r'|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})'
+)
+
+EMAIL = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}')
+
+# Indian mobile numbers, optionally with a +91 / 0 prefix and spaced or dashed
+PHONE = re.compile(r'(?<![\d+])(?:(?:\+|plus\s*)?91[\s-]?|0)?([6-9]\d{2}[\s-]?\d{2}[\s-]?\d{5}|[6-9]\d{4}[\s-]?\d{5})(?!\d)', re.IGNORECASE)
+
+# A name is one to four capitalized words after an explicit "my name is";
+# "I am ..." / "this is ..." are as often followed by a nationality, an
+# employer or a place, so those are left to the model
+NAME = re.compile(
+    r"\b(?i:my\s+(?:full\s+)?name\s+is|my\s+name's)\s+"
+    r"((?:[A-Z][a-z]+)(?:\s+[A-Z][a-z]+){0,3})\b"
+)
+
+DATE_OF_BIRTH = re.compile(
+    rf'\b(?:born\s+on|date\s+of\s+birth\s+is|date\s+of\s+birth:?|birth\s+date\s+is|dob\s+is|birthday\s+is)\s+({DATE})',
+    re.IGNORECASE
+)
+
+GENDER = re.compile(
+    r"\b(?:i\s+am|i'm|gender\s+is|gender:?|sex\s+is)\s+(?:an?\s+)?(male|female|man|woman|non-binary)\b",
+    re.IGNORECASE
+)
+GENDER_VALUES = {'man': 'male', 'woman': 'female'}
+
+def extract_email(transcript):
+    match = EMAIL.search(transcript)
+    return match.group(0) if match else None
+
+def extract_phone(transcript):
+    match = PHONE.search(transcript)
+    if not match:
+        return None
+    # The 10 digits, without spacing or country prefix
+    return re.sub(r'\D', '', match.group(1))
+
+def extract_name(transcript):
+    match = NAME.search(transcript)
+    return match.group(1) if match else None
+
+def extract_date_of_birth(transcript):
+    match = DATE_OF_BIRTH.search(transcript)
+    return match.group(1) if match else None
+
+def extract_gender(transcript):
+    match = GENDER.search(transcript)
+    if not match:
+        return None
+    value = match.group(1).lower()
+    return GENDER_VALUES.get(value, value)
+
+# Field name (as used in forms_schema) -> rule; the rule returns None when
+# the transcript does not state the field in a form it recognizes
+FIELD_RULES = {
+    'email': extract_email,
+    'phone': extract_phone,
+    'name': extract_name,
+    'date_of_birth': extract_date_of_birth,
+    'gender': extract_gender,
+}
+
+class RuleExtractor:
+    """
+    Fills the fields of a form schema that the rules recognize.
+    
+    Only string fields with a rule in FIELD_RULES are tried; everything else
+    (and every field a rule did not find) is left to the language model.
+    """
+    
+    def __init__(self, rules=None):
+        self.rules = FIELD_RULES if rules is None else rules
+    
+    def extract(self, transcript, form_schema):
+        """
+        Run the rules for the fields of form_schema
+        
+        Parameters:
+        transcript (str): The transcript text
+        form_schema (dict): Field name -> type
+        
+        Returns:
+        dict: The fields found, field name -> value
+        """
+        found = {}
+        for field, field_type in form_schema.items():
+            rule = self.rules.get(field)
+            if rule is None or field_type != 'string':
+                continue
+            try:
+                value = rule(transcript)
+            except Exception as e:
+                print(f"Rule for {field} failed: {e}")
+                continue
+            if value:
+                found[field] = value
+        return found
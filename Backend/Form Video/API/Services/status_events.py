@@ -0,0 +1,132 @@
+# api/services/status_events.py
+# Push delivery of submission status changes over Redis pub/sub
+import json
+import time
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .model_registry import model_registry
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+def status_payload(video_submission, form_data=None):
+    """
+    Status of a submission as returned by the status endpoint
+    
+    Parameters:
+    video_submission (VideoSubmission): The submission
+    form_data (dict, optional): Extracted form data, once available
+    
+    Returns:
+    dict: JSON-serializable status
+    """
+    return {
+        'id': video_submission.id,
+        'status': video_submission.status,
+        'stage': video_submission.stage,
+        'created_at': video_submission.created_at,
+        'updated_at': video_submission.updated_at,
+        'error_message': video_submission.error_message,
+        'form_data_available': form_data is not None,
+        'form_data': form_data
+    }
+
+class StatusEventBus:
+    """
+    Publishes status events per submission and lets API views wait for them.
+    
+    Each event is published on the submission's channel and also kept as the
+    submission's latest event (for STATUS_EVENTS_TTL_SECONDS), so a client
+    that connects late, or between two long-poll requests, gets the current
+    state from Redis instead of the database. Events carry an increasing
+    event_id per submission.
+    """
+    
+    def __init__(self, url=None):
+        self.url = url or settings.STATUS_EVENTS_REDIS_URL
+        self.ttl = settings.STATUS_EVENTS_TTL_SECONDS
+    
+    @property
+    def client(self):
+        import redis
+        # One connection pool per process
+        return model_registry.get_or_create(('redis', self.url), lambda: redis.Redis.from_url(self.url))
+    
+    @staticmethod
+    def _channel(video_id):
+        return f"video-status:{video_id}"
+    
+    @staticmethod
+    def _last_key(video_id):
+        return f"video-status:last:{video_id}"
+    
+    @staticmethod
+    def _counter_key(video_id):
+        return f"video-status:seq:{video_id}"
+    
+    def publish(self, video_id, payload):
+        """Publish a status payload, returning it with its event_id"""
+        event_id = self.client.incr(self._counter_key(video_id))
+        event = dict(payload, event_id=event_id)
+        data = json.dumps(event, cls=JSONEncoder)
+        
+        pipe = self.client.pipeline()
+        pipe.set(self._last_key(video_id), data, ex=self.ttl)
+        pipe.expire(self._counter_key(video_id), self.ttl)
+        pipe.publish(self._channel(video_id), data)
+        pipe.execute()
+        return event
+    
+    def last(self, video_id):
+        """The latest event of a submission, or None if none is retained"""
+        data = self.client.get(self._last_key(video_id))
+        return json.loads(data) if data else None
+    
+    def listen(self, video_id, after=0, timeout=None, heartbeat=None):
+        """
+        Yield events of a submission newer than event_id `after`
+        
+        Stops after a completed or failed event, or once timeout seconds have
+        passed. With heartbeat, yields None every heartbeat seconds without
+        events (so SSE responses can keep the connection alive).
+        
+        Parameters:
+        video_id: Submission id
+        after (int): Last event_id the caller has seen
+        timeout (float, optional): Maximum seconds to listen
+        heartbeat (float, optional): Seconds between keep-alive Nones
+        """
+        timeout = settings.STATUS_EVENTS_STREAM_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self._channel(video_id))
+        try:
+            # Subscribed first, so nothing published from here on is missed
+            last = self.last(video_id)
+            if last is not None and last['event_id'] > after:
+                after = last['event_id']
+                yield last
+                if last['status'] in TERMINAL_STATUSES:
+                    return
+            
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                wait = min(remaining, heartbeat) if heartbeat else remaining
+                message = pubsub.get_message(timeout=wait)
+                if message is None:
+                    if heartbeat:
+                        yield None
+                    continue
+                
+                event = json.loads(message['data'])
+                if event['event_id'] <= after:
+                    continue
+                after = event['event_id']
+                yield event
+                if event['status'] in TERMINAL_STATUSES:
+                    return
+        finally:
+            pubsub.close()
@@ -2,13 +2,52 @@
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 import json
+import hashlib
 from django.conf import settings
+from .model_registry import model_registry
+from .quantization import resolve_precision, device_for, load_pretrained
+from .batching import MicroBatcher
+from .prefix_cache import PromptPrefixCache
+from .constrained_decoding import SchemaConstrainedDecoder, SchemaVocabulary
+from .rule_extraction import RuleExtractor
+
+# Used when extract_form_data is called without a schema
+DEFAULT_FORM_SCHEMA = {
+    "name": "string",
+    "email": "string",
+    "phone": "string",
+    "address": "string",
+    "reason_for_application": "string",
+    "additional_notes": "string"
+}
 
 class LlamaAnalysisService:
     def __init__(self):
         # Load the Llama 3.2 model and tokenizer
         self.model_name = settings.LLAMA_MODEL_PATH
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        
+        # fp16 on GPU, fp32 or int8 (dynamic quantization) on CPU nodes
+        self.precision = resolve_precision(settings.LLAMA_PRECISION, device)
+        self.device = device_for(self.precision, device)
+        self.max_new_tokens = settings.LLAMA_MAX_NEW_TOKENS
+        
+        # Batch prompts from concurrent tasks in this worker process
+        self.batching_enabled = settings.LLAMA_BATCHING_ENABLED
+        
+        # Reuse the prefilled instructions + schema part of the prompt
+        self.prefix_cache_enabled = settings.LLAMA_PREFIX_CACHE_ENABLED
+        
+        # 'free' generates text and scrapes the JSON out of it, 'constrained'
+        # only generates the field values of the schema
+        self.decoding_mode = settings.LLAMA_DECODING_MODE
+        
+        # Regex rules fill the fields they recognize before the model is prompted
+        self.rules_enabled = settings.FORM_RULES_ENABLED
+        
+        # Speculative decoding of single prompts: 'off', 'prompt_lookup' or 'draft_model'
+        self.assisted_decoding = settings.LLAMA_ASSISTED_DECODING
+        self.draft_model_name = settings.LLAMA_DRAFT_MODEL_PATH
         
         # Initialize the model and tokenizer (lazy loading)
         self._model = None
@@ -17,87 +56,307 @@ class LlamaAnalysisService:
     @property
     def model(self):
         if self._model is None:
-            self._model = AutoModelForCausalLM.from_pretrained(
-                self.model_name, 
-                torch_dtype=torch.float16,
-                device_map="auto"
+            # Shared with every other service instance in this worker process
+            self._model = model_registry.get(
+                ('llama', 'model', self.model_name, self.precision),
+                lambda: load_pretrained(AutoModelForCausalLM, self.model_name, self.precision, self.device)
             )
         return self._model
     
+    @property
+    def draft_model(self):
+        """Small model proposing tokens for assisted decoding, loaded once per process"""
+        return model_registry.get(
+            ('llama', 'draft-model', self.draft_model_name, self.precision),
+            lambda: load_pretrained(AutoModelForCausalLM, self.draft_model_name, self.precision, self.device)
+        )
+    
     @property
     def tokenizer(self):
         if self._tokenizer is None:
-            self._tokenizer = AutoTokenizer.from_pretrained(
-                self.model_name
+            self._tokenizer = model_registry.get(
+                ('llama', 'tokenizer', self.model_name),
+                self._load_tokenizer
             )
         return self._tokenizer
     
-    def extract_form_data(self, transcript, form_schema=None):
+    def _load_tokenizer(self):
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        # Batched prompts are left padded so every prompt ends where generation starts
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        return tokenizer
+    
+    @property
+    def batcher(self):
+        """Per-process micro-batcher shared by all service instances"""
+        return model_registry.get_or_create(
+            ('llama', 'batcher', self.model_name),
+            lambda: MicroBatcher(
+                self.generate_batch,
+                max_batch_size=settings.LLAMA_BATCH_MAX_SIZE,
+                max_wait=settings.LLAMA_BATCH_MAX_WAIT_MS / 1000,
+                name='llama-batcher'
+            )
+        )
+    
+    @property
+    def prefix_cache(self):
+        """Per-process prompt prefix cache shared by all service instances"""
+        return model_registry.get_or_create(
+            ('llama', 'prefix-cache', self.model_name),
+            lambda: PromptPrefixCache(max_entries=settings.LLAMA_PREFIX_CACHE_SIZE)
+        )
+    
+    @property
+    def schema_vocabulary(self):
+        """Token classes used by constrained decoding, built once per process"""
+        return model_registry.get_or_create(
+            ('llama', 'schema-vocabulary', self.model_name),
+            lambda: SchemaVocabulary(
+                self.tokenizer,
+                # out_features: quantized layers do not expose .weight as a tensor
+                self.model.get_output_embeddings().out_features
+            )
+        )
+    
+    def warm_up(self):
+        """Load the model and tokenizer now instead of on the first request"""
+        if self.assisted_decoding == 'draft_model':
+            return self.model, self.tokenizer, self.draft_model
+        return self.model, self.tokenizer
+    
+    def assisted_generation_kwargs(self):
+        """
+        Extra generate() arguments for assisted decoding of a single prompt
+        
+        Greedy verification keeps the output identical to plain decoding;
+        only the number of full-model forward passes changes.
+        """
+        if self.assisted_decoding == 'prompt_lookup':
+            return {'prompt_lookup_num_tokens': settings.LLAMA_PROMPT_LOOKUP_TOKENS}
+        if self.assisted_decoding == 'draft_model':
+            if not self.draft_model_name:
+                raise ValueError("LLAMA_ASSISTED_DECODING is 'draft_model' but LLAMA_DRAFT_MODEL_PATH is not set")
+            return {'assistant_model': self.draft_model}
+        return {}
+    
+    def build_prompt_parts(self, transcript, form_schema, fields=None):
+        """
+        Split the extraction prompt into its static prefix (instructions and
+        schema, identical for every transcript of a form type) and the suffix
+        that carries the transcript
+        
+        fields limits the request to some of the schema's fields. They are
+        named in the suffix so the prefix (and its cache entry) stays the
+        same whichever fields the rules already filled.
+        """
+        schema_json = json.dumps(form_schema, indent=2)
+        prefix = f"""
+            You are a form-filling assistant. Extract the following information from this transcript and format it as JSON:
+            
+            Form Fields: {schema_json}
+            
+            Transcript: \""""
+        if fields is None:
+            request = "Please extract all the information according to the provided schema and return ONLY a valid JSON object with the extracted data."
+        else:
+            request = f"Please extract only these fields of the provided schema: {json.dumps(list(fields))}, and return ONLY a valid JSON object with exactly these fields."
+        suffix = f"""{transcript}"
+            
+            {request} If a field is not found in the transcript, leave it empty or null.
+            """
+        return prefix, suffix
+    
+    def build_prompt(self, transcript, form_schema, fields=None):
+        """Build the extraction prompt for a transcript"""
+        prefix, suffix = self.build_prompt_parts(transcript, form_schema, fields)
+        return prefix + suffix
+    
+    def get_prefix(self, prefix, form_type=None):
+        """Cached prefill of a prompt prefix, keyed on (model, form type, prefix text)"""
+        fingerprint = hashlib.sha1(prefix.encode('utf-8')).hexdigest()
+        return self.prefix_cache.get(
+            (self.model_name, form_type, fingerprint),
+            self.model, self.tokenizer, prefix, self.device
+        )
+    
+    def generate_with_prefix(self, prefix, suffix, form_type=None):
+        """
+        Generate a completion for prefix + suffix, prefilling only the suffix
+        tokens on top of the cached prefix
+        """
+        entry = self.get_prefix(prefix, form_type)
+        suffix_ids = self.tokenizer(
+            suffix, add_special_tokens=False, return_tensors="pt"
+        ).input_ids.to(self.device)
+        input_ids = torch.cat([entry.input_ids, suffix_ids], dim=1)
+        
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=PromptPrefixCache.fresh_cache(entry),
+                max_new_tokens=self.max_new_tokens,
+                temperature=0.1,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **self.assisted_generation_kwargs()
+            )
+        
+        new_tokens = outputs[0, input_ids.shape[1]:]
+        return self.tokenizer.decode(new_tokens, skip_special_tokens=True)
+    
+    def generate(self, prompt):
+        """Generate a completion for a single prompt, without the echoed prompt"""
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=self.max_new_tokens,
+                temperature=0.1,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **self.assisted_generation_kwargs()
+            )
+        
+        new_tokens = outputs[0, inputs["input_ids"].shape[1]:]
+        return self.tokenizer.decode(new_tokens, skip_special_tokens=True)
+    
+    def generate_batch(self, prompts):
+        """
+        Generate completions for several prompts in one padded forward pass
+        
+        Parameters:
+        prompts (list): Prompt strings
+        
+        Returns:
+        list: One completion per prompt, in the same order
+        """
+        if len(prompts) == 1:
+            return [self.generate(prompts[0])]
+        
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=self.max_new_tokens,
+                temperature=0.1,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+        
+        # With left padding all prompts end at the same position
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+    
+    def extract_constrained(self, prefix, suffix, form_schema, form_type=None):
+        """
+        Extract the form fields with schema-constrained decoding
+        
+        Only the field values are generated and decoding stops as soon as the
+        last field is filled, so the result is always a valid dict with
+        exactly the schema's keys.
+        """
+        decoder = SchemaConstrainedDecoder(
+            self.model, self.tokenizer, self.schema_vocabulary, self.device
+        )
+        
+        if self.prefix_cache_enabled:
+            entry = self.get_prefix(prefix, form_type)
+            suffix_ids = self.tokenizer(
+                suffix, add_special_tokens=False, return_tensors="pt"
+            ).input_ids.to(self.device)
+            input_ids = torch.cat([entry.input_ids, suffix_ids], dim=1)
+            return decoder.decode(input_ids, form_schema, prefix_entry=entry)
+        
+        input_ids = self.tokenizer(prefix + suffix, return_tensors="pt").input_ids.to(self.device)
+        return decoder.decode(input_ids, form_schema)
+    
+    def parse_response(self, response):
+        """Extract the JSON object from a model completion"""
+        try:
+            # Find JSON-like content
+            json_start = response.find('{')
+            json_end = response.rfind('}') + 1
+            if json_start != -1 and json_end != -1:
+                json_str = response[json_start:json_end]
+                form_data = json.loads(json_str)
+            else:
+                # Fallback: attempt to parse entire response
+                form_data = json.loads(response)
+            
+            return form_data
+        except json.JSONDecodeError:
+            # In case JSON parsing fails, return a structured error response
+            print(f"Failed to parse JSON from model response: {response}")
+            return {"error": "Failed to extract form data", "raw_response": response}
+    
+    def extract_form_data(self, transcript, form_schema=None, form_type=None):
         """
         Analyze transcript and extract form data using Llama 3.2
         
+        With FORM_RULES_ENABLED the rules of rule_extraction fill what they
+        can first; the model is only prompted for the remaining fields (and
+        not at all when the rules found every field).
+        
         Parameters:
         transcript (str): The transcript text
         form_schema (dict, optional): Schema defining the form fields
+        form_type (str, optional): Form type of the schema, used as the prefix cache key
         
         Returns:
         dict: Extracted form data in JSON format
         """
+        # Default form schema if none provided
+        if form_schema is None:
+            form_schema = DEFAULT_FORM_SCHEMA
+        
+        if not self.rules_enabled:
+            return self.extract_with_model(transcript, form_schema, form_type)
+        
+        found = RuleExtractor().extract(transcript, form_schema)
+        remaining = [field for field in form_schema if field not in found]
+        if not remaining:
+            return found
+        
+        form_data = self.extract_with_model(transcript, form_schema, form_type, fields=remaining)
+        if not isinstance(form_data, dict):
+            form_data = {}
+        if 'error' in form_data:
+            # Keep the model's error report alongside what the rules found
+            return {**form_data, **found}
+        
+        # Schema order; rule values win over the model's for the fields they found
+        merged = {field: form_data.get(field) for field in remaining}
+        merged.update(found)
+        return {field: merged[field] for field in form_schema}
+    
+    def extract_with_model(self, transcript, form_schema, form_type=None, fields=None):
+        """
+        Prompt the model for the fields of form_schema (all of them, or only
+        those listed in fields); the prompt prefix always shows the full schema
+        """
         try:
-            # Default form schema if none provided
-            if form_schema is None:
-                form_schema = {
-                    "name": "string",
-                    "email": "string",
-                    "phone": "string",
-                    "address": "string",
-                    "reason_for_application": "string",
-                    "additional_notes": "string"
-                }
-            
             # Create prompt for Llama
-            schema_json = json.dumps(form_schema, indent=2)
-            prompt = f"""
-            You are a form-filling assistant. Extract the following information from this transcript and format it as JSON:
-            
-            Form Fields: {schema_json}
+            prefix, suffix = self.build_prompt_parts(transcript, form_schema, fields)
             
-            Transcript: "{transcript}"
+            if self.decoding_mode == 'constrained':
+                if fields is not None:
+                    form_schema = {field: form_schema[field] for field in fields}
+                return self.extract_constrained(prefix, suffix, form_schema, form_type)
             
-            Please extract all the information according to the provided schema and return ONLY a valid JSON object with the extracted data. If a field is not found in the transcript, leave it empty or null.
-            """
-            
-            # Generate completion
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=1024,
-                    temperature=0.1,
-                    do_sample=False
-                )
-            
-            # Decode the response and extract JSON
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # Extract JSON part from the response
-            try:
-                # Find JSON-like content
-                json_start = response.find('{')
-                json_end = response.rfind('}') + 1
-                if json_start != -1 and json_end != -1:
-                    json_str = response[json_start:json_end]
-                    form_data = json.loads(json_str)
-                else:
-                    # Fallback: attempt to parse entire response
-                    form_data = json.loads(response)
-                
-                return form_data
-            except json.JSONDecodeError:
-                # In case JSON parsing fails, return a structured error response
-                print(f"Failed to parse JSON from model response: {response}")
-                return {"error": "Failed to extract form data", "raw_response": response}
+            # Generate completion, batched with other pending requests if enabled
+            if self.batching_enabled:
+                response = self.batcher.process(prefix + suffix)
+            elif self.prefix_cache_enabled:
+                response = self.generate_with_prefix(prefix, suffix, form_type)
+            else:
+                response = self.generate(prefix + suffix)
             
+            return self.parse_response(response)
+        
         except Exception as e:
             print(f"Error during form data extraction: {e}")
             raise
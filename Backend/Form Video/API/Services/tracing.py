@@ -0,0 +1,125 @@
+# api/services/tracing.py
+# Timing of pipeline stages and of the work inside them
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+# The stage being traced in this thread of execution, if any
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+class StageTrace:
+    """
+    Timings of one attempt of a pipeline stage.
+    
+    Used as a context manager around the stage's work; spans opened inside it
+    (see span) add their time by name. Span times are exclusive: a model that
+    loads lazily inside an 'inference' span counts as 'model_load', not as
+    inference.
+    
+    Spans may also be opened on helper threads (batchers, thread pools) the
+    stage thread waits on, once the trace is attached to them (see attached
+    and in_current_trace); their time is taken out of the stage thread's
+    innermost open span.
+    """
+    
+    def __init__(self, stage, queued_since=None, attempt=1):
+        self.stage = stage
+        self.queued_since = queued_since
+        self.attempt = attempt
+        self.spans = {}
+        self.started_at = None
+        self.seconds = None
+        self._started = None
+        # Open spans per thread: [name, children's time] frames
+        self._stacks = {}
+        self._owner = None
+        self._lock = threading.Lock()
+        self._token = None
+    
+    def __enter__(self):
+        self.started_at = datetime.now(dt_timezone.utc)
+        self._started = time.perf_counter()
+        self._owner = threading.get_ident()
+        self._token = _current_trace.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback):
+        self.seconds = time.perf_counter() - self._started
+        _current_trace.reset(self._token)
+        return False
+    
+    @contextmanager
+    def span(self, name):
+        thread = threading.get_ident()
+        frame = [name, 0.0]
+        with self._lock:
+            stack = self._stacks.setdefault(thread, [])
+            stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stack.pop()
+                if stack:
+                    stack[-1][1] += elapsed
+                elif thread != self._owner and self._stacks.get(self._owner):
+                    # The stage thread was waiting on this helper thread
+                    self._stacks[self._owner][-1][1] += elapsed
+                self.spans[name] = self.spans.get(name, 0.0) + max(elapsed - frame[1], 0.0)
+    
+    def as_dict(self):
+        """JSON-serializable timings, as stored in VideoSubmission.timings"""
+        queue_wait = None
+        if self.queued_since is not None:
+            queue_wait = max((self.started_at - self.queued_since).total_seconds(), 0.0)
+        return {
+            'started_at': self.started_at.isoformat(),
+            'seconds': round(self.seconds, 4),
+            'queue_wait_seconds': None if queue_wait is None else round(queue_wait, 4),
+            'attempt': self.attempt,
+            'spans': {name: round(seconds, 4) for name, seconds in self.spans.items()},
+        }
+    
+    def merge_into(self, timings):
+        """Copy of a submission's timings with this stage's entry replaced"""
+        return {**(timings or {}), self.stage: self.as_dict()}
+
+def current_trace():
+    """The stage trace of this thread of execution, or None"""
+    return _current_trace.get()
+
+@contextmanager
+def attached(trace):
+    """Count the spans opened in this block (on a helper thread) towards trace"""
+    token = _current_trace.set(trace)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+def in_current_trace(function):
+    """Wrap function so that, run on another thread, its spans count towards the current trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        return function
+    
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with attached(trace):
+            return function(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def span(name):
+    """Time a block as part of the current stage trace; does nothing outside a stage"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
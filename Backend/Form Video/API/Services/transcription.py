@@ -1,44 +1,416 @@
 # api/services/transcription.py
+import io
 import os
+import queue
+import threading
+import wave
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import openai
 from django.conf import settings
+from .audio_extractor import SAMPLE_RATE, SAMPLE_WIDTH, AudioExtractor
+from .batching import MicroBatcher
+from .model_registry import model_registry
+from .tracing import in_current_trace
+from .vad import FixedSegmenter, SilenceSplitter, StreamingSegmenter
 
-class WhisperTranscriptionService:
+def pcm_to_wav(pcm):
+    """Wrap raw 16 kHz mono PCM in an in-memory WAV file"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    buffer.seek(0)
+    # The OpenAI client infers the format from the file name
+    buffer.name = 'chunk.wav'
+    return buffer
+
+class TranscriptionBackend(ABC):
+    """
+    Interface of the transcription backends used by WhisperTranscriptionService.
+    
+    Both methods return (text, detected_language). transcribe_pcm may be called
+    from several threads at once.
+    """
+    
+    name = None
+    
+    @abstractmethod
+    def transcribe_file(self, full_path, language=None):
+        """Transcribe an audio file"""
+    
+    @abstractmethod
+    def transcribe_pcm(self, pcm, language=None):
+        """Transcribe raw 16 kHz mono PCM"""
+    
+    def warm_up(self):
+        """Load whatever the backend needs before the first call"""
+        return None
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Transcription through the OpenAI Whisper API"""
+    
+    name = 'openai'
+    
     def __init__(self):
         openai.api_key = settings.OPENAI_API_KEY
     
-    def transcribe(self, audio_path, language=None):
+    def _transcribe(self, audio_file, language=None):
+        params = {
+            "file": audio_file,
+            "model": "whisper-1",
+            "response_format": "json"
+        }
+        
+        if language:
+            params["language"] = language
+        
+        response = openai.Audio.transcribe(**params)
+        
+        # Extract text and language
+        return response.get('text', ''), response.get('language', 'unknown')
+    
+    def transcribe_file(self, full_path, language=None):
+        with open(full_path, "rb") as audio_file:
+            return self._transcribe(audio_file, language)
+    
+    def transcribe_pcm(self, pcm, language=None):
+        return self._transcribe(pcm_to_wav(pcm), language)
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    Transcription with a Whisper checkpoint loaded in the worker process
+    (settings.LOCAL_WHISPER_MODEL), with no network round trip per call.
+    
+    The model is resident once per process. Audio is cut into 30 second
+    windows, and windows submitted by concurrent jobs (and by the parallel
+    segments of one job) are micro-batched into a single generate call of
+    up to WHISPER_BATCH_MAX_SIZE windows.
+    """
+    
+    name = 'local'
+    
+    # Whisper attends to at most 30 seconds of audio per forward pass
+    WINDOW_SECONDS = 30
+    
+    def __init__(self):
+        import torch
+        from .quantization import resolve_precision, device_for
+        self.model_name = settings.LOCAL_WHISPER_MODEL
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.precision = resolve_precision(settings.LOCAL_WHISPER_PRECISION, device)
+        self.device = device_for(self.precision, device)
+    
+    @property
+    def processor(self):
+        from transformers import AutoProcessor
+        return model_registry.get(
+            ('whisper', 'processor', self.model_name),
+            lambda: AutoProcessor.from_pretrained(self.model_name)
+        )
+    
+    @property
+    def model(self):
+        from transformers import AutoModelForSpeechSeq2Seq
+        from .quantization import load_pretrained
+        return model_registry.get(
+            ('whisper', 'model', self.model_name, self.precision),
+            lambda: load_pretrained(AutoModelForSpeechSeq2Seq, self.model_name, self.precision, self.device)
+        )
+    
+    @property
+    def batcher(self):
+        """Per-process micro-batcher of 30 second windows, shared by all jobs"""
+        return model_registry.get_or_create(
+            ('whisper', 'batcher', self.model_name, self.precision),
+            lambda: MicroBatcher(
+                self.transcribe_windows,
+                max_batch_size=settings.WHISPER_BATCH_MAX_SIZE,
+                max_wait=settings.WHISPER_BATCH_MAX_WAIT_MS / 1000,
+                name='whisper-batcher'
+            )
+        )
+    
+    def warm_up(self):
+        return self.model, self.processor
+    
+    @staticmethod
+    def pcm_to_array(pcm):
+        import numpy as np
+        return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    
+    def _language_code(self, token_id):
+        # Language tokens look like <|en|>
+        token = self.processor.tokenizer.convert_ids_to_tokens(int(token_id))
+        if token and token.startswith('<|') and token.endswith('|>'):
+            return token[2:-2]
+        return None
+    
+    def detect_languages(self, input_features):
+        """Most likely language code of each window of a batch of input features"""
+        import torch
+        with torch.no_grad():
+            token_ids = self.model.detect_language(input_features)
+        return [self._language_code(token_id) for token_id in token_ids]
+    
+    def transcribe_windows(self, windows):
+        """
+        Transcribe a batch of audio windows with one generate call
+        
+        Parameters:
+        windows (list): (samples, language) pairs; samples is a float32 array
+            of at most 30 seconds at 16 kHz, language an ISO code or None to
+            detect it
+        
+        Returns:
+        list: (text, language) per window, in order
+        """
+        import torch
+        
+        inputs = self.processor(
+            [samples for samples, _ in windows], sampling_rate=SAMPLE_RATE, return_tensors="pt"
+        )
+        input_features = inputs.input_features.to(self.device, dtype=self.model.dtype)
+        
+        languages = [language for _, language in windows]
+        undetected = [index for index, language in enumerate(languages) if not language]
+        if undetected:
+            detected = self.detect_languages(input_features[undetected])
+            for index, language in zip(undetected, detected):
+                languages[index] = language
+        
+        generate_kwargs = {"task": "transcribe"}
+        if all(languages):
+            # Forced or detected per window, so one batch can mix languages
+            generate_kwargs["language"] = languages
+        with torch.no_grad():
+            predicted_ids = self.model.generate(input_features, **generate_kwargs)
+        
+        texts = self.processor.batch_decode(predicted_ids, skip_special_tokens=True)
+        return [(text.strip(), language or 'unknown') for text, language in zip(texts, languages)]
+    
+    def transcribe_pcm(self, pcm, language=None):
+        samples = self.pcm_to_array(pcm)
+        window = self.WINDOW_SECONDS * SAMPLE_RATE
+        futures = [
+            self.batcher.submit((samples[start:start + window], language))
+            for start in range(0, max(len(samples), 1), window)
+        ]
+        results = [future.result() for future in futures]
+        
+        if language:
+            detected_language = language
+        else:
+            # Windows are detected independently; the majority language wins
+            languages = Counter(result_language for _, result_language in results if result_language != 'unknown')
+            detected_language = languages.most_common(1)[0][0] if languages else 'unknown'
+        return ' '.join(text for text, _ in results if text), detected_language
+    
+    def transcribe_file(self, full_path, language=None):
+        return self.transcribe_pcm(AudioExtractor.load_pcm(full_path), language)
+
+TRANSCRIPTION_BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    LocalWhisperBackend.name: LocalWhisperBackend,
+}
+
+def get_transcription_backend(name=None):
+    """Instantiate the configured transcription backend"""
+    name = name or settings.TRANSCRIPTION_BACKEND
+    try:
+        return TRANSCRIPTION_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown transcription backend: {name}")
+
+class WhisperTranscriptionService:
+    def __init__(self, backend=None):
+        self.backend = backend or get_transcription_backend()
+        # 'vad': split on silence, 'fixed': fixed-length stream chunks,
+        # 'none': whole file in one backend call
+        self.segmentation = settings.TRANSCRIPTION_SEGMENTATION
+        self.max_workers = settings.TRANSCRIPTION_MAX_WORKERS
+    
+    @staticmethod
+    def uses_pcm():
+        """Whether transcribing an extracted file decodes it to PCM instead of uploading it"""
+        return settings.TRANSCRIPTION_SEGMENTATION == 'vad' or settings.TRANSCRIPTION_BACKEND == 'local'
+    
+    def _splitter(self):
+        return SilenceSplitter(
+            min_silence_ms=settings.VAD_MIN_SILENCE_MS,
+            max_segment_seconds=settings.VAD_MAX_SEGMENT_SECONDS
+        )
+    
+    def _segmenter(self):
+        if self.segmentation == 'vad':
+            return StreamingSegmenter(self._splitter())
+        return FixedSegmenter()
+    
+    def transcribe(self, audio_path, language=None, return_segments=False):
         """
-        Transcribe audio using OpenAI Whisper API
+        Transcribe audio with the configured Whisper backend
         
         Parameters:
         audio_path (str): Path to the audio file
         language (str, optional): ISO language code
+        return_segments (bool): Also return the timed segments
         
         Returns:
-        tuple: (text, detected_language)
+        tuple: (text, detected_language) or (text, detected_language, segments)
         """
         try:
             full_path = os.path.join(settings.MEDIA_ROOT, audio_path)
             
-            with open(full_path, "rb") as audio_file:
-                params = {
-                    "file": audio_file,
-                    "model": "whisper-1",
-                    "response_format": "json"
-                }
-                
-                if language:
-                    params["language"] = language
-                
-                response = openai.Audio.transcribe(**params)
+            if self.segmentation == 'vad':
+                # Split on silence and transcribe the segments in parallel
+                pcm = AudioExtractor.load_pcm(full_path)
+                segments = [
+                    (start, end, pcm[start * SAMPLE_WIDTH:end * SAMPLE_WIDTH])
+                    for start, end in self._splitter().split(pcm)
+                ]
+                text, detected_language, timed_segments = self.transcribe_segments(segments, language)
+            else:
+                text, detected_language = self.backend.transcribe_file(full_path, language)
+                timed_segments = []
             
-            # Extract text and language
-            transcription_text = response.get('text', '')
-            detected_language = response.get('language', 'unknown')
-            
-            return transcription_text, detected_language
+            if return_segments:
+                return text, detected_language, timed_segments
+            return text, detected_language
+        
+        except Exception as e:
+            print(f"Error during transcription: {e}")
+            raise
+    
+    def transcribe_segments(self, segments, language=None):
+        """
+        Transcribe audio segments in parallel through a worker pool
+        
+        Parameters:
+        segments (list): (start_sample, end_sample, pcm) tuples, in order
+        language (str, optional): ISO language code
+        
+        Returns:
+        tuple: (text, detected_language, timed_segments)
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='transcribe') as pool:
+            transcribe_pcm = in_current_trace(self.backend.transcribe_pcm)
+            futures = [pool.submit(transcribe_pcm, pcm, language) for _, _, pcm in segments]
+            results = [future.result() for future in futures]
+        return self._stitch(segments, results, language)
+    
+    @staticmethod
+    def _stitch(segments, results, language=None):
+        """Join segment transcripts in order, with timestamps in seconds"""
+        timed_segments = []
+        languages = Counter()
+        for (start, end, _), (text, segment_language) in zip(segments, results):
+            text = text.strip()
+            if segment_language and segment_language != 'unknown':
+                languages[segment_language] += 1
+            if text:
+                timed_segments.append({
+                    'start': round(start / SAMPLE_RATE, 2),
+                    'end': round(end / SAMPLE_RATE, 2),
+                    'text': text,
+                })
+        
+        # Segments are transcribed independently; the majority language wins
+        detected_language = language or (languages.most_common(1)[0][0] if languages else 'unknown')
+        text = ' '.join(segment['text'] for segment in timed_segments)
+        return text, detected_language, timed_segments
+    
+    def transcribe_stream(self, audio_stream, language=None, on_text=None, return_segments=False):
+        """
+        Transcribe an AudioStream segment by segment while ffmpeg is still decoding
+        
+        A reader thread keeps draining ffmpeg's stdout into a small queue so
+        decoding never stalls on a full pipe. Segments (fixed-length chunks,
+        or speech segments cut at pauses with TRANSCRIPTION_SEGMENTATION=vad)
+        are transcribed in parallel as soon as they are complete.
+        
+        Parameters:
+        audio_stream (AudioStream): Running ffmpeg PCM stream
+        language (str, optional): ISO language code
+        on_text (callable, optional): Called as on_text(text_so_far, language)
+            each time the transcript grows
+        return_segments (bool): Also return the timed segments
+        
+        Returns:
+        tuple: (text, detected_language) or (text, detected_language, segments)
+        """
+        chunks = queue.Queue(maxsize=settings.TRANSCRIPTION_STREAM_BUFFER_CHUNKS)
+        done = object()
+        reader_error = []
+        
+        def read_chunks():
+            try:
+                for chunk in audio_stream.chunks():
+                    chunks.put(chunk)
+            except Exception as e:
+                reader_error.append(e)
+            finally:
+                chunks.put(done)
+        
+        reader = threading.Thread(target=read_chunks, name='ffmpeg-reader', daemon=True)
+        reader.start()
+        
+        segmenter = self._segmenter()
+        segments = []
+        futures = []
+        reported = 0
+        
+        def report(block):
+            # Report the transcript up to the first segment still in progress
+            nonlocal reported
+            if on_text is None:
+                return
+            ready = reported
+            while ready < len(futures) and (block or futures[ready].done()):
+                futures[ready].result()
+                ready += 1
+            if ready > reported:
+                reported = ready
+                text, detected_language, _ = self._stitch(
+                    segments[:ready], [future.result() for future in futures[:ready]], language
+                )
+                on_text(text, detected_language)
+        
+        transcribe_pcm = in_current_trace(self.backend.transcribe_pcm)
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='transcribe')
+        try:
+            while True:
+                chunk = chunks.get()
+                finished = segmenter.flush() if chunk is done else segmenter.feed(chunk)
+                for segment in finished:
+                    segments.append(segment)
+                    futures.append(pool.submit(transcribe_pcm, segment[2], language))
+                report(block=False)
+                if chunk is done:
+                    break
             
+            report(block=True)
+            results = [future.result() for future in futures]
         except Exception as e:
             print(f"Error during transcription: {e}")
+            audio_stream.abort()
             raise
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            # Unblock the reader if we stopped consuming early
+            while reader.is_alive():
+                try:
+                    chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            reader.join()
+        
+        if reader_error:
+            raise reader_error[0]
+        
+        text, detected_language, timed_segments = self._stitch(segments, results, language)
+        if return_segments:
+            return text, detected_language, timed_segments
+        return text, detected_language
@@ -1,13 +1,78 @@
 # api/services/translation.py
+import re
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 import torch
 from django.conf import settings
+from .model_registry import model_registry
+from .quantization import resolve_precision, device_for, load_pretrained
+from .translation_memory import get_translation_memory, normalize_sentence
+
+# Sentence boundaries: Latin and Indic (danda) end punctuation, or line breaks
+SENTENCE_END = re.compile(r'(?<=[.!?\u0964\u0965])\s+|\n+')
+
+def split_sentences(text, max_words=80):
+    """
+    Split a transcript into sentences for translation
+    
+    Parameters:
+    text (str): The transcript
+    max_words (int): Longer sentences (e.g. unpunctuated speech) are cut
+        into pieces of at most this many words
+    
+    Returns:
+    list: Non-empty sentences, in order
+    """
+    sentences = []
+    for part in SENTENCE_END.split(text):
+        words = part.split()
+        for start in range(0, len(words), max_words):
+            sentences.append(' '.join(words[start:start + max_words]))
+    return sentences
+
+def length_buckets(lengths, max_batch_size, max_batch_tokens):
+    """
+    Group items of similar length into batches
+    
+    Items are sorted by length so little of each padded batch is padding;
+    a batch is closed when it has max_batch_size items or when its padded
+    size (items x longest item) would exceed max_batch_tokens.
+    
+    Parameters:
+    lengths (list): Token count of each item
+    max_batch_size (int): Most items per batch
+    max_batch_tokens (int): Most padded tokens per batch
+    
+    Returns:
+    list: Batches, each a list of item indices
+    """
+    batches = []
+    current, current_longest = [], 0
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        longest = max(current_longest, lengths[index])
+        if current and (len(current) >= max_batch_size or longest * (len(current) + 1) > max_batch_tokens):
+            batches.append(current)
+            current, longest = [], lengths[index]
+        current.append(index)
+        current_longest = longest
+    if current:
+        batches.append(current)
+    return batches
 
 class IndicTranslationService:
     def __init__(self):
         # Load the IndicTrans2 model and tokenizer
         self.model_name = settings.INDIC_TRANS_MODEL_PATH
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.precision = resolve_precision(settings.TRANSLATION_PRECISION, device)
+        self.device = device_for(self.precision, device)
+        
+        # 'greedy' is the fast mode; 'beam' searches TRANSLATION_NUM_BEAMS beams
+        self.num_beams = 1 if settings.TRANSLATION_DECODING == 'greedy' else settings.TRANSLATION_NUM_BEAMS
+        self.batch_size = settings.TRANSLATION_BATCH_SIZE
+        self.max_batch_tokens = settings.TRANSLATION_MAX_BATCH_TOKENS
+        self.max_sentence_words = settings.TRANSLATION_MAX_SENTENCE_WORDS
+        self.max_new_tokens = settings.TRANSLATION_MAX_NEW_TOKENS
+        self.use_memory = settings.TRANSLATION_MEMORY_ENABLED
         
         # Initialize the model and tokenizer (lazy loading)
         self._model = None
@@ -16,23 +81,38 @@ class IndicTranslationService:
     @property
     def model(self):
         if self._model is None:
-            self._model = AutoModelForSeq2SeqLM.from_pretrained(
-                self.model_name
-            ).to(self.device)
+            # Shared with every other service instance in this worker process
+            self._model = model_registry.get(
+                ('indictrans', 'model', self.model_name, self.precision),
+                lambda: load_pretrained(AutoModelForSeq2SeqLM, self.model_name, self.precision, self.device)
+            )
         return self._model
     
     @property
     def tokenizer(self):
         if self._tokenizer is None:
-            self._tokenizer = AutoTokenizer.from_pretrained(
-                self.model_name
+            self._tokenizer = model_registry.get(
+                ('indictrans', 'tokenizer', self.model_name),
+                lambda: AutoTokenizer.from_pretrained(self.model_name)
             )
         return self._tokenizer
     
+    @property
+    def memory_namespace(self):
+        # Translations are only reused for the same model, precision and decoding
+        return f"{self.model_name}|{self.precision}|beams={self.num_beams}"
+    
+    def warm_up(self):
+        """Load the model and tokenizer now instead of on the first request"""
+        return self.model, self.tokenizer
+    
     def translate(self, text, source_lang, target_lang="en"):
         """
         Translate text using IndicTrans2
         
+        The text is split into sentences, which are translated in batches of
+        similar length (see translate_sentences) and joined back in order.
+        
         Parameters:
         text (str): The text to translate
         source_lang (str): Source language code
@@ -46,27 +126,101 @@ class IndicTranslationService:
             if source_lang == target_lang:
                 return text
             
-            # Format the input for IndicTrans2
-            if target_lang == "en":
-                # Indic to English
-                inputs = self.tokenizer(f"{source_lang}>>{text}", return_tensors="pt").to(self.device)
-            else:
-                # English to Indic
-                inputs = self.tokenizer(f"en>>{target_lang}>>{text}", return_tensors="pt").to(self.device)
+            sentences = split_sentences(text, self.max_sentence_words)
+            if not sentences:
+                return text
+            
+            return ' '.join(self.translate_sentences(sentences, source_lang, target_lang))
+        
+        except Exception as e:
+            print(f"Error during translation: {e}")
+            return text
+    
+    @staticmethod
+    def format_input(sentence, source_lang, target_lang="en"):
+        # Format the input for IndicTrans2
+        if target_lang == "en":
+            # Indic to English
+            return f"{source_lang}>>{sentence}"
+        # English to Indic
+        return f"en>>{target_lang}>>{sentence}"
+    
+    def translate_sentences(self, sentences, source_lang, target_lang="en"):
+        """
+        Translate sentences, reusing earlier translations where possible
+        
+        Sentences are normalized (see normalize_sentence) and looked up in the
+        translation memory; only the distinct sentences it does not know are
+        sent to the model, and their translations are stored for next time.
+        
+        Parameters:
+        sentences (list): Sentences to translate
+        source_lang (str): Source language code
+        target_lang (str): Target language code
+        
+        Returns:
+        list: Translations, in the order of the sentences
+        """
+        normalized = [normalize_sentence(sentence) for sentence in sentences]
+        if not self.use_memory:
+            return self.generate_translations(normalized, source_lang, target_lang)
+        
+        try:
+            known = get_translation_memory().get_many(self.memory_namespace, source_lang, target_lang, list(dict.fromkeys(normalized)))
+        except Exception as e:
+            # The memory is an optimization; translate everything without it
+            print(f"Translation memory unavailable: {e}")
+            return self.generate_translations(normalized, source_lang, target_lang)
+        
+        missing = [sentence for sentence in dict.fromkeys(normalized) if sentence not in known]
+        if missing:
+            translated = dict(zip(missing, self.generate_translations(missing, source_lang, target_lang)))
+            try:
+                get_translation_memory().put_many(self.memory_namespace, source_lang, target_lang, translated)
+            except Exception as e:
+                print(f"Could not store translations: {e}")
+            known.update(translated)
+        
+        return [known[sentence] for sentence in normalized]
+    
+    def generate_translations(self, sentences, source_lang, target_lang="en"):
+        """
+        Translate sentences with the model, in padded batches bucketed by length
+        
+        Parameters:
+        sentences (list): Sentences to translate
+        source_lang (str): Source language code
+        target_lang (str): Target language code
+        
+        Returns:
+        list: Translations, in the order of the sentences
+        """
+        inputs = [self.format_input(sentence, source_lang, target_lang) for sentence in sentences]
+        lengths = [len(ids) for ids in self.tokenizer(inputs).input_ids]
+        
+        translations = [None] * len(inputs)
+        for batch in length_buckets(lengths, self.batch_size, self.max_batch_tokens):
+            encoded = self.tokenizer(
+                [inputs[index] for index in batch],
+                return_tensors="pt",
+                padding=True
+            ).to(self.device)
+            
+            # Room for the translation to be somewhat longer than its source
+            longest = max(lengths[index] for index in batch)
+            max_new_tokens = min(self.max_new_tokens, 2 * longest + 16)
             
             # Generate translation
             with torch.no_grad():
                 outputs = self.model.generate(
-                    **inputs,
-                    max_length=2048,
-                    num_beams=5,
+                    **encoded,
+                    max_new_tokens=max_new_tokens,
+                    num_beams=self.num_beams,
                     num_return_sequences=1
                 )
             
-            # Decode and return the translation
-            translation = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            return translation
-            
-        except Exception as e:
-            print(f"Error during translation: {e}")
-            return text
+            # Decode the translations of the batch
+            for index, translation in zip(batch, self.tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+                translations[index] = translation.strip()
+        
+        return translations
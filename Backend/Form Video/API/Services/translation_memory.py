@@ -0,0 +1,206 @@
+# api/services/translation_memory.py
+# Persistent memory of sentence translations, shared by every worker process
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .model_registry import model_registry
+
+def normalize_sentence(sentence):
+    """Canonical form of a sentence for lookups: NFC, single spaces, trimmed"""
+    return ' '.join(unicodedata.normalize('NFC', sentence).split())
+
+class TranslationMemory:
+    """
+    Exact-match translation memory with two tiers.
+    
+    An in-process LRU (max_entries sentences) sits in front of a SQLite file
+    that every worker on the host shares and that survives restarts. Keys are
+    (namespace, source_lang, target_lang, normalized sentence); the namespace
+    identifies the model and decoding settings that produced the translation,
+    so changing either never serves stale output.
+    
+    The file keeps at most max_rows translations; rows carry the time they
+    were stored and the oldest are pruned. Hit and miss counts are kept per
+    process in memory and added to totals in the file every flush_seconds
+    (and at exit), so a lookup never waits on a write.
+    """
+    
+    def __init__(self, path, max_entries=10000, max_rows=200000, flush_seconds=30):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.max_rows = max(1, int(max_rows))
+        self.flush_seconds = flush_seconds
+        self._entries = OrderedDict()
+        # _lock guards the in-process state, _db_lock the SQLite connection
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._unflushed = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._flushed_at = time.monotonic()
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._connection:
+            # WAL: readers in other processes are not blocked by a writer
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                ' namespace TEXT, source_lang TEXT, target_lang TEXT, sentence TEXT, translation TEXT,'
+                ' stored_at REAL DEFAULT 0,'
+                ' PRIMARY KEY (namespace, source_lang, target_lang, sentence))'
+            )
+            columns = [row[1] for row in self._connection.execute('PRAGMA table_info(translations)')]
+            if 'stored_at' not in columns:
+                # File written before rows were timestamped: its rows are pruned first
+                self._connection.execute('ALTER TABLE translations ADD COLUMN stored_at REAL DEFAULT 0')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS translations_stored_at ON translations (stored_at)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)')
+        atexit.register(self.flush)
+    
+    def get_many(self, namespace, source_lang, target_lang, sentences):
+        """
+        Look up normalized sentences
+        
+        Returns:
+        dict: sentence -> translation, for the sentences found
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for sentence in sentences:
+                key = (namespace, source_lang, target_lang, sentence)
+                translation = self._entries.get(key)
+                if translation is not None:
+                    self._entries.move_to_end(key)
+                    found[sentence] = translation
+                else:
+                    missing.append(sentence)
+        memory_hits = len(found)
+        
+        disk_found = {}
+        if missing:
+            with self._db_lock:
+                disk_found = self._read(namespace, source_lang, target_lang, missing)
+        found.update(disk_found)
+        
+        with self._lock:
+            for sentence, translation in disk_found.items():
+                self._remember((namespace, source_lang, target_lang, sentence), translation)
+            self._count(memory_hits=memory_hits, disk_hits=len(disk_found), misses=len(missing) - len(disk_found))
+            due = time.monotonic() - self._flushed_at >= self.flush_seconds
+        if due:
+            self.flush()
+        return found
+    
+    def put_many(self, namespace, source_lang, target_lang, translations):
+        """Store translations (normalized sentence -> translation) in both tiers"""
+        if not translations:
+            return
+        with self._lock:
+            for sentence, translation in translations.items():
+                self._remember((namespace, source_lang, target_lang, sentence), translation)
+        stored_at = time.time()
+        with self._db_lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)',
+                [(namespace, source_lang, target_lang, sentence, translation, stored_at)
+                 for sentence, translation in translations.items()]
+            )
+    
+    def flush(self):
+        """Add this process's unflushed counts to the file's totals and prune old rows"""
+        with self._lock:
+            increments = [(name, value) for name, value in self._unflushed.items() if value]
+            self._unflushed = dict.fromkeys(self._unflushed, 0)
+            self._flushed_at = time.monotonic()
+        with self._db_lock, self._connection:
+            if increments:
+                self._connection.executemany(
+                    'INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                    increments
+                )
+            # Oldest first, keeping the newest max_rows
+            self._connection.execute(
+                'DELETE FROM translations WHERE rowid IN ('
+                ' SELECT rowid FROM translations ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_rows,)
+            )
+    
+    def _read(self, namespace, source_lang, target_lang, sentences):
+        found = {}
+        # Stay under SQLite's limit on query parameters
+        for start in range(0, len(sentences), 500):
+            chunk = sentences[start:start + 500]
+            rows = self._connection.execute(
+                'SELECT sentence, translation FROM translations'
+                ' WHERE namespace = ? AND source_lang = ? AND target_lang = ?'
+                f' AND sentence IN ({", ".join("?" * len(chunk))})',
+                [namespace, source_lang, target_lang, *chunk]
+            )
+            found.update(rows.fetchall())
+        return found
+    
+    def _remember(self, key, translation):
+        self._entries[key] = translation
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _count(self, **increments):
+        # Caller holds _lock
+        for name, value in increments.items():
+            setattr(self, name, getattr(self, name) + value)
+            self._unflushed[name] += value
+    
+    def stats(self):
+        """Counts of this process, and totals across processes from the file"""
+        self.flush()
+        with self._db_lock:
+            totals = dict(self._connection.execute('SELECT name, value FROM counters').fetchall())
+            stored = self._connection.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            total_lookups = sum(totals.get(name, 0) for name in ('memory_hits', 'disk_hits', 'misses'))
+            return {
+                'process': {
+                    'memory_entries': len(self._entries),
+                    'memory_hits': self.memory_hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                },
+                'total': {
+                    'stored_translations': stored,
+                    'memory_hits': totals.get('memory_hits', 0),
+                    'disk_hits': totals.get('disk_hits', 0),
+                    'misses': totals.get('misses', 0),
+                    'hit_rate': (totals.get('memory_hits', 0) + totals.get('disk_hits', 0)) / total_lookups
+                    if total_lookups else 0.0,
+                },
+            }
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def get_translation_memory():
+    """The translation memory of this process (one SQLite connection per process)"""
+    return model_registry.get_or_create(
+        ('translation-memory', settings.TRANSLATION_MEMORY_PATH),
+        lambda: TranslationMemory(
+            settings.TRANSLATION_MEMORY_PATH,
+            settings.TRANSLATION_MEMORY_SIZE,
+            max_rows=settings.TRANSLATION_MEMORY_MAX_ROWS,
+            flush_seconds=settings.TRANSLATION_MEMORY_FLUSH_SECONDS
+        )
+    )
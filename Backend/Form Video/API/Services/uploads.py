@@ -0,0 +1,190 @@
+# api/services/uploads.py
+# Resumable chunked uploads written straight to their final location
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import VideoSubmission, UploadSession
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+    import msvcrt
+
+@contextmanager
+def exclusive_file_lock(file):
+    """
+    Try to take an exclusive lock on an open file without blocking
+    
+    Yields whether the lock was acquired; it is released on exit. Uses
+    flock on POSIX and a lock on the file's first byte on Windows.
+    """
+    if fcntl is not None:
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        return
+    
+    # msvcrt locks a byte range starting at the current position
+    file.seek(0)
+    try:
+        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+class UploadOffsetMismatch(Exception):
+    """A chunk did not start at the session's committed offset"""
+    
+    def __init__(self, offset):
+        super().__init__(f"Upload offset is {offset}")
+        self.offset = offset
+
+class ChunkedUploadStore:
+    """
+    Writes resumable uploads to disk chunk by chunk.
+    
+    The file is created at the path VideoSubmission.video_file would use
+    (videos/%Y/%m/%d/) and each chunk is copied from the request stream at
+    its offset in UPLOAD_COPY_BUFFER_BYTES blocks, so neither the chunk nor
+    the file is ever held in memory. The committed offset only moves past
+    bytes that were written and synced; if the connection drops mid-chunk,
+    the bytes received so far are kept and the client resumes from there.
+    
+    The body is copied outside of any transaction: the offset is checked in
+    a short one, reserved with a file lock while the chunk is written, and
+    committed with an UPDATE conditional on the offset it started from.
+    """
+    
+    def __init__(self):
+        self.max_bytes = settings.UPLOAD_MAX_BYTES
+        self.max_chunk_bytes = settings.UPLOAD_CHUNK_MAX_BYTES
+        self.buffer_bytes = settings.UPLOAD_COPY_BUFFER_BYTES
+    
+    def create(self, filename, total_size, form_type='personal_info'):
+        """
+        Open an upload session and create its (empty) file
+        
+        Parameters:
+        filename (str): Client-side name of the video
+        total_size (int): Size of the whole file in bytes
+        form_type (str): Form to extract once the upload completes
+        
+        Returns:
+        UploadSession: The new session
+        """
+        if total_size <= 0 or total_size > self.max_bytes:
+            raise ValueError(f"Upload size must be between 1 and {self.max_bytes} bytes")
+        
+        # Same upload_to (and file name cleaning) as a regular submission
+        file_field = VideoSubmission._meta.get_field('video_file')
+        name = default_storage.get_available_name(file_field.generate_filename(None, filename))
+        
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'xb'):
+            pass
+        
+        return UploadSession.objects.create(
+            filename=filename,
+            file_path=name,
+            total_size=total_size,
+            form_type=form_type
+        )
+    
+    def append(self, session_id, offset, stream, length):
+        """
+        Write one chunk at the given offset
+        
+        Parameters:
+        session_id: UploadSession id
+        offset (int): Where the chunk starts; must equal the committed offset
+        stream: File-like request body
+        length (int): Chunk size in bytes (the request's Content-Length)
+        
+        Returns:
+        UploadSession: The session with its new offset
+        """
+        # Short transaction: validate the chunk against the committed offset;
+        # no transaction or row lock is held while the body is copied
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session_id)
+            if session.status != UploadSession.STATUS_OPEN:
+                if offset == session.total_size and length == 0:
+                    # Retry of the final request whose response was lost
+                    return session
+                raise ValueError("Upload is already completed")
+            if offset != session.offset:
+                raise UploadOffsetMismatch(session.offset)
+            if length > self.max_chunk_bytes:
+                raise ValueError(f"Chunks can be at most {self.max_chunk_bytes} bytes")
+            if offset + length > session.total_size:
+                raise ValueError("Chunk goes past the declared upload size")
+        
+        written = 0
+        with open(default_storage.path(session.file_path), 'r+b') as destination, \
+                exclusive_file_lock(destination) as locked:
+            # The offset is reserved by an exclusive lock on the file: a
+            # concurrent chunk for the same session gets a 409 instead of
+            # writing over this one
+            if not locked:
+                raise UploadOffsetMismatch(session.offset)
+            
+            # Another chunk may have been committed between the check and the lock
+            committed = UploadSession.objects.values_list('offset', flat=True).get(pk=session_id)
+            if committed != offset:
+                raise UploadOffsetMismatch(committed)
+            
+            destination.seek(offset)
+            try:
+                while written < length:
+                    block = stream.read(min(self.buffer_bytes, length - written))
+                    if not block:
+                        break
+                    destination.write(block)
+                    written += len(block)
+            except OSError as e:
+                # Client went away: keep what arrived so it can resume
+                print(f"Upload {session.id} interrupted at {offset + written}: {e}")
+            destination.flush()
+            os.fsync(destination.fileno())
+            
+            # Only moves the offset if nothing else did in the meantime;
+            # committed while the file lock is still held
+            updated_at = timezone.now()
+            moved = UploadSession.objects.filter(
+                pk=session_id, offset=offset, status=UploadSession.STATUS_OPEN
+            ).update(offset=offset + written, updated_at=updated_at)
+        
+        if not moved:
+            session.refresh_from_db()
+            raise UploadOffsetMismatch(session.offset)
+        
+        session.offset = offset + written
+        session.updated_at = updated_at
+        return session
+    
+    def content_hash(self, session):
+        """SHA-256 of the uploaded file, matching hash_uploaded_file for regular uploads"""
+        digest = hashlib.sha256()
+        with open(default_storage.path(session.file_path), 'rb') as uploaded:
+            for block in iter(lambda: uploaded.read(self.buffer_bytes), b''):
+                digest.update(block)
+        return digest.hexdigest()
@@ -0,0 +1,226 @@
+# api/services/vad.py
+# Energy-based voice activity detection used to split audio at pauses
+import numpy as np
+
+from .audio_extractor import SAMPLE_RATE, SAMPLE_WIDTH
+
+
+class SilenceSplitter:
+    """
+    Splits 16 kHz mono PCM into speech segments at pauses.
+    
+    Frames whose RMS energy stays below a threshold (relative to the noise
+    floor of the audio, with an absolute minimum) for at least min_silence_ms count as a pause, and
+    segments are cut in the middle of pauses. Segments longer than
+    max_segment_seconds (Whisper's 30 s window) are cut at their quietest
+    frame, segments shorter than min_segment_seconds are merged into a
+    neighbour, and segments with no speech at all are dropped. Audio in
+    which no frame counts as speech (e.g. quiet phone recordings) is kept
+    whole, cut to max_segment_seconds, rather than dropped.
+    """
+    
+    def __init__(self, frame_ms=30, min_silence_ms=500, max_segment_seconds=30,
+                 min_segment_seconds=1.0, threshold_ratio=3.0, min_threshold=150.0):
+        self.frame_length = int(SAMPLE_RATE * frame_ms / 1000)
+        self.min_silence_frames = max(1, int(min_silence_ms / frame_ms))
+        self.max_segment_frames = max(1, int(max_segment_seconds * 1000 / frame_ms))
+        self.min_segment_frames = int(min_segment_seconds * 1000 / frame_ms)
+        self.threshold_ratio = threshold_ratio
+        self.min_threshold = min_threshold
+    
+    @staticmethod
+    def to_samples(pcm):
+        return np.frombuffer(pcm, dtype=np.int16)
+    
+    def frame_energies(self, samples):
+        """RMS energy of each full frame"""
+        frames = len(samples) // self.frame_length
+        if frames == 0:
+            return np.zeros(0, dtype=np.float32)
+        framed = samples[:frames * self.frame_length].astype(np.float32).reshape(frames, self.frame_length)
+        return np.sqrt(np.mean(framed * framed, axis=1))
+    
+    def speech_mask(self, energies):
+        if len(energies) == 0:
+            return np.zeros(0, dtype=bool)
+        noise_floor = float(np.percentile(energies, 5))
+        loudest = float(np.percentile(energies, 95))
+        if loudest < noise_floor * self.threshold_ratio:
+            # No clear pauses in this audio: only the absolute threshold applies
+            threshold = self.min_threshold
+        else:
+            threshold = max(noise_floor * self.threshold_ratio, self.min_threshold)
+        return energies >= threshold
+    
+    def split(self, pcm):
+        """
+        Split PCM bytes into speech segments, or into max-length pieces of
+        the whole audio when no speech is detected
+        
+        Returns:
+        list: (start_sample, end_sample) pairs, in order
+        """
+        segments = self.speech_segments(pcm)
+        if segments or not pcm:
+            return segments
+        return self.whole(pcm)
+    
+    def whole(self, pcm):
+        """All of the audio as (start_sample, end_sample) pairs of at most the maximum segment length"""
+        samples = self.to_samples(pcm)
+        energies = self.frame_energies(samples)
+        if len(energies) == 0:
+            return [(0, len(samples))]
+        return self._to_samples(self._limit_length(0, len(energies), energies), len(samples), len(energies))
+    
+    def speech_segments(self, pcm):
+        """
+        Split PCM bytes into speech segments
+        
+        Returns:
+        list: (start_sample, end_sample) pairs, in order; empty when no
+        frame counts as speech
+        """
+        samples = self.to_samples(pcm)
+        energies = self.frame_energies(samples)
+        speech = self.speech_mask(energies)
+        if not speech.any():
+            return []
+        
+        # Cut points in the middle of every long enough pause
+        cuts = [0]
+        run_start = None
+        for index, is_speech in enumerate(np.append(speech, True)):
+            if not is_speech and run_start is None:
+                run_start = index
+            elif is_speech and run_start is not None:
+                if index - run_start >= self.min_silence_frames and run_start > 0:
+                    cuts.append((run_start + index) // 2)
+                run_start = None
+        cuts.append(len(energies))
+        
+        segments = []
+        for start, end in zip(cuts, cuts[1:]):
+            segments.extend(self._limit_length(start, end, energies))
+        segments = self._merge_short(segments)
+        segments = [(start, end) for start, end in segments if speech[start:end].any()]
+        return self._to_samples(segments, len(samples), len(energies))
+    
+    def _to_samples(self, segments, total_samples, total_frames):
+        # Frame ranges to sample ranges; the last segment keeps the trailing partial frame
+        return [
+            (start * self.frame_length, total_samples if end == total_frames else end * self.frame_length)
+            for start, end in segments
+        ]
+    
+    def _limit_length(self, start, end, energies):
+        segments = []
+        while end - start > self.max_segment_frames:
+            # Cut at the quietest frame of the second half of the window
+            window_start = start + max(self.min_segment_frames, self.max_segment_frames // 2)
+            window_end = start + self.max_segment_frames
+            cut = window_start + int(np.argmin(energies[window_start:window_end]))
+            segments.append((start, cut))
+            start = cut
+        segments.append((start, end))
+        return segments
+    
+    def _merge_short(self, segments):
+        merged = []
+        for start, end in segments:
+            if (
+                merged
+                and (end - start < self.min_segment_frames or merged[-1][1] - merged[-1][0] < self.min_segment_frames)
+                and end - merged[-1][0] <= self.max_segment_frames
+            ):
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+
+class StreamingSegmenter:
+    """
+    Applies a SilenceSplitter to PCM arriving in chunks.
+    
+    Buffers audio and releases every segment except the last one, which may
+    still continue in the next chunk, until the buffer exceeds the maximum
+    segment length or the stream ends. Offsets are absolute sample positions
+    from the start of the stream.
+    
+    Silence between speech is dropped, but until the first speech is
+    detected the audio is kept and released in max-length pieces, so a
+    recording too quiet for the detector is still transcribed in full.
+    """
+    
+    def __init__(self, splitter):
+        self.splitter = splitter
+        self.buffer = b''
+        self.offset = 0
+        self.found_speech = False
+    
+    def feed(self, pcm):
+        """Add PCM bytes, return the finished segments as (start, end, pcm) tuples"""
+        self.buffer += pcm
+        segments = self.splitter.speech_segments(self.buffer)
+        max_samples = self.splitter.max_segment_frames * self.splitter.frame_length
+        
+        if not segments and not self.found_speech:
+            # No speech yet: release full-length pieces of the audio itself
+            finished = []
+            while len(self.buffer) // SAMPLE_WIDTH >= max_samples:
+                finished.append(self._segment(0, max_samples))
+                self._consume(max_samples)
+            return finished
+        self.found_speech = True
+        
+        finished = []
+        for start, end in segments[:-1]:
+            finished.append(self._segment(start, end))
+        
+        if segments:
+            last_start, last_end = segments[-1]
+            if len(self.buffer) // SAMPLE_WIDTH - last_start >= max_samples:
+                finished.append(self._segment(last_start, last_end))
+                consumed = last_end
+            else:
+                consumed = last_start
+        else:
+            # Silence only; keep a little context in case speech starts at the edge
+            consumed = max(0, len(self.buffer) // SAMPLE_WIDTH - self.splitter.frame_length * self.splitter.min_silence_frames)
+        
+        self._consume(consumed)
+        return finished
+    
+    def flush(self):
+        """Segments left in the buffer once the stream has ended"""
+        if self.found_speech:
+            # Trailing silence is dropped
+            segments = self.splitter.speech_segments(self.buffer)
+        else:
+            segments = self.splitter.split(self.buffer)
+        finished = [self._segment(start, end) for start, end in segments]
+        self._consume(len(self.buffer) // SAMPLE_WIDTH)
+        return finished
+    
+    def _segment(self, start, end):
+        return (self.offset + start, self.offset + end, self.buffer[start * SAMPLE_WIDTH:end * SAMPLE_WIDTH])
+    
+    def _consume(self, samples):
+        self.buffer = self.buffer[samples * SAMPLE_WIDTH:]
+        self.offset += samples
+
+
+class FixedSegmenter:
+    """Treats every streamed chunk as one segment (no voice activity detection)"""
+    
+    def __init__(self):
+        self.offset = 0
+    
+    def feed(self, pcm):
+        start = self.offset
+        self.offset += len(pcm) // SAMPLE_WIDTH
+        return [(start, self.offset, pcm)]
+    
+    def flush(self):
+        return []
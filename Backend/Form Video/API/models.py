@@ -1,6 +1,7 @@
 # api/models.py
 import uuid
 from django.db import models
+from django.utils import timezone
 
 class VideoSubmission(models.Model):
     # Status choices
@@ -16,22 +17,80 @@ class VideoSubmission(models.Model):
         (STATUS_FAILED, 'Failed'),
     ]
     
+    # Pipeline stages, in order. `stage` records the last stage that finished
+    # so a retried or re-enqueued pipeline resumes after it.
+    STAGE_QUEUED = 'queued'
+    STAGE_AUDIO_EXTRACTED = 'audio_extracted'
+    STAGE_TRANSCRIBED = 'transcribed'
+    STAGE_TRANSLATED = 'translated'
+    STAGE_FORM_EXTRACTED = 'form_extracted'
+    
+    STAGE_CHOICES = [
+        (STAGE_QUEUED, 'Queued'),
+        (STAGE_AUDIO_EXTRACTED, 'Audio extracted'),
+        (STAGE_TRANSCRIBED, 'Transcribed'),
+        (STAGE_TRANSLATED, 'Translated'),
+        (STAGE_FORM_EXTRACTED, 'Form extracted'),
+    ]
+    STAGE_ORDER = [choice[0] for choice in STAGE_CHOICES]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     video_file = models.FileField(upload_to='videos/%Y/%m/%d/')
     audio_file = models.FileField(upload_to='audio/%Y/%m/%d/', null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    form_type = models.CharField(max_length=50, default='personal_info')
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default=STAGE_QUEUED)
+    translated_text = models.TextField(blank=True, null=True)
+    # SHA-256 of the uploaded bytes and of the decoded audio (see ResultCacheEntry)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    audio_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Set when the results were copied from an earlier submission of the same media
+    cache_hit = models.CharField(max_length=10, blank=True, default='')
+    cached_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='cache_copies')
+    batch = models.ForeignKey('VideoBatch', on_delete=models.SET_NULL, null=True, blank=True, related_name='submissions')
+    # Times the sweeper re-enqueued the pipeline after it stalled
+    requeue_count = models.PositiveIntegerField(default=0)
+    # Per stage: duration, queue wait, attempt and time spent in spans such as
+    # model_load and inference (see services.tracing.StageTrace)
+    timings = models.JSONField(default=dict, blank=True)
     error_message = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Listing by status (keyset pagination on created_at, id)
+            models.Index(fields=['status', 'created_at', 'id'], name='video_status_created_idx'),
+            # Sweeping rows that stopped making progress
+            models.Index(fields=['status', 'updated_at'], name='video_status_updated_idx'),
+            # Metrics window (submissions updated recently, newest first)
+            models.Index(fields=['updated_at'], name='video_updated_idx'),
+        ]
+    
     def __str__(self):
         return f"Video {self.id}"
+    
+    def has_completed_stage(self, stage):
+        """True if the checkpointed stage is at or past the given stage"""
+        return self.STAGE_ORDER.index(self.stage) >= self.STAGE_ORDER.index(stage)
+
+class VideoBatch(models.Model):
+    """Videos submitted together; progress and results are reported for the whole batch"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    form_type = models.CharField(max_length=50, default='personal_info')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Batch {self.id}"
 
 class Transcription(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     video = models.OneToOneField(VideoSubmission, on_delete=models.CASCADE, related_name='transcription')
     text = models.TextField()
     language = models.CharField(max_length=10, default='en')
+    # Timed segments: [{"start": seconds, "end": seconds, "text": ...}]
+    segments = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -45,3 +104,78 @@ class FormData(models.Model):
     
     def __str__(self):
         return f"Form Data {self.id}"
+
+class ResultCacheEntry(models.Model):
+    """Points a media content hash and form type at the submission holding its results"""
+    KIND_VIDEO = 'video'
+    KIND_AUDIO = 'audio'
+    
+    KIND_CHOICES = [
+        (KIND_VIDEO, 'Video bytes'),
+        (KIND_AUDIO, 'Decoded audio'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    content_hash = models.CharField(max_length=64)
+    form_type = models.CharField(max_length=50)
+    source = models.ForeignKey(VideoSubmission, on_delete=models.CASCADE, related_name='cache_entries')
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'content_hash', 'form_type'], name='unique_result_cache_key'),
+        ]
+    
+    def __str__(self):
+        return f"Cached {self.kind} {self.content_hash[:12]} ({self.form_type})"
+
+class PipelineMetric(models.Model):
+    """
+    Cumulative value of one Prometheus series behind /api/metrics/, added to
+    by the workers as stages finish (see services.pipeline_metrics). Kept in
+    the database so every worker process on every host adds to the same
+    series and nothing resets when a process restarts.
+    """
+    name = models.CharField(max_length=100)
+    # Label text of the series, e.g. stage="translation",le="5.0"
+    series = models.CharField(max_length=255, blank=True, default='')
+    stage = models.CharField(max_length=50, blank=True, default='')
+    # Upper bound of a histogram bucket row; null for sums and counters
+    le = models.FloatField(null=True, blank=True)
+    value = models.FloatField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'series'], name='unique_pipeline_metric_series'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name}{{{self.series}}} = {self.value}"
+
+class UploadSession(models.Model):
+    """A resumable upload written chunk by chunk to its final location under MEDIA_ROOT"""
+    STATUS_OPEN = 'open'
+    STATUS_COMPLETED = 'completed'
+    
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_COMPLETED, 'Completed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    # Path relative to MEDIA_ROOT, in the same videos/%Y/%m/%d/ layout as VideoSubmission.video_file
+    file_path = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    # Bytes committed so far; the next chunk must start here
+    offset = models.BigIntegerField(default=0)
+    form_type = models.CharField(max_length=50, default='personal_info')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    video = models.OneToOneField(VideoSubmission, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.total_size})"
@@ -8,10 +8,16 @@ class VideoSubmissionSerializer(serializers.ModelSerializer):
         fields = ['id', 'video_file', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+class VideoSubmissionListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VideoSubmission
+        fields = ['id', 'status', 'stage', 'form_type', 'error_message', 'requeue_count', 'created_at', 'updated_at']
+        read_only_fields = fields
+
 class TranscriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transcription
-        fields = ['id', 'video', 'text', 'language', 'created_at']
+        fields = ['id', 'video', 'text', 'language', 'segments', 'created_at']
         read_only_fields = ['id', 'created_at']
 
 class FormDataSerializer(serializers.ModelSerializer):
@@ -26,5 +32,5 @@ class VideoSubmissionResponseSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = VideoSubmission
-        fields = ['id', 'video_file', 'status', 'created_at', 'transcription', 'form_data']
-        read_only_fields = ['id', 'created_at', 'status', 'transcription', 'form_data']
+        fields = ['id', 'video_file', 'status', 'created_at', 'timings', 'transcription', 'form_data']
+        read_only_fields = ['id', 'created_at', 'status', 'timings', 'transcription', 'form_data']
@@ -1,97 +1,449 @@
 # api/tasks.py
 import os
-from celery import shared_task
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from celery import shared_task, chain, group
+from celery.signals import worker_process_init
 from django.conf import settings
-from .models import VideoSubmission, Transcription, FormData
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from .models import VideoSubmission, Transcription, FormData, ResultCacheEntry
 from .services.audio_extractor import AudioExtractor
-from .services.transcription import WhisperTranscriptionService
+from .services.transcription import LocalWhisperBackend, WhisperTranscriptionService
 from .services.translation import IndicTranslationService
 from .services.text_analysis import LlamaAnalysisService
+from .services.model_registry import model_registry
+from .services.result_cache import ResultCache
+from .services.pipeline_metrics import MetricRecorder
+from .services.status_events import StatusEventBus, status_payload
+from .services.tracing import StageTrace, span
 from .forms_schema import get_form_schema
 
+# Services whose models can be made resident when a worker process starts
+PRELOADABLE_SERVICES = {
+    'translation': IndicTranslationService,
+    'llama': LlamaAnalysisService,
+    'whisper': LocalWhisperBackend,
+}
+
+@worker_process_init.connect
+def preload_models(**kwargs):
+    """
+    Load the configured models once per worker process, before any task runs,
+    so only process start-up pays the cold-start cost
+    """
+    for name in settings.PRELOAD_MODELS:
+        service_class = PRELOADABLE_SERVICES.get(name)
+        if service_class is None:
+            print(f"Unknown model in PRELOAD_MODELS: {name}")
+            continue
+        try:
+            service_class().warm_up()
+        except Exception as e:
+            # Leave it to lazy loading on the first task that needs it
+            print(f"Error preloading {name} model: {e}")
+    
+    for key, stats in model_registry.stats().items():
+        print(f"Resident model {key}: loaded in {stats['load_seconds']:.2f}s, "
+              f"{stats['rss_delta_bytes'] / 1e6:.1f} MB")
+
+def build_pipeline(video_id):
+    """
+    Build the staged processing chain for a submission.
+    
+    Each stage is its own task routed to its own queue (see CELERY_TASK_ROUTES)
+    and checkpoints its output on the VideoSubmission, so a retry only repeats
+    the stage that failed. With TRANSCRIPTION_STREAMING the transcription
+    stage decodes the audio itself, overlapping ffmpeg with transcription.
+    """
+    video_id = str(video_id)
+    stages = [
+        transcribe_audio_stage.si(video_id),
+        translate_transcript_stage.si(video_id),
+        extract_form_data_stage.si(video_id),
+    ]
+    if not settings.TRANSCRIPTION_STREAMING:
+        stages.insert(0, extract_audio_stage.si(video_id))
+    return chain(*stages)
+
+def start_pipeline(video_submission, form_type=None):
+    """Mark a submission as processing and enqueue its pipeline"""
+    if form_type is not None:
+        video_submission.form_type = form_type
+    video_submission.status = VideoSubmission.STATUS_PROCESSING
+    video_submission.save(update_fields=['form_type', 'status', 'updated_at'])
+    publish_status(video_submission)
+    
+    return build_pipeline(video_submission.id).apply_async()
+
+def start_batch_pipelines(video_ids):
+    """
+    Enqueue the pipelines of many submissions (already marked processing)
+    as one Celery group of chains. Every video moves through the stages on
+    its own, so one slow video never holds back the rest of the batch.
+    """
+    return group(build_pipeline(video_id) for video_id in video_ids).apply_async()
+
+def publish_status(video_submission):
+    """Push the submission's current status to clients waiting on its events"""
+    if not settings.STATUS_EVENTS_ENABLED:
+        return
+    
+    form_data = None
+    if video_submission.status == VideoSubmission.STATUS_COMPLETED:
+        form_data = FormData.objects.filter(video=video_submission).values_list('json_data', flat=True).first()
+    
+    try:
+        StatusEventBus().publish(video_submission.id, status_payload(video_submission, form_data))
+    except Exception as e:
+        # Clients can still fall back to polling the status endpoint
+        print(f"Error publishing status event: {e}")
+
+def _checkpoint(video_submission, stage, **fields):
+    """Record a finished stage (and the outputs it produced) on the submission"""
+    video_submission.stage = stage
+    for name, value in fields.items():
+        setattr(video_submission, name, value)
+    video_submission.save(update_fields=['stage', *fields, 'updated_at'])
+    publish_status(video_submission)
+
+def _load_for_stage(video_id, stage):
+    """
+    Fetch the submission for a stage, or None if the stage has nothing to do
+    (the pipeline already completed, or a previous run checkpointed this stage)
+    """
+    video_submission = VideoSubmission.objects.get(id=video_id)
+    if video_submission.status == VideoSubmission.STATUS_COMPLETED:
+        return None
+    if video_submission.has_completed_stage(stage):
+        return None
+    return video_submission
+
+def _record_metrics(record, *args):
+    """Add to the cumulative pipeline metrics; never fails the stage"""
+    try:
+        record(MetricRecorder(), *args)
+    except Exception as e:
+        print(f"Error recording pipeline metrics: {e}")
+
+def _trace_stage(task, video_submission, stage_name):
+    """
+    Trace of this attempt of a stage. Queue wait counts from the submission's
+    last change: the previous stage's checkpoint, or the pipeline being started
+    or re-enqueued.
+    """
+    return StageTrace(stage_name, queued_since=video_submission.updated_at, attempt=task.request.retries + 1)
+
+@contextmanager
+def _heartbeat(video_id):
+    """
+    Bump the submission's updated_at every SWEEP_HEARTBEAT_SECONDS while a
+    stage runs, so the sweeper never takes a long stage for a stalled one
+    """
+    stop = threading.Event()
+    
+    def beat():
+        try:
+            while not stop.wait(settings.SWEEP_HEARTBEAT_SECONDS):
+                try:
+                    VideoSubmission.objects.filter(
+                        id=video_id, status=VideoSubmission.STATUS_PROCESSING
+                    ).update(updated_at=timezone.now())
+                except Exception as e:
+                    print(f"Error updating heartbeat of {video_id}: {e}")
+        finally:
+            # The thread has its own database connection
+            connection.close()
+    
+    thread = threading.Thread(target=beat, name=f'heartbeat-{video_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def _complete_from_cache(video_submission, copy_transcription):
+    """Complete the submission from an earlier one with the same audio, if any"""
+    result_cache = ResultCache()
+    entry = result_cache.lookup(
+        ResultCacheEntry.KIND_AUDIO, video_submission.audio_hash, video_submission.form_type
+    )
+    if entry is None or entry.source_id == video_submission.id:
+        return False
+    
+    result_cache.apply(entry, video_submission, copy_transcription=copy_transcription)
+    publish_status(video_submission)
+    print(f"Reused results of {entry.source_id} for {video_submission.id} (same audio)")
+    return True
+
+def _retry_stage(task, video_id, stage_name, exc):
+    """Retry a failed stage, marking the submission failed on the last attempt"""
+    error_message = f"Error processing video ({stage_name}): {str(exc)}"
+    print(error_message)
+    
+    final = task.request.retries >= task.max_retries
+    _record_metrics(MetricRecorder.record_failure, stage_name.replace(' ', '_'), final)
+    
+    # Update video status to failed if this is the final retry
+    if final:
+        VideoSubmission.objects.filter(id=video_id).update(
+            status=VideoSubmission.STATUS_FAILED,
+            error_message=error_message,
+            updated_at=timezone.now()
+        )
+        publish_status(VideoSubmission.objects.get(id=video_id))
+    
+    # Retry only this stage; the rest of the chain runs once it succeeds
+    raise task.retry(exc=exc)
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
 def process_video_submission(self, video_id, form_type='personal_info'):
     """
-    Process a video submission asynchronously with status tracking
+    Process a video submission asynchronously with status tracking.
+    
+    Kept as the entry point for callers that enqueue a single task; it is
+    replaced by the staged pipeline.
     """
+    video_submission = VideoSubmission.objects.get(id=video_id)
+    video_submission.form_type = form_type
+    video_submission.status = VideoSubmission.STATUS_PROCESSING
+    video_submission.save(update_fields=['form_type', 'status', 'updated_at'])
+    publish_status(video_submission)
+    
+    return self.replace(build_pipeline(video_id))
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def extract_audio_stage(self, video_id):
+    """Stage 1: extract the audio track with ffmpeg (CPU bound)"""
     try:
-        # Get the video submission
-        video_submission = VideoSubmission.objects.get(id=video_id)
+        video_submission = _load_for_stage(video_id, VideoSubmission.STAGE_AUDIO_EXTRACTED)
+        if video_submission is None:
+            return video_id
         
-        # Update status to processing
-        video_submission.status = VideoSubmission.STATUS_PROCESSING
-        video_submission.save(update_fields=['status'])
+        with _trace_stage(self, video_submission, 'audio_extraction') as trace, _heartbeat(video_id):
+            # Get the video file path
+            video_path = os.path.join(settings.MEDIA_ROOT, video_submission.video_file.name)
+            
+            # One decode of the video gives the MP3 and the hash of its PCM
+            # (the streaming path hashes the same PCM); the PCM is kept when
+            # transcription would otherwise decode the MP3 again
+            with span('ffmpeg'):
+                audio_path, audio_hash = AudioExtractor.extract_and_hash(
+                    video_path, keep_pcm=WhisperTranscriptionService.uses_pcm()
+                )
         
-        # Get the video file path
-        video_path = os.path.join(settings.MEDIA_ROOT, video_submission.video_file.name)
+        _checkpoint(
+            video_submission, VideoSubmission.STAGE_AUDIO_EXTRACTED,
+            audio_file=audio_path, audio_hash=audio_hash, timings=trace.merge_into(video_submission.timings)
+        )
+        _record_metrics(MetricRecorder.record_stage, trace)
         
-        # 1. Extract audio from video
-        audio_extractor = AudioExtractor()
-        audio_path = audio_extractor.extract_audio(video_path)
+        # The same recording was processed before (e.g. re-encoded upload):
+        # reuse its results and let the remaining stages skip
+        if _complete_from_cache(video_submission, copy_transcription=True):
+            AudioExtractor.discard_pcm(os.path.join(settings.MEDIA_ROOT, audio_path))
+        return video_id
+    
+    except Exception as e:
+        _retry_stage(self, video_id, 'audio extraction', e)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def transcribe_audio_stage(self, video_id):
+    """
+    Stage 2: transcribe the audio with Whisper (I/O bound). Decodes the audio
+    itself, streaming, when stage 1 was skipped.
+    """
+    try:
+        video_submission = _load_for_stage(video_id, VideoSubmission.STAGE_TRANSCRIBED)
+        if video_submission is None:
+            return video_id
         
-        # Update the video submission with the audio path
-        video_submission.audio_file = audio_path
-        video_submission.save(update_fields=['audio_file'])
+        with _trace_stage(self, video_submission, 'transcription') as trace, _heartbeat(video_id):
+            transcription_service = WhisperTranscriptionService()
+            
+            if video_submission.has_completed_stage(VideoSubmission.STAGE_AUDIO_EXTRACTED):
+                with span('inference'):
+                    transcript_text, detected_language, segments = transcription_service.transcribe(
+                        video_submission.audio_file.name, return_segments=True
+                    )
+                audio_stream = None
+            else:
+                # Streaming: transcribe segments while ffmpeg is still decoding,
+                # saving the MP3 copy from the same ffmpeg run (so ffmpeg time
+                # overlaps inference and is not split out)
+                video_path = os.path.join(settings.MEDIA_ROOT, video_submission.video_file.name)
+                audio_stream = AudioExtractor.stream_audio(
+                    video_path, chunk_seconds=settings.TRANSCRIPTION_CHUNK_SECONDS
+                )
+                
+                def save_partial(text, language):
+                    # Partial transcript is readable while later chunks are processed
+                    Transcription.objects.update_or_create(
+                        video=video_submission,
+                        defaults={'text': text, 'language': language or 'unknown'}
+                    )
+                    # Changes the submission's ETag, so pollers see the new text
+                    VideoSubmission.objects.filter(id=video_submission.id).update(updated_at=timezone.now())
+                
+                with span('inference'):
+                    transcript_text, detected_language, segments = transcription_service.transcribe_stream(
+                        audio_stream, on_text=save_partial, return_segments=True
+                    )
         
-        # 2. Transcribe the audio
-        transcription_service = WhisperTranscriptionService()
-        transcript_text, detected_language = transcription_service.transcribe(audio_path)
+        if audio_stream is not None:
+            _checkpoint(
+                video_submission, VideoSubmission.STAGE_AUDIO_EXTRACTED,
+                audio_file=audio_stream.audio_path, audio_hash=audio_stream.digest
+            )
         
-        # Save the transcription
-        transcription = Transcription.objects.create(
+        Transcription.objects.update_or_create(
             video=video_submission,
-            text=transcript_text,
-            language=detected_language
+            defaults={'text': transcript_text, 'language': detected_language, 'segments': segments}
         )
         
-        # 3. Translate if needed (if not in English)
-        if detected_language != 'en':
-            translation_service = IndicTranslationService()
-            translated_text = translation_service.translate(
-                transcript_text, 
-                source_lang=detected_language,
-                target_lang='en'
-            )
-        else:
-            translated_text = transcript_text
+        _checkpoint(video_submission, VideoSubmission.STAGE_TRANSCRIBED, timings=trace.merge_into(video_submission.timings))
+        _record_metrics(MetricRecorder.record_stage, trace)
+        if audio_stream is None:
+            AudioExtractor.discard_pcm(os.path.join(settings.MEDIA_ROOT, video_submission.audio_file.name))
         
-        # 4. Get the appropriate form schema
-        form_schema = get_form_schema(form_type)
+        # When streaming, the audio hash is only known now; translation and
+        # form extraction can still be skipped
+        _complete_from_cache(video_submission, copy_transcription=False)
+        return video_id
+    
+    except Exception as e:
+        _retry_stage(self, video_id, 'transcription', e)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def translate_transcript_stage(self, video_id):
+    """Stage 3: translate the transcript to English with IndicTrans2 if needed"""
+    try:
+        video_submission = _load_for_stage(video_id, VideoSubmission.STAGE_TRANSLATED)
+        if video_submission is None:
+            return video_id
         
-        # 5. Extract form data using Llama
-        analysis_service = LlamaAnalysisService()
-        form_data_json = analysis_service.extract_form_data(
-            translated_text,
-            form_schema=form_schema
+        with _trace_stage(self, video_submission, 'translation') as trace, _heartbeat(video_id):
+            transcription = video_submission.transcription
+            if transcription.language != 'en':
+                translation_service = IndicTranslationService()
+                with span('inference'):
+                    translated_text = translation_service.translate(
+                        transcription.text, 
+                        source_lang=transcription.language,
+                        target_lang='en'
+                    )
+            else:
+                translated_text = transcription.text
+        
+        _checkpoint(
+            video_submission, VideoSubmission.STAGE_TRANSLATED,
+            translated_text=translated_text, timings=trace.merge_into(video_submission.timings)
         )
+        _record_metrics(MetricRecorder.record_stage, trace)
+        return video_id
+    
+    except Exception as e:
+        _retry_stage(self, video_id, 'translation', e)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def extract_form_data_stage(self, video_id):
+    """Stage 4: extract the form fields with Llama and complete the submission"""
+    try:
+        video_submission = _load_for_stage(video_id, VideoSubmission.STAGE_FORM_EXTRACTED)
+        if video_submission is None:
+            return video_id
+        
+        form_type = video_submission.form_type
+        form_schema = get_form_schema(form_type)
+        
+        with _trace_stage(self, video_submission, 'form_extraction') as trace, _heartbeat(video_id):
+            analysis_service = LlamaAnalysisService()
+            with span('inference'):
+                form_data_json = analysis_service.extract_form_data(
+                    video_submission.translated_text,
+                    form_schema=form_schema,
+                    form_type=form_type
+                )
         
         # Add metadata to the form data
         form_data_json['form_type'] = form_type
-        form_data_json['original_language'] = detected_language
+        form_data_json['original_language'] = video_submission.transcription.language
         
-        # 6. Save the form data
-        form_data = FormData.objects.create(
+        FormData.objects.update_or_create(
             video=video_submission,
-            json_data=form_data_json
+            defaults={'json_data': form_data_json}
         )
         
         # Update status to completed
-        video_submission.status = VideoSubmission.STATUS_COMPLETED
-        video_submission.save(update_fields=['status'])
-        
-        return str(video_submission.id)
+        _checkpoint(
+            video_submission, VideoSubmission.STAGE_FORM_EXTRACTED,
+            status=VideoSubmission.STATUS_COMPLETED, timings=trace.merge_into(video_submission.timings)
+        )
+        _record_metrics(MetricRecorder.record_stage, trace)
         
+        try:
+            ResultCache().store(video_submission)
+        except Exception as e:
+            # The results are saved; only later duplicates miss out
+            print(f"Error updating result cache: {e}")
+        return video_id
+    
     except Exception as e:
-        # Log the error
-        error_message = f"Error processing video: {str(e)}"
-        print(error_message)
+        _retry_stage(self, video_id, 'form extraction', e)
+
+@shared_task
+def sweep_stuck_submissions():
+    """
+    Re-enqueue pipelines that stopped making progress (a worker died, a
+    message was lost) from their last checkpointed stage.
+    
+    A submission counts as stuck when it is pending or processing and its
+    updated_at is older than SWEEP_STUCK_AFTER_SECONDS. Stage checkpoints
+    bump updated_at, and so does a heartbeat every SWEEP_HEARTBEAT_SECONDS
+    while a stage runs, so a long stage is never re-enqueued while its
+    worker is alive. The lookup is a range scan on the
+    (status, updated_at) index, oldest first. Each row is claimed with a
+    conditional update so overlapping sweeps never enqueue it twice. After
+    SWEEP_MAX_REQUEUES attempts the submission is marked failed instead.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.SWEEP_STUCK_AFTER_SECONDS)
+    stuck = (
+        VideoSubmission.objects
+        .filter(
+            status__in=[VideoSubmission.STATUS_PENDING, VideoSubmission.STATUS_PROCESSING],
+            updated_at__lt=cutoff
+        )
+        .order_by('updated_at')
+        .values_list('id', 'updated_at', 'requeue_count')[:settings.SWEEP_BATCH_SIZE]
+    )
+    
+    requeued, failed = 0, 0
+    for video_id, updated_at, requeue_count in list(stuck):
+        claim = VideoSubmission.objects.filter(id=video_id, updated_at=updated_at)
         
-        # Update video status to failed if this is the final retry
-        if self.request.retries >= self.max_retries:
-            VideoSubmission.objects.filter(id=video_id).update(
+        if requeue_count >= settings.SWEEP_MAX_REQUEUES:
+            if claim.update(
                 status=VideoSubmission.STATUS_FAILED,
-                error_message=error_message
-            )
+                error_message=f"Processing stalled {requeue_count + 1} times",
+                updated_at=timezone.now()
+            ):
+                failed += 1
+                publish_status(VideoSubmission.objects.get(id=video_id))
+            continue
         
-        # Retry the task
-        raise self.retry(exc=e)
+        if claim.update(
+            status=VideoSubmission.STATUS_PROCESSING,
+            requeue_count=F('requeue_count') + 1,
+            updated_at=timezone.now()
+        ):
+            # Stages that already checkpointed are skipped
+            build_pipeline(video_id).apply_async()
+            _record_metrics(MetricRecorder.record_requeue)
+            requeued += 1
+    
+    if requeued or failed:
+        print(f"Sweeper re-enqueued {requeued} stuck submissions, marked {failed} failed")
+    return {'requeued': requeued, 'failed': failed}
@@ -0,0 +1,128 @@
+# api/tests.py
+import time
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import tasks
+from .models import VideoSubmission, Transcription
+from .services.batching import MicroBatcher
+from .services.tracing import StageTrace, span
+from .services.vad import SilenceSplitter, StreamingSegmenter
+
+@override_settings(
+    SWEEP_STUCK_AFTER_SECONDS=1,
+    SWEEP_HEARTBEAT_SECONDS=0.05,
+    STATUS_EVENTS_ENABLED=False
+)
+class SweepStuckSubmissionsTests(TransactionTestCase):
+    # TransactionTestCase: the heartbeat writes from its own thread and connection
+
+    def make_submission(self, stage):
+        video_submission = VideoSubmission.objects.create(
+            video_file='videos/video.mp4',
+            status=VideoSubmission.STATUS_PROCESSING,
+            stage=stage,
+            translated_text='My name is Asha'
+        )
+        Transcription.objects.create(video=video_submission, text='My name is Asha', language='en')
+        self.make_stale(video_submission.id)
+        return video_submission
+
+    def make_stale(self, video_id):
+        VideoSubmission.objects.filter(id=video_id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def test_stalled_submission_is_requeued(self):
+        video_submission = self.make_submission(VideoSubmission.STAGE_TRANSLATED)
+
+        with mock.patch.object(tasks, 'build_pipeline') as build_pipeline:
+            result = tasks.sweep_stuck_submissions()
+
+        self.assertEqual(result, {'requeued': 1, 'failed': 0})
+        build_pipeline.assert_called_once_with(video_submission.id)
+
+    def test_slow_stage_in_flight_is_not_requeued(self):
+        video_submission = self.make_submission(VideoSubmission.STAGE_TRANSLATED)
+        sweeps = []
+
+        def slow_extraction(transcript, form_schema=None, form_type=None):
+            # The stage started long ago and is still running
+            self.make_stale(video_submission.id)
+            time.sleep(0.3)
+            sweeps.append(tasks.sweep_stuck_submissions())
+            return {'name': 'Asha'}
+
+        with mock.patch.object(tasks, 'build_pipeline') as build_pipeline, \
+                mock.patch.object(tasks, 'LlamaAnalysisService') as service_class, \
+                mock.patch.object(tasks, 'ResultCache'):
+            service_class.return_value.extract_form_data.side_effect = slow_extraction
+            tasks.extract_form_data_stage.apply(args=[str(video_submission.id)])
+
+        self.assertEqual(sweeps, [{'requeued': 0, 'failed': 0}])
+        build_pipeline.assert_not_called()
+        video_submission.refresh_from_db()
+        self.assertEqual(video_submission.status, VideoSubmission.STATUS_COMPLETED)
+        self.assertEqual(video_submission.requeue_count, 0)
+
+class StageTraceTests(SimpleTestCase):
+
+    def test_model_load_on_batcher_thread_counts_towards_stage(self):
+        def process_batch(items):
+            # Lazy model load inside the batcher's own thread
+            with span('model_load'):
+                time.sleep(0.2)
+            return items
+
+        batcher = MicroBatcher(process_batch, max_wait=0.01)
+        with StageTrace('form_extraction') as trace:
+            with span('inference'):
+                batcher.process('prompt')
+
+        self.assertGreaterEqual(trace.spans['model_load'], 0.2)
+        # Taken out of the inference span the stage thread was waiting in
+        self.assertLess(trace.spans['inference'], 0.1)
+
+class SilenceSplitterTests(SimpleTestCase):
+
+    @staticmethod
+    def speech_like(amplitude, seconds=70):
+        # 2.5 s bursts of tone separated by 1.5 s pauses, 16 kHz mono
+        t = np.arange(16000 * seconds) / 16000
+        signal = amplitude * np.sin(2 * np.pi * 220 * t) * ((t % 4) < 2.5)
+        return signal.astype(np.int16).tobytes()
+
+    def test_speech_is_split_at_pauses(self):
+        segments = SilenceSplitter().split(self.speech_like(3000))
+
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(segments[0][0], 0)
+
+    def test_low_amplitude_speech_is_kept_whole(self):
+        pcm = self.speech_like(100)
+        splitter = SilenceSplitter()
+
+        self.assertEqual(splitter.speech_segments(pcm), [])
+        segments = splitter.split(pcm)
+        # All of the audio, in pieces no longer than a Whisper window
+        self.assertEqual(segments[0][0], 0)
+        self.assertEqual(segments[-1][1], len(pcm) // 2)
+        for (_, end), (start, _) in zip(segments, segments[1:]):
+            self.assertEqual(end, start)
+        for start, end in segments:
+            self.assertLessEqual(end - start, 30 * 16000)
+
+    def test_low_amplitude_speech_is_kept_when_streaming(self):
+        pcm = self.speech_like(100)
+        segmenter = StreamingSegmenter(SilenceSplitter())
+        chunk = 5 * 16000 * 2
+
+        segments = []
+        for start in range(0, len(pcm), chunk):
+            segments.extend(segmenter.feed(pcm[start:start + chunk]))
+        segments.extend(segmenter.flush())
+
+        self.assertEqual(b''.join(segment[2] for segment in segments), pcm)
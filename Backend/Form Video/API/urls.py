@@ -3,11 +3,26 @@ from django.urls import path
 from .views import (
     VideoSubmissionView, 
     VideoSubmissionDetailView, 
-    VideoProcessingStatusView
+    VideoProcessingStatusView,
+    VideoStatusEventsView,
+    ResultCacheStatsView,
+    TranslationMemoryStatsView,
+    PipelineMetricsView,
+    UploadSessionCreateView,
+    UploadSessionView,
+    VideoBatchView
 )
 
 urlpatterns = [
     path('videos/', VideoSubmissionView.as_view(), name='video-upload'),
     path('videos/<uuid:pk>/', VideoSubmissionDetailView.as_view(), name='video-detail'),
     path('videos/<uuid:pk>/status/', VideoProcessingStatusView.as_view(), name='video-status'),
+    path('videos/<uuid:pk>/events/', VideoStatusEventsView.as_view(), name='video-status-events'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-create'),
+    path('uploads/<uuid:pk>/', UploadSessionView.as_view(), name='upload-detail'),
+    path('batches/', VideoBatchView.as_view(), name='batch-create'),
+    path('batches/<uuid:pk>/', VideoBatchView.as_view(), name='batch-detail'),
+    path('cache/stats/', ResultCacheStatsView.as_view(), name='result-cache-stats'),
+    path('translation-memory/stats/', TranslationMemoryStatsView.as_view(), name='translation-memory-stats'),
+    path('metrics/', PipelineMetricsView.as_view(), name='pipeline-metrics'),
 ]
@@ -1,14 +1,58 @@
 # api/views.py
+import json
+import os
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import generics, status
+from rest_framework.pagination import CursorPagination
 from rest_framework.views import APIView
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
-from .models import VideoSubmission
-from .serializers import VideoSubmissionSerializer, VideoSubmissionResponseSerializer
-from .tasks import process_video_submission
+from rest_framework.utils.encoders import JSONEncoder
+from .models import VideoSubmission, ResultCacheEntry, UploadSession, VideoBatch
+from .serializers import VideoSubmissionSerializer, VideoSubmissionResponseSerializer, VideoSubmissionListSerializer
+from .tasks import start_pipeline, start_batch_pipelines, publish_status
+from .services.result_cache import ResultCache, hash_uploaded_file
+from .services.translation_memory import get_translation_memory
+from .services.pipeline_metrics import PipelineMetrics
+from .services.status_events import StatusEventBus, status_payload, TERMINAL_STATUSES
+from .services.uploads import ChunkedUploadStore, UploadOffsetMismatch
 
-class VideoSubmissionView(generics.CreateAPIView):
+class VideoSubmissionPagination(CursorPagination):
+    """
+    Keyset pagination: each page continues after the (created_at, id) of the
+    previous one, so deep pages cost the same as the first
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+class VideoSubmissionView(generics.ListCreateAPIView):
+    """
+    POST uploads a video. GET lists submissions, newest first, optionally
+    filtered with ?status=pending|processing|completed|failed; the
+    (status, created_at, id) index serves both the filter and the order.
+    """
     queryset = VideoSubmission.objects.all()
     serializer_class = VideoSubmissionSerializer
+    pagination_class = VideoSubmissionPagination
+    
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return VideoSubmissionListSerializer
+        return VideoSubmissionSerializer
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        return queryset
     
     def create(self, request, *args, **kwargs):
         # Get form type from request data (default to personal_info)
@@ -17,46 +61,526 @@ class VideoSubmissionView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Save the video submission
-        video_submission = serializer.save()
+        # Identical bytes with the same form type were processed before:
+        # reuse those results instead of queueing the pipeline again
+        result_cache = ResultCache()
+        content_hash = hash_uploaded_file(serializer.validated_data['video_file'])
+        entry = result_cache.lookup(ResultCacheEntry.KIND_VIDEO, content_hash, form_type)
+        if entry is not None:
+            # Point at the stored copy rather than writing the same file again
+            video_submission = serializer.save(
+                video_file=entry.source.video_file.name,
+                content_hash=content_hash,
+                audio_hash=entry.source.audio_hash,
+                form_type=form_type
+            )
+        else:
+            # Save the video submission
+            video_submission = serializer.save(content_hash=content_hash)
         
-        # Process the video in the background
-        process_video_submission.delay(str(video_submission.id), form_type)
+        return _submit(video_submission, form_type, entry)
+
+def _submit(video_submission, form_type, entry=None):
+    """Complete a new submission from a result cache entry, or start its pipeline"""
+    if entry is not None:
+        ResultCache().apply(entry, video_submission)
+        publish_status(video_submission)
         
-        # Return a response immediately
         return Response({
             'id': video_submission.id,
-            'message': 'Video submitted successfully. Processing has started.',
-            'status': 'processing'
-        }, status=status.HTTP_202_ACCEPTED)
+            'message': 'This video was already processed. Results are available.',
+            'status': video_submission.status,
+            'cached_from': entry.source_id
+        }, status=status.HTTP_200_OK)
+    
+    # Process the video in the background, one queued task per stage
+    start_pipeline(video_submission, form_type)
+    
+    # Return a response immediately
+    return Response({
+        'id': video_submission.id,
+        'message': 'Video submitted successfully. Processing has started.',
+        'status': 'processing'
+    }, status=status.HTTP_202_ACCEPTED)
+
+def _conditional_response(request, video, build_response):
+    """
+    Answer a conditional GET with 304, or build the full response, with
+    validators derived from updated_at (which every stage and result bumps)
+    """
+    etag = f'"{video.id.hex}-{video.updated_at.timestamp():.6f}"'
+    last_modified = int(video.updated_at.timestamp())
+    
+    response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_response()
+    
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Clients may keep the response but must revalidate it on every poll
+    response['Cache-Control'] = 'no-cache'
+    return response
 
 class VideoSubmissionDetailView(generics.RetrieveAPIView):
-    queryset = VideoSubmission.objects.all()
+    # The nested transcription and form data come from the same joined query
+    queryset = VideoSubmission.objects.select_related('transcription', 'form_data')
     serializer_class = VideoSubmissionResponseSerializer
+    
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return _conditional_response(
+            request, instance, lambda: Response(self.get_serializer(instance).data)
+        )
+
+def _status_video(pk):
+    """A submission and its form data in one query; raises VideoSubmission.DoesNotExist"""
+    return VideoSubmission.objects.select_related('form_data').get(pk=pk)
+
+def _status_of(video):
+    # Check if form data is available
+    form_data = None
+    if hasattr(video, 'form_data'):
+        form_data = video.form_data.json_data
+    
+    return status_payload(video, form_data)
+
+def _current_status(pk):
+    """Status payload read from the database; raises VideoSubmission.DoesNotExist"""
+    return _status_of(_status_video(pk))
+
+def _event_id(value):
+    """Event id a client has already seen (0 for none); raises ValueError if it is not a non-negative integer"""
+    event_id = int(value or 0)
+    if event_id < 0:
+        raise ValueError(f"Invalid event id: {value}")
+    return event_id
 
 class VideoProcessingStatusView(APIView):
+    """
+    Current status of a submission.
+    
+    With ?wait=<seconds> this is a long poll: the request returns as soon as
+    an event newer than ?after=<event_id> is published (immediately if one
+    already was), or with the current status once the wait is over.
+    """
+    
     def get(self, request, pk, format=None):
         try:
-            video = VideoSubmission.objects.get(pk=pk)
-            
-            # Check if form data is available
-            form_data = None
-            if hasattr(video, 'form_data'):
-                form_data = video.form_data.json_data
-            
-            # Return status information
-            return Response({
-                'id': video.id,
-                'status': video.status,
-                'created_at': video.created_at,
-                'updated_at': video.updated_at,
-                'error_message': video.error_message,
-                'form_data_available': form_data is not None,
-                'form_data': form_data
-            })
+            wait = float(request.query_params.get('wait', 0))
+            if wait > 0 and settings.STATUS_EVENTS_ENABLED:
+                event = self._wait_for_event(pk, wait, _event_id(request.query_params.get('after')))
+                if event is not None:
+                    return Response(event)
             
+            # Return status information, or 304 if the client's copy is current
+            video = _status_video(pk)
+            return _conditional_response(request, video, lambda: Response(_status_of(video)))
+        
+        except ValueError:
+            return Response(
+                {'error': 'wait and after must be numbers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        except VideoSubmission.DoesNotExist:
+            return Response(
+                {'error': 'Video submission not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+    
+    @staticmethod
+    def _wait_for_event(pk, wait, after):
+        timeout = min(wait, settings.STATUS_LONG_POLL_MAX_WAIT)
+        try:
+            for event in StatusEventBus().listen(pk, after=after, timeout=timeout):
+                return event
+        except Exception as e:
+            # Redis unavailable: answer from the database instead
+            print(f"Error waiting for status event: {e}")
+        return None
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients ask for text/event-stream; only error responses go through render()"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: error\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n".encode()
+
+class VideoStatusEventsView(APIView):
+    """
+    Server-sent events stream of a submission's status changes.
+    
+    Sends the current status first, then one event per stage until the
+    submission completes or fails. Reconnecting clients send Last-Event-ID
+    and only receive newer events.
+    """
+    
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+    
+    def get(self, request, pk, format=None):
+        try:
+            after = _event_id(request.headers.get('Last-Event-ID') or request.query_params.get('after'))
+        except ValueError:
+            return Response(
+                {'error': 'Last-Event-ID and after must be event ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        bus = StatusEventBus() if settings.STATUS_EVENTS_ENABLED else None
+        
+        retained = None
+        if bus is not None:
+            try:
+                retained = bus.last(pk)
+            except Exception as e:
+                # Redis unavailable: send the current status and end the stream
+                print(f"Error reading status events: {e}")
+                bus = None
+        
+        # The latest event is retained in Redis; the database is only read
+        # when there is none yet (or it expired)
+        initial = None
+        try:
+            if retained is None:
+                initial = _current_status(pk)
         except VideoSubmission.DoesNotExist:
             return Response(
                 {'error': 'Video submission not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        response = StreamingHttpResponse(self._stream(bus, pk, after, initial), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop reverse proxies (nginx) from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    @staticmethod
+    def _format(event):
+        data = json.dumps(event, cls=JSONEncoder)
+        return f"id: {event.get('event_id', 0)}\nevent: status\ndata: {data}\n\n"
+    
+    def _stream(self, bus, pk, after, initial):
+        if initial is not None:
+            yield self._format(initial)
+            if initial['status'] in TERMINAL_STATUSES:
+                return
+            if bus is None:
+                # Nothing will be pushed: tell the client to poll instead
+                # of reconnecting
+                yield f"event: error\ndata: {json.dumps({'error': 'Status events unavailable'})}\n\n"
+                return
+        
+        try:
+            for event in bus.listen(pk, after=after, heartbeat=settings.STATUS_EVENTS_HEARTBEAT_SECONDS):
+                # None is a keep-alive comment while nothing happens
+                yield ': keep-alive\n\n' if event is None else self._format(event)
+        except Exception as e:
+            print(f"Error streaming status events: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Status events unavailable'})}\n\n"
+
+class ResultCacheStatsView(APIView):
+    def get(self, request, format=None):
+        # Hit rates of the content-addressed result cache
+        return Response(ResultCache().stats())
+
+class TranslationMemoryStatsView(APIView):
+    def get(self, request, format=None):
+        # Hits and misses of the translation memory, summed over the workers
+        # that share its file ('process' is this web process only)
+        if not settings.TRANSLATION_MEMORY_ENABLED:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **get_translation_memory().stats()})
+
+class PipelineMetricsView(APIView):
+    def get(self, request, format=None):
+        # Prometheus scrape target: stage durations, queue wait, retries
+        return HttpResponse(PipelineMetrics().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _upload_state(session):
+    return {
+        'id': session.id,
+        'offset': session.offset,
+        'size': session.total_size,
+        'status': session.status,
+        'video_id': session.video_id
+    }
+
+class UploadSessionCreateView(APIView):
+    """
+    Start a resumable upload: POST {"filename", "size", "form_type"}.
+    
+    Chunks are then sent with PATCH /api/uploads/<id>/ (raw bytes, with an
+    Upload-Offset header); HEAD on the same URL returns the committed offset
+    to resume from. Processing starts when the last chunk is committed.
+    """
+    
+    def post(self, request, format=None):
+        try:
+            size = int(request.data.get('size', 0))
+            session = ChunkedUploadStore().create(
+                request.data.get('filename') or 'video.mp4',
+                size,
+                request.data.get('form_type', 'personal_info')
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(_upload_state(session), status=status.HTTP_201_CREATED)
+
+class UploadSessionView(APIView):
+    # The body of a PATCH is raw file data, read from the request stream
+    parser_classes = []
+    
+    def _get_session(self, pk):
+        try:
+            return UploadSession.objects.get(pk=pk)
+        except UploadSession.DoesNotExist:
+            return None
+    
+    def head(self, request, pk, format=None):
+        session = self._get_session(pk)
+        if session is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        
+        response = Response(status=status.HTTP_200_OK)
+        response['Upload-Offset'] = str(session.offset)
+        response['Upload-Length'] = str(session.total_size)
+        response['Cache-Control'] = 'no-store'
+        return response
+    
+    def get(self, request, pk, format=None):
+        session = self._get_session(pk)
+        if session is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_upload_state(session))
+    
+    def patch(self, request, pk, format=None):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            # Without Content-Length nothing is read from the body
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'An Upload-Offset header is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        store = ChunkedUploadStore()
+        try:
+            session = store.append(pk, offset, request.stream, length)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        except UploadOffsetMismatch as e:
+            # The client is out of sync (e.g. a retried chunk): resume from here
+            response = Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+            response['Upload-Offset'] = str(e.offset)
+            return response
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if session.offset == session.total_size:
+            return self._complete(store, session)
+        
+        response = Response(_upload_state(session))
+        response['Upload-Offset'] = str(session.offset)
+        return response
+    
+    def _complete(self, store, session):
+        """Turn the finished upload into a submission and start processing it"""
+        content_hash = store.content_hash(session)
+        entry = ResultCache().lookup(ResultCacheEntry.KIND_VIDEO, content_hash, session.form_type)
+        
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if session.status == UploadSession.STATUS_COMPLETED:
+                response = Response({
+                    'id': session.video_id,
+                    'message': 'Upload already completed.',
+                    'status': session.video.status if session.video else None,
+                    'upload': _upload_state(session)
+                })
+                response['Upload-Offset'] = str(session.offset)
+                return response
+            
+            video_file = session.file_path
+            if entry is not None:
+                # Keep one copy of identical videos
+                default_storage.delete(session.file_path)
+                video_file = entry.source.video_file.name
+            
+            video_submission = VideoSubmission.objects.create(
+                video_file=video_file,
+                content_hash=content_hash,
+                audio_hash=entry.source.audio_hash if entry is not None else '',
+                form_type=session.form_type
+            )
+            session.status = UploadSession.STATUS_COMPLETED
+            session.video = video_submission
+            session.save(update_fields=['status', 'video', 'updated_at'])
+        
+        response = _submit(video_submission, session.form_type, entry)
+        response.data['upload'] = _upload_state(session)
+        response['Upload-Offset'] = str(session.offset)
+        return response
+
+def _manifest_items(manifest, form_type):
+    """
+    Resolve a batch manifest: a list of {"path": ..., "form_type": ...} with
+    paths relative to BATCH_IMPORT_DIR under MEDIA_ROOT
+    
+    Returns:
+    list: (video_file name, form_type) pairs
+    """
+    if isinstance(manifest, str):
+        manifest = json.loads(manifest)
+    
+    import_root = os.path.realpath(os.path.join(settings.MEDIA_ROOT, settings.BATCH_IMPORT_DIR))
+    items = []
+    for item in manifest:
+        if isinstance(item, str):
+            item = {'path': item}
+        full_path = os.path.realpath(os.path.join(import_root, item['path']))
+        if not full_path.startswith(import_root + os.sep) or not os.path.isfile(full_path):
+            raise ValueError(f"Not a file in the import folder: {item['path']}")
+        items.append((
+            os.path.relpath(full_path, os.path.realpath(settings.MEDIA_ROOT)),
+            item.get('form_type', form_type)
+        ))
+    return items
+
+def _batch_status(pk):
+    """
+    Progress and results of every video in a batch, read with one query
+    
+    Returns:
+    dict or None: None if the batch does not exist
+    """
+    submissions = list(
+        VideoSubmission.objects
+        .filter(batch_id=pk)
+        .select_related('batch', 'form_data')
+        .order_by('created_at')
+    )
+    if submissions:
+        batch = submissions[0].batch
+    else:
+        batch = VideoBatch.objects.filter(pk=pk).first()
+        if batch is None:
+            return None
+    
+    counts = {choice: 0 for choice, _ in VideoSubmission.STATUS_CHOICES}
+    videos = []
+    for video in submissions:
+        counts[video.status] += 1
+        form_data = video.form_data.json_data if hasattr(video, 'form_data') else None
+        videos.append({
+            'id': video.id,
+            'status': video.status,
+            'stage': video.stage,
+            'error_message': video.error_message,
+            'form_data': form_data
+        })
+    
+    total = len(videos)
+    finished = counts[VideoSubmission.STATUS_COMPLETED] + counts[VideoSubmission.STATUS_FAILED]
+    return {
+        'id': batch.id,
+        'form_type': batch.form_type,
+        'created_at': batch.created_at,
+        'total': total,
+        'counts': counts,
+        'progress': finished / total if total else 1.0,
+        'done': finished == total,
+        'videos': videos
+    }
+
+class VideoBatchView(APIView):
+    """
+    Submit many videos at once: POST /api/batches/ with several `video_files`
+    (multipart), or with a `manifest` of files already in the import folder.
+    POST /api/batches/<id>/ adds more videos to a batch, and GET returns the
+    progress and results of the whole batch.
+    """
+    
+    def get(self, request, pk=None, format=None):
+        batch_status = _batch_status(pk) if pk else None
+        if batch_status is None:
+            return Response({'error': 'Batch not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(batch_status)
+    
+    def post(self, request, pk=None, format=None):
+        form_type = request.data.get('form_type', 'personal_info')
+        
+        batch = None
+        if pk is not None:
+            batch = VideoBatch.objects.filter(pk=pk).first()
+            if batch is None:
+                return Response({'error': 'Batch not found'}, status=status.HTTP_404_NOT_FOUND)
+            form_type = request.data.get('form_type', batch.form_type)
+        
+        try:
+            # (video_file, form_type, content_hash) per video
+            items = [
+                (video_file, form_type, hash_uploaded_file(video_file))
+                for video_file in request.FILES.getlist('video_files')
+            ]
+            manifest = request.data.get('manifest')
+            if manifest:
+                # Files on the server are not hashed here; duplicates are
+                # still caught by the audio hash during processing
+                items += [(name, item_form_type, '') for name, item_form_type in _manifest_items(manifest, form_type)]
+        except (ValueError, KeyError, TypeError) as e:
+            return Response({'error': f"Invalid manifest: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not items:
+            return Response({'error': 'No videos given'}, status=status.HTTP_400_BAD_REQUEST)
+        existing = batch.submissions.count() if batch is not None else 0
+        if existing + len(items) > settings.BATCH_MAX_VIDEOS:
+            return Response(
+                {'error': f"A batch can hold at most {settings.BATCH_MAX_VIDEOS} videos"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if batch is None:
+            batch = VideoBatch.objects.create(form_type=form_type)
+        
+        result_cache = ResultCache()
+        entries = result_cache.lookup_many(
+            ResultCacheEntry.KIND_VIDEO,
+            [(content_hash, item_form_type) for _, item_form_type, content_hash in items]
+        )
+        
+        submissions = []
+        cached = []
+        for video_file, item_form_type, content_hash in items:
+            entry = entries.get((content_hash, item_form_type))
+            video_submission = VideoSubmission(
+                video_file=entry.source.video_file.name if entry else video_file,
+                content_hash=content_hash,
+                audio_hash=entry.source.audio_hash if entry else '',
+                form_type=item_form_type,
+                batch=batch,
+                status=VideoSubmission.STATUS_PENDING if entry else VideoSubmission.STATUS_PROCESSING
+            )
+            submissions.append(video_submission)
+            if entry is not None:
+                cached.append((entry, video_submission))
+        
+        # One INSERT for the whole batch (uploaded files are stored as part of it)
+        with transaction.atomic():
+            VideoSubmission.objects.bulk_create(submissions)
+            for entry, video_submission in cached:
+                result_cache.apply(entry, video_submission)
+        
+        queued = [video.id for video in submissions if video.status == VideoSubmission.STATUS_PROCESSING]
+        if queued:
+            start_batch_pipelines(queued)
+        
+        return Response({
+            'id': batch.id,
+            'message': f"{len(queued)} videos queued for processing, {len(cached)} already processed.",
+            'queued': len(queued),
+            'cached': len(cached),
+            'videos': [{'id': video.id, 'status': video.status} for video in submissions]
+        }, status=status.HTTP_202_ACCEPTED)
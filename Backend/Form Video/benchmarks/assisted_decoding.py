@@ -0,0 +1,94 @@
+# benchmarks/assisted_decoding.py
+"""
+CPU latency of free-form Llama extraction with plain greedy decoding versus
+assisted decoding (prompt lookup, and a draft model if given). Greedy
+verification must leave the output unchanged; the report checks that too.
+
+    python benchmarks/assisted_decoding.py --model meta-llama/Llama-3.2-3B-Instruct --draft-model meta-llama/Llama-3.2-1B-Instruct --repeats 3
+"""
+import argparse
+import time
+
+from common import SAMPLE_TRANSCRIPTS, configure_django, print_report, save_results, summarize
+
+
+def run(service, prompts, repeats):
+    latencies = []
+    completions = []
+    for _ in range(repeats):
+        completions = []
+        for prompt in prompts:
+            started = time.perf_counter()
+            completions.append(service.generate(prompt))
+            latencies.append(time.perf_counter() - started)
+    return completions, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark assisted decoding of form extraction on CPU')
+    parser.add_argument('--model', required=True, help='causal LM path or hub id')
+    parser.add_argument('--draft-model', help='smaller model with the same tokenizer')
+    parser.add_argument('--lookup-tokens', default='5,10', help='comma separated prompt lookup draft lengths')
+    parser.add_argument('--precision', default='fp32', help='fp32, bf16 or int8')
+    parser.add_argument('--max-new-tokens', type=int, default=256)
+    parser.add_argument('--repeats', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=0, help='torch CPU threads (0 = torch default)')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    settings = configure_django(
+        LLAMA_MODEL_PATH=args.model,
+        LLAMA_DRAFT_MODEL_PATH=args.draft_model or '',
+        LLAMA_PRECISION=args.precision,
+        LLAMA_MAX_NEW_TOKENS=args.max_new_tokens,
+        INFERENCE_CPU_THREADS=args.threads,
+    )
+    import torch
+    from api.forms_schema import PERSONAL_INFO_FORM
+    from api.services.text_analysis import LlamaAnalysisService
+
+    # The comparison is about CPU nodes, even where a GPU is present
+    torch.cuda.is_available = lambda: False
+
+    service = LlamaAnalysisService()
+    service.warm_up()
+    prompts = [service.build_prompt(transcript, PERSONAL_INFO_FORM) for transcript in SAMPLE_TRANSCRIPTS]
+
+    # (label, mode, prompt lookup tokens)
+    configurations = [('greedy', 'off', None)]
+    for tokens in args.lookup_tokens.split(','):
+        configurations.append((f'prompt lookup ({tokens.strip()})', 'prompt_lookup', int(tokens)))
+    if args.draft_model:
+        configurations.append(('draft model', 'draft_model', None))
+
+    rows = []
+    reference = None
+    for label, mode, lookup_tokens in configurations:
+        service.assisted_decoding = mode
+        if lookup_tokens is not None:
+            settings.LLAMA_PROMPT_LOOKUP_TOKENS = lookup_tokens
+
+        # One untimed pass, so one-off setup (loading the draft model) is not counted
+        run(service, prompts[:1], 1)
+        completions, latencies = run(service, prompts, args.repeats)
+        if reference is None:
+            reference = completions
+        output_tokens = sum(len(service.tokenizer(text).input_ids) for text in completions)
+
+        rows.append({
+            'mode': label,
+            'same_output': completions == reference,
+            'tokens_per_second': output_tokens * args.repeats / sum(latencies),
+            **summarize(latencies),
+        })
+
+    print_report(f'Assisted decoding on CPU ({service.precision})', rows)
+    for row in rows[1:]:
+        print(f"{row['mode']}: {rows[0]['mean'] / row['mean']:.2f}x vs greedy")
+
+    if args.output:
+        save_results(args.output, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/common.py
+# Helpers shared by the benchmark scripts
+import os
+import sys
+import json
+import time
+import statistics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Small fixed set of English transcripts used by the model benchmarks
+SAMPLE_TRANSCRIPTS = [
+    "Hello, my name is Priya Sharma. My email is priya.sharma@example.com and my phone number is 9876543210. "
+    "I live at 12 MG Road, Bengaluru. I was born on 14 March 1992 and I am female.",
+    "Hi, this is Arjun Mehta. You can reach me at arjun.mehta@example.org or on plus 91 98450 12345. "
+    "My address is 45 Park Street, Kolkata. My date of birth is 02/11/1988. I am male.",
+    "Good morning. I am Kavitha Raman, I stay at 7 Anna Salai, Chennai. My mobile number is 9443012345 "
+    "and my email address is kavitha.r@example.in. I was born on 21 July 1995.",
+    "My name is Rahul Verma and I am applying for the position of data analyst. I have 4 years of experience "
+    "in Python, SQL and Tableau. I studied B.Tech at Anna University and previously worked at Infosys. "
+    "My email is rahul.verma@example.com and my phone is 9123456780.",
+]
+
+# Fields a correct extraction finds in each of SAMPLE_TRANSCRIPTS
+SAMPLE_EXPECTED_FIELDS = [
+    {'name': 'Priya Sharma', 'email': 'priya.sharma@example.com', 'phone': '9876543210'},
+    {'name': 'Arjun Mehta', 'email': 'arjun.mehta@example.org', 'phone': '9845012345'},
+    {'name': 'Kavitha Raman', 'email': 'kavitha.r@example.in', 'phone': '9443012345'},
+    {'name': 'Rahul Verma', 'email': 'rahul.verma@example.com', 'phone': '9123456780'},
+]
+
+
+def configure_django(**overrides):
+    """Set up Django with the project settings plus overrides, without a server"""
+    if PROJECT_ROOT not in sys.path:
+        # Appended, so the project's celery.py never shadows the celery package
+        sys.path.append(PROJECT_ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'formvideo.settings')
+
+    import django
+    from django.conf import settings
+
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
+    return settings
+
+
+def field_matches(predicted, expected):
+    """
+    Number of expected fields the extraction got right, ignoring case,
+    spacing and punctuation (phones: the last 10 digits)
+    """
+    def canonical(name, value):
+        text = str(value or '').lower()
+        if name == 'phone':
+            return ''.join(ch for ch in text if ch.isdigit())[-10:]
+        return ''.join(ch for ch in text if ch.isalnum() or ch in '@.')
+
+    if not isinstance(predicted, dict):
+        return 0
+    return sum(
+        1 for name, value in expected.items()
+        if canonical(name, predicted.get(name)) == canonical(name, value)
+    )
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies):
+    """Mean and tail latencies (seconds) of a list of samples"""
+    return {
+        'count': len(latencies),
+        'mean': statistics.mean(latencies) if latencies else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies) if latencies else 0.0,
+    }
+
+
+def print_report(title, rows):
+    """Print one line per result row (a dict of name -> value)"""
+    print(f"\n{title}")
+    print('-' * len(title))
+    for row in rows:
+        print('  ' + '  '.join(
+            f"{name}={value:.4f}" if isinstance(value, float) else f"{name}={value}"
+            for name, value in row.items()
+        ))
+
+
+def save_results(path, results):
+    """Write benchmark results as JSON, stamped with the time of the run"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    payload = {'timestamp': time.time(), 'results': results}
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, default=str)
+    return path
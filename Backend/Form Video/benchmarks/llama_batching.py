@@ -0,0 +1,73 @@
+# benchmarks/llama_batching.py
+"""
+Throughput and latency of Llama form extraction, one request at a time
+versus micro-batched across concurrent requests.
+
+    python benchmarks/llama_batching.py --model sshleifer/tiny-gpt2 --requests 32 --concurrency 8
+"""
+import argparse
+import contextlib
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import SAMPLE_TRANSCRIPTS, configure_django, print_report, summarize
+
+
+def run(service, transcripts, concurrency):
+    latencies = []
+    # Without batching, requests queue for the model one at a time, as they
+    # do today; latency includes that queueing
+    gate = contextlib.nullcontext() if service.batching_enabled else threading.Lock()
+
+    def one(transcript):
+        started = time.perf_counter()
+        with gate:
+            service.extract_form_data(transcript)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, transcripts))
+    wall = time.perf_counter() - started
+
+    return {'requests_per_second': len(transcripts) / wall, 'wall_seconds': wall, **summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark micro-batched Llama extraction')
+    parser.add_argument('--model', required=True, help='causal LM path or hub id (a tiny model is fine)')
+    parser.add_argument('--requests', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=50)
+    parser.add_argument('--max-new-tokens', type=int, default=128)
+    args = parser.parse_args()
+
+    configure_django(
+        LLAMA_MODEL_PATH=args.model,
+        LLAMA_MAX_NEW_TOKENS=args.max_new_tokens,
+        LLAMA_BATCH_MAX_SIZE=args.max_batch_size,
+        LLAMA_BATCH_MAX_WAIT_MS=args.max_wait_ms,
+        FORM_RULES_ENABLED=False,
+    )
+    from api.services.text_analysis import LlamaAnalysisService
+
+    service = LlamaAnalysisService()
+    service.warm_up()
+    transcripts = list(itertools.islice(itertools.cycle(SAMPLE_TRANSCRIPTS), args.requests))
+
+    rows = []
+    for batching in (False, True):
+        service.batching_enabled = batching
+        result = run(service, transcripts, args.concurrency)
+        rows.append({'mode': 'batched' if batching else 'sequential', **result})
+
+    print_report(f"Llama extraction, {args.requests} requests at concurrency {args.concurrency}", rows)
+    print(f"\nThroughput speedup: {rows[1]['requests_per_second'] / rows[0]['requests_per_second']:.2f}x")
+    print(f"Batcher stats: {service.batcher.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+# benchmarks/pipeline_load.py
+"""
+End-to-end load test of upload -> Celery pipeline -> FormData, run entirely
+on this machine: the Django app is served by an in-process HTTP server,
+Celery workers consume from an in-memory broker, Whisper is replaced by a
+fake OpenAI endpoint and Llama / IndicTrans2 by (tiny) local models. N
+clients upload synthetic videos concurrently with the Client.py flows and
+wait for their form data.
+
+Reports submissions/minute, end-to-end and per-stage latency percentiles
+(from VideoSubmission.timings) and memory, and can compare against the
+results of an earlier run to catch regressions between releases:
+
+    python benchmarks/pipeline_load.py --llama-model sshleifer/tiny-gpt2 --videos 40 --clients 8 \\
+        --output benchmarks/results/pipeline_load.json --baseline benchmarks/results/pipeline_load.previous.json
+
+Needs ffmpeg on the PATH (the audio extraction stage runs for real).
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import PROJECT_ROOT, SAMPLE_TRANSCRIPTS, configure_django, print_report, save_results, summarize
+
+# Client.py lives next to the project directory
+sys.path.append(os.path.dirname(PROJECT_ROOT))
+
+STAGES = ('audio_extraction', 'transcription', 'translation', 'form_extraction')
+
+# Lower is better for every compared figure except throughput
+HIGHER_IS_BETTER = {'submissions_per_minute'}
+
+# Figures that are not latencies in seconds
+NOT_SECONDS = {'submissions_per_minute', 'rss_peak_mb'}
+
+
+class FakeWhisperHandler(BaseHTTPRequestHandler):
+    """Answers OpenAI /audio/transcriptions requests with a sample transcript"""
+
+    transcripts = itertools.cycle(SAMPLE_TRANSCRIPTS)
+    lock = threading.Lock()
+    latency = 0.0
+    language = 'en'
+
+    def do_POST(self):
+        # Drain the uploaded audio like the real API would receive it
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 1 << 16)))
+
+        time.sleep(self.latency)
+        with self.lock:
+            text = next(self.transcripts)
+        body = json.dumps({'text': text, 'language': self.language}).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_whisper(latency, language):
+    FakeWhisperHandler.latency = latency
+    FakeWhisperHandler.language = language
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeWhisperHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/v1'
+
+
+def start_django_server():
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def make_videos(directory, count, seconds):
+    """Small synthetic videos, each with a different tone so none share a hash"""
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f'load_{index}.mp4')
+        subprocess.run([
+            'ffmpeg', '-loglevel', 'error', '-y',
+            '-f', 'lavfi', '-i', f'color=c=black:s=160x120:d={seconds}',
+            '-f', 'lavfi', '-i', f'sine=frequency={220 + index * 7}:duration={seconds}',
+            '-shortest', '-c:v', 'mpeg4', '-c:a', 'aac', path
+        ], check=True)
+        paths.append(path)
+    return paths
+
+
+class MemorySampler:
+    """Samples the resident set size of this process (server, workers and models)"""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        from api.services.model_registry import current_rss_bytes
+
+        while not self._stop.is_set():
+            self.samples.append(current_rss_bytes() / 1e6)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        return {
+            'rss_mean_mb': sum(self.samples) / len(self.samples) if self.samples else 0.0,
+            'rss_peak_mb': max(self.samples, default=0.0),
+        }
+
+
+def drive_clients(video_paths, clients, form_type, poll_interval):
+    """Upload every video and wait for its result, `clients` at a time"""
+    import Client
+
+    latencies = []
+    outcomes = []
+
+    def one(path):
+        started = time.perf_counter()
+        result = Client.upload_video_resumable(path, form_type)
+        if result is None:
+            outcomes.append('upload_failed')
+            return
+        status_data = Client.poll_for_status(result['id'], interval=poll_interval)
+        latencies.append(time.perf_counter() - started)
+        outcomes.append(status_data['status'])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, video_paths))
+    return time.perf_counter() - started, latencies, outcomes
+
+
+def stage_latencies():
+    """Duration and queue wait percentiles of every stage, from the stored timings"""
+    from api.models import VideoSubmission
+
+    durations = {stage: [] for stage in STAGES}
+    queue_waits = {stage: [] for stage in STAGES}
+    for timings in VideoSubmission.objects.values_list('timings', flat=True):
+        for stage, entry in (timings or {}).items():
+            if stage in durations:
+                durations[stage].append(entry['seconds'])
+                if entry.get('queue_wait_seconds') is not None:
+                    queue_waits[stage].append(entry['queue_wait_seconds'])
+
+    rows = []
+    for stage in STAGES:
+        if durations[stage]:
+            duration = summarize(durations[stage])
+            wait = summarize(queue_waits[stage])
+            rows.append({
+                'stage': stage,
+                'count': duration['count'],
+                'p50': duration['p50'],
+                'p95': duration['p95'],
+                'p99': duration['p99'],
+                'queue_wait_p50': wait['p50'],
+                'queue_wait_p95': wait['p95'],
+            })
+    return rows
+
+
+def run_metadata():
+    """Where the numbers came from: code revision and environment"""
+    try:
+        revision = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=PROJECT_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = 'unknown'
+
+    import torch
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def flatten(results):
+    """Comparable figures of a run: name -> value"""
+    figures = {
+        'submissions_per_minute': results['summary']['submissions_per_minute'],
+        'end_to_end_p50': results['summary']['p50'],
+        'end_to_end_p95': results['summary']['p95'],
+        'rss_peak_mb': results['summary']['rss_peak_mb'],
+    }
+    for row in results['stages']:
+        figures[f"{row['stage']}_p50"] = row['p50']
+        figures[f"{row['stage']}_p95"] = row['p95']
+    return figures
+
+
+def compare(current, baseline_path, tolerance, min_seconds):
+    """
+    Compare a run with an earlier one. A latency only counts as a regression
+    when it also grew by at least min_seconds, so jitter on stages that take
+    milliseconds is not reported.
+
+    Returns:
+    list: Rows of the figures that got worse by more than tolerance
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    now, before = flatten(current), flatten(baseline)
+    rows, regressions = [], []
+    for name, value in now.items():
+        if name not in before or not before[name]:
+            continue
+        change = (value - before[name]) / before[name]
+        worse = -change if name in HIGHER_IS_BETTER else change
+        row = {'figure': name, 'baseline': before[name], 'current': value, 'change': change}
+        rows.append(row)
+        if worse > tolerance and (name in NOT_SECONDS or value - before[name] >= min_seconds):
+            regressions.append(row)
+
+    print_report(f"Against {baseline_path} ({baseline['metadata']['revision']})", rows)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test of the video pipeline')
+    parser.add_argument('--llama-model', required=True, help='causal LM path or hub id (a tiny model is fine)')
+    parser.add_argument('--translation-model', default='', help='seq2seq model; needed with --language other than en')
+    parser.add_argument('--language', default='en', help='language the fake Whisper reports (en skips translation)')
+    parser.add_argument('--videos', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=4, help='concurrent uploading clients')
+    parser.add_argument('--workers', type=int, default=4, help='Celery worker threads')
+    parser.add_argument('--video-seconds', type=float, default=5)
+    parser.add_argument('--whisper-latency-ms', type=float, default=200, help='simulated API latency per request')
+    parser.add_argument('--max-new-tokens', type=int, default=64)
+    parser.add_argument('--form-type', default='personal_info')
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative slowdown before failing')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='smallest latency increase that can fail')
+    parser.add_argument('--verbose', action='store_true', help='keep the output of clients and workers')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='pipeline_load_')
+    whisper_server, whisper_url = start_fake_whisper(args.whisper_latency_ms / 1000, args.language)
+
+    configure_django(
+        DATABASES={'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(workdir, 'load.sqlite3'),
+            # Server and worker threads write concurrently: take the write
+            # lock when a transaction starts and wait for it, instead of
+            # failing on a lock upgrade
+            'OPTIONS': {'timeout': 60, 'transaction_mode': 'IMMEDIATE', 'init_command': 'PRAGMA journal_mode=WAL;'},
+        }},
+        ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+        MEDIA_ROOT=os.path.join(workdir, 'media'),
+        CELERY_BROKER_URL='memory://',
+        CELERY_RESULT_BACKEND='cache+memory://',
+        # The memory transport polls its queues; the 1 s default would dominate queue waits
+        CELERY_BROKER_TRANSPORT_OPTIONS={'polling_interval': 0.05},
+        STATUS_EVENTS_ENABLED=False,
+        RESULT_CACHE_ENABLED=False,
+        TRANSLATION_MEMORY_ENABLED=False,
+        TRANSCRIPTION_BACKEND='openai',
+        OPENAI_API_KEY='load-test',
+        LLAMA_MODEL_PATH=args.llama_model,
+        LLAMA_MAX_NEW_TOKENS=args.max_new_tokens,
+        INDIC_TRANS_MODEL_PATH=args.translation_model,
+        PRELOAD_MODELS=[],
+    )
+    import openai
+    openai.api_base = whisper_url
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from celery.contrib.testing.worker import start_worker
+    from formvideo.celery import app
+    import Client
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    video_paths = make_videos(workdir, args.videos, args.video_seconds)
+
+    # Load the models before timing, as worker processes do at start-up
+    from api.services.text_analysis import LlamaAnalysisService
+    LlamaAnalysisService().warm_up()
+    if args.language != 'en':
+        from api.services.translation import IndicTranslationService
+        IndicTranslationService().warm_up()
+
+    django_server, base_url = start_django_server()
+    Client.BASE_URL = f'{base_url}/api'
+
+    queues = [settings.PIPELINE_MEDIA_QUEUE, settings.PIPELINE_TRANSCRIPTION_QUEUE, settings.PIPELINE_INFERENCE_QUEUE]
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with start_worker(app, pool='threads', concurrency=args.workers, queues=queues, perform_ping_check=False):
+        with MemorySampler() as memory, output:
+            wall, latencies, outcomes = drive_clients(video_paths, args.clients, args.form_type, args.poll_interval)
+
+    django_server.shutdown()
+    whisper_server.shutdown()
+
+    completed = outcomes.count('completed')
+    summary = {
+        'videos': args.videos,
+        'clients': args.clients,
+        'workers': args.workers,
+        'completed': completed,
+        'failed': len(outcomes) - completed,
+        'wall_seconds': wall,
+        'submissions_per_minute': completed / wall * 60,
+        **summarize(latencies),
+        **memory.summary(),
+    }
+    results = {
+        'metadata': run_metadata(),
+        'summary': summary,
+        'stages': stage_latencies(),
+    }
+
+    print_report('Pipeline load test', [summary])
+    print_report('Stage latency (seconds)', results['stages'])
+
+    regressions = []
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance, args.min_seconds)
+        for row in regressions:
+            print(f"REGRESSION {row['figure']}: {row['baseline']:.4f} -> {row['current']:.4f} ({row['change']:+.0%})")
+
+    if args.output:
+        save_results(args.output, results)
+    if regressions or summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# benchmarks/quantization.py
+"""
+Generation speed, peak memory and extraction accuracy of the Llama model
+(and optionally the translation model) at each precision, on CPU. Every
+precision runs in its own process so peak RSS is not shared between runs.
+
+    python benchmarks/quantization.py --model meta-llama/Llama-3.2-1B-Instruct --precisions fp32,int8 --threads 8
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common import SAMPLE_EXPECTED_FIELDS, SAMPLE_TRANSCRIPTS, configure_django, field_matches, print_report, save_results
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generation_speed(service, prompts, max_new_tokens):
+    """Tokens per second of plain greedy decoding, with a fixed output length"""
+    import torch
+
+    generated, elapsed = 0, 0.0
+    for prompt in prompts:
+        inputs = service.tokenizer(prompt, return_tensors="pt").to(service.device)
+        started = time.perf_counter()
+        with torch.no_grad():
+            outputs = service.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=service.tokenizer.pad_token_id
+            )
+        elapsed += time.perf_counter() - started
+        generated += outputs.shape[1] - inputs["input_ids"].shape[1]
+    return generated / elapsed
+
+
+def run_llama(model, precision, max_new_tokens, decoding_mode, threads):
+    configure_django(
+        LLAMA_MODEL_PATH=model,
+        LLAMA_PRECISION=precision,
+        LLAMA_MAX_NEW_TOKENS=max_new_tokens,
+        LLAMA_DECODING_MODE=decoding_mode,
+        LLAMA_BATCHING_ENABLED=False,
+        FORM_RULES_ENABLED=False,
+        INFERENCE_CPU_THREADS=threads,
+    )
+    import torch
+    from api.forms_schema import PERSONAL_INFO_FORM
+    from api.services.text_analysis import LlamaAnalysisService
+
+    # The comparison is about CPU nodes, even where a GPU is present
+    torch.cuda.is_available = lambda: False
+
+    service = LlamaAnalysisService()
+    started = time.perf_counter()
+    service.warm_up()
+    load_seconds = time.perf_counter() - started
+
+    prompts = [service.build_prompt(transcript, PERSONAL_INFO_FORM) for transcript in SAMPLE_TRANSCRIPTS]
+    tokens_per_second = generation_speed(service, prompts, max_new_tokens)
+
+    correct, latencies = 0, []
+    for transcript, expected in zip(SAMPLE_TRANSCRIPTS, SAMPLE_EXPECTED_FIELDS):
+        started = time.perf_counter()
+        try:
+            form_data = service.extract_form_data(transcript, PERSONAL_INFO_FORM, 'personal_info')
+        except Exception as e:
+            print(f"Extraction failed: {e}")
+            form_data = None
+        latencies.append(time.perf_counter() - started)
+        correct += field_matches(form_data, expected)
+
+    return {
+        'model': 'llama',
+        'precision': service.precision,
+        'load_seconds': load_seconds,
+        'tokens_per_second': tokens_per_second,
+        'extraction_seconds': sum(latencies) / len(latencies),
+        'field_accuracy': correct / sum(len(expected) for expected in SAMPLE_EXPECTED_FIELDS),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_translation(model, precision, source_lang, threads):
+    configure_django(
+        INDIC_TRANS_MODEL_PATH=model,
+        TRANSLATION_PRECISION=precision,
+        TRANSLATION_MEMORY_ENABLED=False,
+        INFERENCE_CPU_THREADS=threads,
+    )
+    import torch
+    from api.services.translation import IndicTranslationService, split_sentences
+    from translation_batching import SAMPLE_HINDI_TRANSCRIPTS
+
+    # The comparison is about CPU nodes, even where a GPU is present
+    torch.cuda.is_available = lambda: False
+
+    service = IndicTranslationService()
+    started = time.perf_counter()
+    service.warm_up()
+    load_seconds = time.perf_counter() - started
+
+    sentences = list(itertools.chain.from_iterable(split_sentences(text) for text in SAMPLE_HINDI_TRANSCRIPTS))
+    started = time.perf_counter()
+    translations = service.generate_translations(sentences, source_lang)
+    wall = time.perf_counter() - started
+    output_tokens = sum(len(ids) for ids in service.tokenizer(translations).input_ids)
+
+    return {
+        'model': 'translation',
+        'precision': service.precision,
+        'load_seconds': load_seconds,
+        'tokens_per_second': output_tokens / wall,
+        'sentences_per_second': len(sentences) / wall,
+        'peak_rss_mb': peak_rss_mb(),
+        'translations': translations,
+    }
+
+
+def in_child_process(function, *args):
+    """Run one measurement in a fresh interpreter and return its result"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark model precisions on CPU')
+    parser.add_argument('--model', required=True, help='causal LM path or hub id')
+    parser.add_argument('--translation-model', help='also measure this IndicTrans2 (seq2seq) model')
+    parser.add_argument('--source-lang', default='hin_Deva')
+    parser.add_argument('--precisions', default='fp32,int8', help='comma separated: fp32, bf16, int8')
+    parser.add_argument('--max-new-tokens', type=int, default=128)
+    parser.add_argument('--decoding-mode', default='free', choices=['free', 'constrained'])
+    parser.add_argument('--threads', type=int, default=0, help='torch CPU threads (0 = torch default)')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    precisions = [precision.strip() for precision in args.precisions.split(',') if precision.strip()]
+
+    rows = []
+    for precision in precisions:
+        rows.append(in_child_process(
+            run_llama, args.model, precision, args.max_new_tokens, args.decoding_mode, args.threads
+        ))
+    print_report(f'Llama on CPU ({args.decoding_mode} decoding)', rows)
+
+    if args.translation_model:
+        translation_rows = []
+        for precision in precisions:
+            translation_rows.append(in_child_process(
+                run_translation, args.translation_model, precision, args.source_lang, args.threads
+            ))
+        # Accuracy of the translations: agreement with the first precision (fp32)
+        reference = translation_rows[0]['translations']
+        for row in translation_rows:
+            translations = row.pop('translations')
+            row['same_as_' + translation_rows[0]['precision']] = (
+                sum(a == b for a, b in zip(translations, reference)) / len(reference)
+            )
+        print_report('Translation on CPU', translation_rows)
+        rows.extend(translation_rows)
+
+    if args.output:
+        save_results(args.output, rows)
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/rule_extraction.py
+"""
+Fields the extraction rules fill on their own, and the time Llama takes per
+submission with the full schema versus only the fields the rules left
+empty. Without --model only the rule coverage is reported.
+
+    python benchmarks/rule_extraction.py --model meta-llama/Llama-3.2-1B-Instruct --form-type job_application
+"""
+import argparse
+import time
+
+from common import SAMPLE_EXPECTED_FIELDS, SAMPLE_TRANSCRIPTS, configure_django, field_matches, print_report, save_results
+
+
+def rule_coverage(form_schema):
+    from api.services.rule_extraction import RuleExtractor
+
+    rows = []
+    for transcript, expected in zip(SAMPLE_TRANSCRIPTS, SAMPLE_EXPECTED_FIELDS):
+        started = time.perf_counter()
+        found = RuleExtractor().extract(transcript, form_schema)
+        rows.append({
+            'fields_found': len(found),
+            'fields_left': len(form_schema) - len(found),
+            'correct': field_matches(found, expected),
+            'milliseconds': (time.perf_counter() - started) * 1000,
+        })
+    return rows
+
+
+def run(service, form_schema, form_type, rules_enabled):
+    service.rules_enabled = rules_enabled
+    latencies, correct = [], 0
+    for transcript, expected in zip(SAMPLE_TRANSCRIPTS, SAMPLE_EXPECTED_FIELDS):
+        started = time.perf_counter()
+        form_data = service.extract_form_data(transcript, form_schema, form_type)
+        latencies.append(time.perf_counter() - started)
+        correct += field_matches(form_data, expected)
+    return {
+        'mode': 'rules + llm' if rules_enabled else 'llm only',
+        'seconds_per_submission': sum(latencies) / len(latencies),
+        'field_accuracy': correct / sum(len(expected) for expected in SAMPLE_EXPECTED_FIELDS),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rule-based extraction in front of Llama')
+    parser.add_argument('--model', help='causal LM path or hub id; omit to only measure the rules')
+    parser.add_argument('--form-type', default='personal_info')
+    parser.add_argument('--max-new-tokens', type=int, default=256)
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    configure_django(LLAMA_MODEL_PATH=args.model or '', LLAMA_MAX_NEW_TOKENS=args.max_new_tokens)
+    from api.forms_schema import get_form_schema
+
+    form_schema = get_form_schema(args.form_type)
+    coverage = rule_coverage(form_schema)
+    print_report(f'Rules on {args.form_type} ({len(form_schema)} fields)', coverage)
+    results = {'rules': coverage}
+
+    if args.model:
+        from api.services.text_analysis import LlamaAnalysisService
+
+        service = LlamaAnalysisService()
+        service.warm_up()
+        # One untimed extraction per mode, so neither run pays one-off setup
+        for rules_enabled in (False, True):
+            service.rules_enabled = rules_enabled
+            service.extract_form_data(SAMPLE_TRANSCRIPTS[0], form_schema, args.form_type)
+
+        rows = [run(service, form_schema, args.form_type, rules_enabled) for rules_enabled in (False, True)]
+        print_report('Llama time per submission', rows)
+        print(f"\nSpeedup: {rows[0]['seconds_per_submission'] / rows[1]['seconds_per_submission']:.2f}x")
+        results['llm'] = rows
+
+    if args.output:
+        save_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+# benchmarks/status_polling.py
+"""
+Database queries per request and latency under concurrent polling of the
+status and detail endpoints: the previous implementation (lazy related
+lookups) versus the joined query, with and without conditional requests.
+
+    python benchmarks/status_polling.py --videos 200 --requests 4000 --concurrency 16
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import configure_django, print_report, save_results, summarize
+
+
+def legacy_views():
+    """The endpoints as they were before the joined queries and ETags"""
+    from rest_framework import generics
+    from rest_framework.response import Response
+    from rest_framework.views import APIView
+    from api.models import VideoSubmission
+    from api.serializers import VideoSubmissionResponseSerializer
+
+    class LegacyDetailView(generics.RetrieveAPIView):
+        queryset = VideoSubmission.objects.all()
+        serializer_class = VideoSubmissionResponseSerializer
+
+    class LegacyStatusView(APIView):
+        def get(self, request, pk, format=None):
+            video = VideoSubmission.objects.get(pk=pk)
+            form_data = None
+            if hasattr(video, 'form_data'):
+                form_data = video.form_data.json_data
+            return Response({
+                'id': video.id,
+                'status': video.status,
+                'created_at': video.created_at,
+                'updated_at': video.updated_at,
+                'error_message': video.error_message,
+                'form_data_available': form_data is not None,
+                'form_data': form_data
+            })
+
+    return {'status': LegacyStatusView.as_view(), 'detail': LegacyDetailView.as_view()}
+
+
+def current_views():
+    from api.views import VideoProcessingStatusView, VideoSubmissionDetailView
+    return {'status': VideoProcessingStatusView.as_view(), 'detail': VideoSubmissionDetailView.as_view()}
+
+
+def create_submissions(count):
+    from api.models import VideoSubmission, Transcription, FormData
+
+    video_ids = []
+    for index in range(count):
+        # Half finished (with transcript and form data), half still processing
+        finished = index % 2 == 0
+        video = VideoSubmission.objects.create(
+            video_file=f'videos/bench/{index}.mp4',
+            status=VideoSubmission.STATUS_COMPLETED if finished else VideoSubmission.STATUS_PROCESSING,
+            stage=VideoSubmission.STAGE_FORM_EXTRACTED if finished else VideoSubmission.STAGE_TRANSCRIBED,
+        )
+        Transcription.objects.create(video=video, text='Hello, my name is Priya Sharma. ' * 20, language='en')
+        if finished:
+            FormData.objects.create(video=video, json_data={'name': 'Priya Sharma', 'email': 'priya@example.com'})
+        video_ids.append(video.id)
+    return video_ids
+
+
+def count_queries(view, video_id, headers=None):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIRequestFactory
+
+    request = APIRequestFactory().get('/', **(headers or {}))
+    with CaptureQueriesContext(connection) as queries:
+        response = view(request, pk=video_id)
+        if hasattr(response, 'render'):
+            response.render()
+    return len(queries), response
+
+
+def poll(view, video_ids, requests, concurrency, conditional):
+    from django.db import connection
+    from rest_framework.test import APIRequestFactory
+
+    factory = APIRequestFactory()
+    etags = {}
+    latencies = []
+    not_modified = [0]
+
+    def one(video_id):
+        headers = {}
+        if conditional and video_id in etags:
+            headers['HTTP_IF_NONE_MATCH'] = etags[video_id]
+        started = time.perf_counter()
+        response = view(factory.get('/', **headers), pk=video_id)
+        if hasattr(response, 'render'):
+            response.render()
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 304:
+            not_modified[0] += 1
+        elif response.has_header('ETag'):
+            etags[video_id] = response['ETag']
+
+    def worker(batch):
+        try:
+            for video_id in batch:
+                one(video_id)
+        finally:
+            connection.close()
+
+    rng = random.Random(0)
+    schedule = [rng.choice(video_ids) for _ in range(requests)]
+    batches = [schedule[index::concurrency] for index in range(concurrency)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, batches))
+    wall = time.perf_counter() - started
+
+    return {
+        'requests_per_second': requests / wall,
+        'not_modified': not_modified[0],
+        **summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark status/detail polling')
+    parser.add_argument('--videos', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    configure_django(
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': database}},
+        ALLOWED_HOSTS=['testserver'],
+        STATUS_EVENTS_ENABLED=False,
+    )
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+    video_ids = create_submissions(args.videos)
+    finished_id = video_ids[0]
+
+    query_rows = []
+    implementations = {'legacy': legacy_views(), 'joined': current_views()}
+    for implementation, views in implementations.items():
+        for endpoint, view in views.items():
+            queries, response = count_queries(view, finished_id)
+            row = {'implementation': implementation, 'endpoint': endpoint, 'queries': queries}
+            if response.has_header('ETag'):
+                revalidate, _ = count_queries(view, finished_id, {'HTTP_IF_NONE_MATCH': response['ETag']})
+                row['queries_304'] = revalidate
+            query_rows.append(row)
+    print_report('DB queries per request', query_rows)
+
+    latency_rows = []
+    runs = [('legacy', False), ('joined', False), ('joined', True)]
+    for endpoint in ('status', 'detail'):
+        for implementation, conditional in runs:
+            result = poll(
+                implementations[implementation][endpoint], video_ids,
+                args.requests, args.concurrency, conditional
+            )
+            latency_rows.append({
+                'endpoint': endpoint,
+                'implementation': implementation + (' + etag' if conditional else ''),
+                **result,
+            })
+    print_report(f'Concurrent polling ({args.concurrency} clients)', latency_rows)
+
+    if args.output:
+        save_results(args.output, {'queries': query_rows, 'polling': latency_rows})
+
+
+if __name__ == '__main__':
+    main()
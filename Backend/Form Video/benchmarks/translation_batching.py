@@ -0,0 +1,110 @@
+# benchmarks/translation_batching.py
+"""
+Sentences per second of IndicTrans2 translation: the whole transcript in
+one generate call (the previous behaviour), one sentence at a time, and
+length-bucketed sentence batches with beam search or greedy decoding.
+
+    python benchmarks/translation_batching.py --model ai4bharat/indictrans2-indic-en-dist-200M --transcripts 8
+"""
+import argparse
+import itertools
+import time
+
+import torch
+
+from common import configure_django, print_report, save_results
+
+# Hindi transcripts of the kind the pipeline translates
+SAMPLE_HINDI_TRANSCRIPTS = [
+    "मेरा नाम प्रिया शर्मा है। मेरा ईमेल priya.sharma@example.com है। मेरा फ़ोन नंबर 9876543210 है। "
+    "मैं 12 एमजी रोड, बेंगलुरु में रहती हूँ। मेरा जन्म 14 मार्च 1992 को हुआ था।",
+    "नमस्ते, मैं अर्जुन मेहता हूँ। आप मुझसे arjun.mehta@example.org पर संपर्क कर सकते हैं। "
+    "मेरा पता 45 पार्क स्ट्रीट, कोलकाता है। मेरी जन्मतिथि 2 नवंबर 1988 है। मैं पुरुष हूँ।",
+    "मेरा नाम राहुल वर्मा है और मैं डेटा एनालिस्ट के पद के लिए आवेदन कर रहा हूँ। "
+    "मुझे पायथन, एसक्यूएल और टेबलो में चार साल का अनुभव है। मैंने अन्ना विश्वविद्यालय से बी.टेक किया है। "
+    "पहले मैं इंफोसिस में काम करता था। मेरा फ़ोन नंबर 9123456780 है।",
+]
+
+
+def translate_whole(service, transcript, source_lang):
+    """
+    The previous implementation: one input, max_length=2048, 5 beams (capped
+    at the model's position limit, past which it fails)
+    """
+    max_length = min(2048, getattr(service.model.config, 'max_position_embeddings', 2048))
+    inputs = service.tokenizer(
+        service.format_input(transcript, source_lang), return_tensors="pt", truncation=True, max_length=max_length
+    ).to(service.device)
+    with torch.no_grad():
+        outputs = service.model.generate(**inputs, max_length=max_length, num_beams=5, num_return_sequences=1)
+    return service.tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+
+def run(service, transcripts, source_lang, mode):
+    from api.services.translation import split_sentences
+
+    sentence_count = sum(len(split_sentences(transcript, service.max_sentence_words)) for transcript in transcripts)
+    started = time.perf_counter()
+    if mode == 'whole':
+        for transcript in transcripts:
+            translate_whole(service, transcript, source_lang)
+    else:
+        # Every transcript of the run in one call, as a bulk job would
+        sentences = list(itertools.chain.from_iterable(
+            split_sentences(transcript, service.max_sentence_words) for transcript in transcripts
+        ))
+        service.translate_sentences(sentences, source_lang)
+    wall = time.perf_counter() - started
+
+    return {
+        'sentences': sentence_count,
+        'wall_seconds': wall,
+        'sentences_per_second': sentence_count / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batched IndicTrans2 translation')
+    parser.add_argument('--model', required=True, help='IndicTrans2 (or any seq2seq) model path or hub id')
+    parser.add_argument('--source-lang', default='hin_Deva')
+    parser.add_argument('--transcripts', type=int, default=6)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--num-beams', type=int, default=5)
+    parser.add_argument('--threads', type=int, help='torch CPU threads')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    # Measure the model, not the translation memory
+    configure_django(INDIC_TRANS_MODEL_PATH=args.model, TRANSLATION_MEMORY_ENABLED=False)
+    from api.services.translation import IndicTranslationService
+
+    transcripts = list(itertools.islice(itertools.cycle(SAMPLE_HINDI_TRANSCRIPTS), args.transcripts))
+
+    # (label, batch size, beams); the whole-transcript run ignores both
+    configurations = [
+        ('whole', None, None),
+        ('sentences, one at a time', 1, args.num_beams),
+        ('batched, beam', args.batch_size, args.num_beams),
+        ('batched, greedy', args.batch_size, 1),
+    ]
+
+    rows = []
+    for label, batch_size, num_beams in configurations:
+        service = IndicTranslationService()
+        service.warm_up()
+        if batch_size is not None:
+            service.batch_size = batch_size
+            service.num_beams = num_beams
+        result = run(service, transcripts, args.source_lang, 'whole' if batch_size is None else 'sentences')
+        rows.append({'mode': label, 'device': service.device, **result})
+    print_report('Translation throughput', rows)
+
+    if args.output:
+        save_results(args.output, rows)
+
+
+if __name__ == '__main__':
+    main()
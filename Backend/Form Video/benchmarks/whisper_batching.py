@@ -0,0 +1,97 @@
+# benchmarks/whisper_batching.py
+"""
+Throughput of the local Whisper backend with one 30 second window per
+generate call versus windows from concurrent jobs batched together. Audio
+is synthetic noise unless --audio files are given; transcripts of both
+runs are compared.
+
+    python benchmarks/whisper_batching.py --model openai/whisper-tiny --jobs 16 --concurrency 8
+"""
+import argparse
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import configure_django, print_report, save_results, summarize
+
+
+def synthetic_pcm(seconds, seed):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(int(16000 * seconds)) * 3000).astype(np.int16).tobytes()
+
+
+def run(backend, pcms, concurrency, language):
+    latencies = []
+
+    def one(pcm):
+        started = time.perf_counter()
+        result = backend.transcribe_pcm(pcm, language)
+        latencies.append(time.perf_counter() - started)
+        return result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, pcms))
+    wall = time.perf_counter() - started
+    return results, {'jobs_per_second': len(pcms) / wall, 'wall_seconds': wall, **summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batched local Whisper transcription')
+    parser.add_argument('--model', required=True, help='Whisper checkpoint path or hub id')
+    parser.add_argument('--audio', nargs='*', default=[], help='audio files to transcribe (default: synthetic)')
+    parser.add_argument('--seconds', type=float, default=45, help='length of the synthetic clips')
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=50)
+    parser.add_argument('--language', help='force a language instead of detecting it')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    configure_django(
+        LOCAL_WHISPER_MODEL=args.model,
+        WHISPER_BATCH_MAX_SIZE=args.max_batch_size,
+        WHISPER_BATCH_MAX_WAIT_MS=args.max_wait_ms,
+    )
+    from api.services.audio_extractor import AudioExtractor
+    from api.services.transcription import LocalWhisperBackend
+
+    if args.audio:
+        clips = [AudioExtractor.read_pcm(path) for path in args.audio]
+    else:
+        clips = [synthetic_pcm(args.seconds, seed) for seed in range(4)]
+    pcms = list(itertools.islice(itertools.cycle(clips), args.jobs))
+
+    backend = LocalWhisperBackend()
+    backend.warm_up()
+    # One untimed job so neither run pays one-off setup
+    backend.transcribe_pcm(pcms[0], args.language)
+
+    rows, transcripts = [], []
+    for max_batch_size in (1, args.max_batch_size):
+        backend.batcher.max_batch_size = max_batch_size
+        before = backend.batcher.stats()
+        results, row = run(backend, pcms, args.concurrency, args.language)
+        after = backend.batcher.stats()
+        windows = after['items'] - before['items']
+        rows.append({
+            'max_batch_size': max_batch_size,
+            'mean_batch_size': windows / max(after['batches'] - before['batches'], 1),
+            **row,
+        })
+        transcripts.append(results)
+
+    print_report(f'Local Whisper, {args.jobs} jobs at concurrency {args.concurrency}', rows)
+    print(f"\nThroughput speedup: {rows[1]['jobs_per_second'] / rows[0]['jobs_per_second']:.2f}x")
+    mismatches = sum(a != b for a, b in zip(*transcripts))
+    print(f'Transcripts differing between runs: {mismatches} of {len(pcms)}')
+
+    if args.output:
+        save_results(args.output, {'runs': rows, 'mismatches': mismatches})
+
+
+if __name__ == '__main__':
+    main()
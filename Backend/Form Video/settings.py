@@ -42,11 +42,185 @@ MIDDLEWARE = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Resumable uploads (/api/uploads/): largest accepted video and largest chunk
+# per request. Chunks are copied to disk in UPLOAD_COPY_BUFFER_BYTES blocks.
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(4 * 1024 ** 3)))
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv('UPLOAD_CHUNK_MAX_BYTES', str(64 * 1024 ** 2)))
+UPLOAD_COPY_BUFFER_BYTES = int(os.getenv('UPLOAD_COPY_BUFFER_BYTES', str(1024 ** 2)))
+
+# Batch submissions (/api/batches/): most videos per batch, and the folder
+# (relative to MEDIA_ROOT) that manifest paths are resolved against
+BATCH_MAX_VIDEOS = int(os.getenv('BATCH_MAX_VIDEOS', '1000'))
+BATCH_IMPORT_DIR = os.getenv('BATCH_IMPORT_DIR', 'imports')
+
 # Model paths
 LLAMA_MODEL_PATH = os.getenv('LLAMA_MODEL_PATH', '')
 INDIC_TRANS_MODEL_PATH = os.getenv('INDIC_TRANS_MODEL_PATH', '')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 
+# Transcription backend: 'openai' (Whisper API) or 'local' (Whisper checkpoint
+# loaded in the worker, LOCAL_WHISPER_MODEL)
+TRANSCRIPTION_BACKEND = os.getenv('TRANSCRIPTION_BACKEND', 'openai')
+LOCAL_WHISPER_MODEL = os.getenv('LOCAL_WHISPER_MODEL', 'openai/whisper-medium')
+
+# The local backend batches 30 second windows from concurrent jobs into one
+# generate call: up to WHISPER_BATCH_MAX_SIZE windows, waiting at most
+# WHISPER_BATCH_MAX_WAIT_MS for a batch to fill
+WHISPER_BATCH_MAX_SIZE = int(os.getenv('WHISPER_BATCH_MAX_SIZE', '8'))
+WHISPER_BATCH_MAX_WAIT_MS = float(os.getenv('WHISPER_BATCH_MAX_WAIT_MS', '50'))
+
+# Streaming transcription: ffmpeg pipes 16 kHz mono PCM and fixed-length chunks
+# are transcribed as they arrive, instead of waiting for the full MP3
+TRANSCRIPTION_STREAMING = os.getenv('TRANSCRIPTION_STREAMING', 'False') == 'True'
+TRANSCRIPTION_CHUNK_SECONDS = float(os.getenv('TRANSCRIPTION_CHUNK_SECONDS', '30'))
+TRANSCRIPTION_STREAM_BUFFER_CHUNKS = int(os.getenv('TRANSCRIPTION_STREAM_BUFFER_CHUNKS', '4'))
+
+# How audio is split before transcription: 'vad' (at pauses, found by voice
+# activity detection, at most VAD_MAX_SEGMENT_SECONDS long), 'fixed' (fixed
+# length stream chunks) or 'none' (one backend call per file). Segments are
+# transcribed in parallel by TRANSCRIPTION_MAX_WORKERS threads.
+# With the openai backend every segment is a separate, billed API request,
+# so the default there is 'none'; the local backend defaults to 'vad'.
+TRANSCRIPTION_SEGMENTATION = os.getenv(
+    'TRANSCRIPTION_SEGMENTATION', 'vad' if TRANSCRIPTION_BACKEND == 'local' else 'none'
+)
+TRANSCRIPTION_MAX_WORKERS = int(os.getenv('TRANSCRIPTION_MAX_WORKERS', str(os.cpu_count() or 4)))
+VAD_MIN_SILENCE_MS = int(os.getenv('VAD_MIN_SILENCE_MS', '500'))
+VAD_MAX_SEGMENT_SECONDS = float(os.getenv('VAD_MAX_SEGMENT_SECONDS', '30'))
+
+# Content-addressed result cache: duplicate uploads (same video bytes, or the
+# same decoded audio) with the same form type reuse earlier results
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'True') == 'True'
+RESULT_CACHE_TTL_SECONDS = int(os.getenv('RESULT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '10000'))
+
+# IndicTrans2 translation: transcripts are split into sentences (long ones cut
+# at TRANSLATION_MAX_SENTENCE_WORDS) and translated in length-bucketed batches
+# of at most TRANSLATION_BATCH_SIZE sentences / TRANSLATION_MAX_BATCH_TOKENS
+# padded tokens. TRANSLATION_DECODING: 'beam' (TRANSLATION_NUM_BEAMS) or
+# 'greedy' (fastest).
+TRANSLATION_DECODING = os.getenv('TRANSLATION_DECODING', 'beam')
+TRANSLATION_NUM_BEAMS = int(os.getenv('TRANSLATION_NUM_BEAMS', '5'))
+TRANSLATION_BATCH_SIZE = int(os.getenv('TRANSLATION_BATCH_SIZE', '16'))
+TRANSLATION_MAX_BATCH_TOKENS = int(os.getenv('TRANSLATION_MAX_BATCH_TOKENS', '4096'))
+TRANSLATION_MAX_SENTENCE_WORDS = int(os.getenv('TRANSLATION_MAX_SENTENCE_WORDS', '80'))
+TRANSLATION_MAX_NEW_TOKENS = int(os.getenv('TRANSLATION_MAX_NEW_TOKENS', '256'))
+
+# Translation memory: sentences already translated (by the same model and
+# decoding) are served from an in-process LRU of TRANSLATION_MEMORY_SIZE
+# sentences backed by a SQLite file shared by the workers on a host. The file
+# keeps the newest TRANSLATION_MEMORY_MAX_ROWS translations; hit counters and
+# pruning are written every TRANSLATION_MEMORY_FLUSH_SECONDS
+TRANSLATION_MEMORY_ENABLED = os.getenv('TRANSLATION_MEMORY_ENABLED', 'True') == 'True'
+TRANSLATION_MEMORY_PATH = os.getenv('TRANSLATION_MEMORY_PATH', os.path.join(BASE_DIR, 'translation_memory.sqlite3'))
+TRANSLATION_MEMORY_SIZE = int(os.getenv('TRANSLATION_MEMORY_SIZE', '10000'))
+TRANSLATION_MEMORY_MAX_ROWS = int(os.getenv('TRANSLATION_MEMORY_MAX_ROWS', '200000'))
+TRANSLATION_MEMORY_FLUSH_SECONDS = float(os.getenv('TRANSLATION_MEMORY_FLUSH_SECONDS', '30'))
+
+# Model precision (LLAMA_PRECISION, TRANSLATION_PRECISION,
+# LOCAL_WHISPER_PRECISION): 'auto' (fp16 on GPU, fp32 on CPU), 'fp32',
+# 'fp16', 'bf16' or 'int8' (dynamic quantization of the linear layers; CPU
+# only, roughly 4x smaller and 1.5-3x faster than fp32)
+LLAMA_PRECISION = os.getenv('LLAMA_PRECISION', 'auto')
+TRANSLATION_PRECISION = os.getenv('TRANSLATION_PRECISION', 'fp32')
+LOCAL_WHISPER_PRECISION = os.getenv('LOCAL_WHISPER_PRECISION', 'auto')
+# Torch threads per worker process (0 = torch default, usually all cores)
+INFERENCE_CPU_THREADS = int(os.getenv('INFERENCE_CPU_THREADS', '0'))
+
+# Rule-based first tier of form extraction: regexes fill the fields stated in
+# predictable phrasing (email, phone, name, date of birth, gender) and Llama is
+# only prompted for the fields they left empty
+FORM_RULES_ENABLED = os.getenv('FORM_RULES_ENABLED', 'True') == 'True'
+
+# Llama generation
+LLAMA_MAX_NEW_TOKENS = int(os.getenv('LLAMA_MAX_NEW_TOKENS', '1024'))
+
+# 'free': generate up to LLAMA_MAX_NEW_TOKENS and parse the JSON from the text.
+# 'constrained': generate only the values of the fields in forms_schema and stop
+# when the object is complete (always valid JSON, far fewer tokens).
+LLAMA_DECODING_MODE = os.getenv('LLAMA_DECODING_MODE', 'free')
+
+# Assisted (speculative) decoding of 'free' extraction: a drafter proposes
+# several tokens at a time and the model verifies them in one forward pass;
+# with greedy decoding the output is identical. LLAMA_ASSISTED_DECODING:
+# 'off', 'prompt_lookup' (drafts of LLAMA_PROMPT_LOOKUP_TOKENS copied from the
+# prompt, whose schema keys and transcript values the JSON mostly repeats) or
+# 'draft_model' (LLAMA_DRAFT_MODEL_PATH, a small model with the same tokenizer,
+# e.g. Llama-3.2-1B for 3B). Not used for micro-batched prompts.
+LLAMA_ASSISTED_DECODING = os.getenv('LLAMA_ASSISTED_DECODING', 'off')
+LLAMA_PROMPT_LOOKUP_TOKENS = int(os.getenv('LLAMA_PROMPT_LOOKUP_TOKENS', '10'))
+LLAMA_DRAFT_MODEL_PATH = os.getenv('LLAMA_DRAFT_MODEL_PATH', '')
+
+# Cache of the prefilled instructions + schema prompt prefix, per form type
+LLAMA_PREFIX_CACHE_ENABLED = os.getenv('LLAMA_PREFIX_CACHE_ENABLED', 'True') == 'True'
+LLAMA_PREFIX_CACHE_SIZE = int(os.getenv('LLAMA_PREFIX_CACHE_SIZE', '16'))
+
+# Micro-batching of extraction prompts from concurrent tasks in one worker
+# process. Only useful when the inference worker runs several tasks at once,
+# e.g. `celery -A formvideo worker -Q inference -P threads -c 8`.
+LLAMA_BATCHING_ENABLED = os.getenv('LLAMA_BATCHING_ENABLED', 'False') == 'True'
+LLAMA_BATCH_MAX_SIZE = int(os.getenv('LLAMA_BATCH_MAX_SIZE', '8'))
+LLAMA_BATCH_MAX_WAIT_MS = float(os.getenv('LLAMA_BATCH_MAX_WAIT_MS', '50'))
+
+# Models loaded once when each Celery worker process starts (comma separated:
+# translation, llama, whisper). Leave empty to load lazily on the first task.
+PRELOAD_MODELS = [
+    name.strip() for name in os.getenv('PRELOAD_MODELS', 'translation,llama').split(',')
+    if name.strip()
+]
+
 # Celery settings
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+
+# Status events: pipeline stages publish status changes on Redis pub/sub and
+# /api/videos/<id>/events/ (server-sent events) or /status/?wait= (long poll)
+# deliver them without polling the database
+STATUS_EVENTS_ENABLED = os.getenv('STATUS_EVENTS_ENABLED', 'True') == 'True'
+STATUS_EVENTS_REDIS_URL = os.getenv('STATUS_EVENTS_REDIS_URL', CELERY_BROKER_URL)
+STATUS_EVENTS_TTL_SECONDS = int(os.getenv('STATUS_EVENTS_TTL_SECONDS', '86400'))
+STATUS_EVENTS_STREAM_TIMEOUT = float(os.getenv('STATUS_EVENTS_STREAM_TIMEOUT', '600'))
+STATUS_EVENTS_HEARTBEAT_SECONDS = float(os.getenv('STATUS_EVENTS_HEARTBEAT_SECONDS', '15'))
+STATUS_LONG_POLL_MAX_WAIT = float(os.getenv('STATUS_LONG_POLL_MAX_WAIT', '30'))
+
+# /api/metrics/ (Prometheus): cumulative histograms and counters of stage
+# durations, queue waits, retries, failures and requeues (kept in the
+# database by the workers), plus formvideo_recent_* gauges over the
+# submissions updated in the last METRICS_WINDOW_SECONDS, at most
+# METRICS_MAX_SUBMISSIONS of them per scrape
+METRICS_WINDOW_SECONDS = int(os.getenv('METRICS_WINDOW_SECONDS', '3600'))
+METRICS_MAX_SUBMISSIONS = int(os.getenv('METRICS_MAX_SUBMISSIONS', '5000'))
+
+# Sweeper (run by celery beat): submissions left in processing without
+# progress for SWEEP_STUCK_AFTER_SECONDS are re-enqueued from their last
+# checkpoint, at most SWEEP_MAX_REQUEUES times before they are marked failed.
+# Running stages heartbeat every SWEEP_HEARTBEAT_SECONDS (keep it well under
+# SWEEP_STUCK_AFTER_SECONDS)
+SWEEP_INTERVAL_SECONDS = int(os.getenv('SWEEP_INTERVAL_SECONDS', '300'))
+SWEEP_STUCK_AFTER_SECONDS = int(os.getenv('SWEEP_STUCK_AFTER_SECONDS', '1800'))
+SWEEP_HEARTBEAT_SECONDS = int(os.getenv('SWEEP_HEARTBEAT_SECONDS', '60'))
+SWEEP_MAX_REQUEUES = int(os.getenv('SWEEP_MAX_REQUEUES', '3'))
+SWEEP_BATCH_SIZE = int(os.getenv('SWEEP_BATCH_SIZE', '500'))
+
+CELERY_BEAT_SCHEDULE = {
+    'sweep-stuck-submissions': {
+        'task': 'api.tasks.sweep_stuck_submissions',
+        'schedule': SWEEP_INTERVAL_SECONDS,
+    },
+}
+
+# Each pipeline stage runs on its own queue so the pools can be scaled
+# separately, e.g. `celery -A formvideo worker -Q media` for ffmpeg workers.
+# Set PRELOAD_MODELS='' on media and transcription workers, which never touch
+# the translation or Llama models (PRELOAD_MODELS=whisper on transcription
+# workers with TRANSCRIPTION_BACKEND=local).
+PIPELINE_MEDIA_QUEUE = os.getenv('PIPELINE_MEDIA_QUEUE', 'media')
+PIPELINE_TRANSCRIPTION_QUEUE = os.getenv('PIPELINE_TRANSCRIPTION_QUEUE', 'transcription')
+PIPELINE_INFERENCE_QUEUE = os.getenv('PIPELINE_INFERENCE_QUEUE', 'inference')
+
+CELERY_TASK_ROUTES = {
+    'api.tasks.extract_audio_stage': {'queue': PIPELINE_MEDIA_QUEUE},
+    'api.tasks.transcribe_audio_stage': {'queue': PIPELINE_TRANSCRIPTION_QUEUE},
+    'api.tasks.translate_transcript_stage': {'queue': PIPELINE_INFERENCE_QUEUE},
+    'api.tasks.extract_form_data_stage': {'queue': PIPELINE_INFERENCE_QUEUE},
+}
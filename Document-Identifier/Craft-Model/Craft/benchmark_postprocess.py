@@ -0,0 +1,323 @@
+"""
+Benchmark of the CRAFT post-processing (craft_utils.getDetBoxes_core and
+getPoly_core) against the original per-label and per-column implementations:
+checks that both return the same boxes and polygons and reports the speedup.
+
+Score maps come from the network when --trained_model exists; otherwise a
+stand-in text/link heatmap is derived from the image's dark strokes, which
+exercises the same code paths with a realistic number of components.
+
+    python benchmark_postprocess.py --image ../../images/aadhar-sample.jfif
+"""
+import os
+import time
+import math
+import argparse
+
+import cv2
+import numpy as np
+
+import craft_utils
+import imgproc
+
+
+def getDetBoxes_core_reference(textmap, linkmap, text_threshold, link_threshold, low_text):
+    """ original implementation: a full-size map and mask per label """
+    linkmap = linkmap.copy()
+    textmap = textmap.copy()
+    img_h, img_w = textmap.shape
+
+    ret, text_score = cv2.threshold(textmap, low_text, 1, 0)
+    ret, link_score = cv2.threshold(linkmap, link_threshold, 1, 0)
+
+    text_score_comb = np.clip(text_score + link_score, 0, 1)
+    nLabels, labels, stats, centroids = cv2.connectedComponentsWithStats(text_score_comb.astype(np.uint8), connectivity=4)
+
+    det = []
+    mapper = []
+    for k in range(1,nLabels):
+        size = stats[k, cv2.CC_STAT_AREA]
+        if size < 10: continue
+
+        if np.max(textmap[labels==k]) < text_threshold: continue
+
+        segmap = np.zeros(textmap.shape, dtype=np.uint8)
+        segmap[labels==k] = 255
+        segmap[np.logical_and(link_score==1, text_score==0)] = 0
+        x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
+        w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
+        niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
+        sx, ex, sy, ey = x - niter, x + w + niter + 1, y - niter, y + h + niter + 1
+        if sx < 0 : sx = 0
+        if sy < 0 : sy = 0
+        if ex >= img_w: ex = img_w
+        if ey >= img_h: ey = img_h
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT,(1 + niter, 1 + niter))
+        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+
+        np_contours = np.roll(np.array(np.where(segmap!=0)),1,axis=0).transpose().reshape(-1,2)
+        rectangle = cv2.minAreaRect(np_contours)
+        box = cv2.boxPoints(rectangle)
+
+        w, h = np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[1] - box[2])
+        box_ratio = max(w, h) / (min(w, h) + 1e-5)
+        if abs(1 - box_ratio) <= 0.1:
+            l, r = min(np_contours[:,0]), max(np_contours[:,0])
+            t, b = min(np_contours[:,1]), max(np_contours[:,1])
+            box = np.array([[l, t], [r, t], [r, b], [l, b]], dtype=np.float32)
+
+        startidx = box.sum(axis=1).argmin()
+        box = np.roll(box, 4-startidx, 0)
+        box = np.array(box)
+
+        det.append(box)
+        mapper.append(k)
+
+    return det, labels, mapper
+
+
+def getPoly_core_reference(boxes, labels, mapper, linkmap):
+    """ original implementation: a Python loop per column and a fresh line image per radius step """
+    # configs
+    num_cp = 5
+    max_len_ratio = 0.7
+    expand_ratio = 1.45
+    max_r = 2.0
+    step_r = 0.2
+
+    polys = []  
+    for k, box in enumerate(boxes):
+        # size filter for small instance
+        w, h = int(np.linalg.norm(box[0] - box[1]) + 1), int(np.linalg.norm(box[1] - box[2]) + 1)
+        if w < 10 or h < 10:
+            polys.append(None); continue
+
+        # warp image
+        tar = np.float32([[0,0],[w,0],[w,h],[0,h]])
+        M = cv2.getPerspectiveTransform(box, tar)
+        word_label = cv2.warpPerspective(labels, M, (w, h), flags=cv2.INTER_NEAREST)
+        try:
+            Minv = np.linalg.inv(M)
+        except:
+            polys.append(None); continue
+
+        # binarization for selected label
+        cur_label = mapper[k]
+        word_label[word_label != cur_label] = 0
+        word_label[word_label > 0] = 1
+
+        """ Polygon generation """
+        # find top/bottom contours
+        cp = []
+        max_len = -1
+        for i in range(w):
+            region = np.where(word_label[:,i] != 0)[0]
+            if len(region) < 2 : continue
+            cp.append((i, region[0], region[-1]))
+            length = region[-1] - region[0] + 1
+            if length > max_len: max_len = length
+
+        # pass if max_len is similar to h
+        if h * max_len_ratio < max_len:
+            polys.append(None); continue
+
+        # get pivot points with fixed length
+        tot_seg = num_cp * 2 + 1
+        seg_w = w / tot_seg     # segment width
+        pp = [None] * num_cp    # init pivot points
+        cp_section = [[0, 0]] * tot_seg
+        seg_height = [0] * num_cp
+        seg_num = 0
+        num_sec = 0
+        prev_h = -1
+        for i in range(0,len(cp)):
+            (x, sy, ey) = cp[i]
+            if (seg_num + 1) * seg_w <= x and seg_num <= tot_seg:
+                # average previous segment
+                if num_sec == 0: break
+                cp_section[seg_num] = [cp_section[seg_num][0] / num_sec, cp_section[seg_num][1] / num_sec]
+                num_sec = 0
+
+                # reset variables
+                seg_num += 1
+                prev_h = -1
+
+            # accumulate center points
+            cy = (sy + ey) * 0.5
+            cur_h = ey - sy + 1
+            cp_section[seg_num] = [cp_section[seg_num][0] + x, cp_section[seg_num][1] + cy]
+            num_sec += 1
+
+            if seg_num % 2 == 0: continue # No polygon area
+
+            if prev_h < cur_h:
+                pp[int((seg_num - 1)/2)] = (x, cy)
+                seg_height[int((seg_num - 1)/2)] = cur_h
+                prev_h = cur_h
+
+        # processing last segment
+        if num_sec != 0:
+            cp_section[-1] = [cp_section[-1][0] / num_sec, cp_section[-1][1] / num_sec]
+
+        # pass if num of pivots is not sufficient or segment widh is smaller than character height 
+        if None in pp or seg_w < np.max(seg_height) * 0.25:
+            polys.append(None); continue
+
+        # calc median maximum of pivot points
+        half_char_h = np.median(seg_height) * expand_ratio / 2
+
+        # calc gradiant and apply to make horizontal pivots
+        new_pp = []
+        for i, (x, cy) in enumerate(pp):
+            dx = cp_section[i * 2 + 2][0] - cp_section[i * 2][0]
+            dy = cp_section[i * 2 + 2][1] - cp_section[i * 2][1]
+            if dx == 0:     # gradient if zero
+                new_pp.append([x, cy - half_char_h, x, cy + half_char_h])
+                continue
+            rad = - math.atan2(dy, dx)
+            c, s = half_char_h * math.cos(rad), half_char_h * math.sin(rad)
+            new_pp.append([x - s, cy - c, x + s, cy + c])
+
+        # get edge points to cover character heatmaps
+        isSppFound, isEppFound = False, False
+        grad_s = (pp[1][1] - pp[0][1]) / (pp[1][0] - pp[0][0]) + (pp[2][1] - pp[1][1]) / (pp[2][0] - pp[1][0])
+        grad_e = (pp[-2][1] - pp[-1][1]) / (pp[-2][0] - pp[-1][0]) + (pp[-3][1] - pp[-2][1]) / (pp[-3][0] - pp[-2][0])
+        for r in np.arange(0.5, max_r, step_r):
+            dx = 2 * half_char_h * r
+            if not isSppFound:
+                line_img = np.zeros(word_label.shape, dtype=np.uint8)
+                dy = grad_s * dx
+                p = np.array(new_pp[0]) - np.array([dx, dy, dx, dy])
+                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
+                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                    spp = p
+                    isSppFound = True
+            if not isEppFound:
+                line_img = np.zeros(word_label.shape, dtype=np.uint8)
+                dy = grad_e * dx
+                p = np.array(new_pp[-1]) + np.array([dx, dy, dx, dy])
+                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
+                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                    epp = p
+                    isEppFound = True
+            if isSppFound and isEppFound:
+                break
+
+        # pass if boundary of polygon is not found
+        if not (isSppFound and isEppFound):
+            polys.append(None); continue
+
+        # make final polygon
+        poly = []
+        poly.append(craft_utils.warpCoord(Minv, (spp[0], spp[1])))
+        for p in new_pp:
+            poly.append(craft_utils.warpCoord(Minv, (p[0], p[1])))
+        poly.append(craft_utils.warpCoord(Minv, (epp[0], epp[1])))
+        poly.append(craft_utils.warpCoord(Minv, (epp[2], epp[3])))
+        for p in reversed(new_pp):
+            poly.append(craft_utils.warpCoord(Minv, (p[2], p[3])))
+        poly.append(craft_utils.warpCoord(Minv, (spp[2], spp[3])))
+
+        # add to final result
+        polys.append(np.array(poly))
+
+    return polys
+
+def network_score_maps(image, args):
+    import torch
+    from craft import CRAFT
+    from test import copyStateDict
+
+    net = CRAFT()
+    net.load_state_dict(copyStateDict(torch.load(args.trained_model, map_location='cpu')))
+    net.eval()
+
+    img_resized, target_ratio, size_heatmap = imgproc.resize_aspect_ratio(image, args.canvas_size, interpolation=cv2.INTER_LINEAR, mag_ratio=args.mag_ratio)
+    x = torch.from_numpy(imgproc.normalizeMeanVariance(img_resized)).permute(2, 0, 1).unsqueeze(0)
+    with torch.no_grad():
+        y, _ = net(x)
+    return y[0,:,:,0].numpy(), y[0,:,:,1].numpy()
+
+
+def proxy_score_maps(image, args):
+    """ heatmaps peaking on dark strokes, at the network's half resolution """
+    img_resized, target_ratio, size_heatmap = imgproc.resize_aspect_ratio(image, args.canvas_size, interpolation=cv2.INTER_LINEAR, mag_ratio=args.mag_ratio)
+    gray = cv2.cvtColor(img_resized.astype(np.uint8), cv2.COLOR_RGB2GRAY)
+    gray = cv2.resize(gray, size_heatmap, interpolation=cv2.INTER_AREA)
+    strokes = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    textmap = cv2.GaussianBlur(strokes.astype(np.float32) / 255, (5, 5), 0)
+    linkmap = cv2.GaussianBlur(cv2.dilate(strokes, np.ones((1, 5), np.uint8)).astype(np.float32) / 255, (5, 5), 0) * 0.6
+    return textmap, linkmap
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t)
+    return min(times), result
+
+
+def same_boxes(a, b):
+    return len(a) == len(b) and all(np.allclose(x, y) for x, y in zip(a, b))
+
+
+def same_polys(a, b):
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if (x is None) != (y is None):
+            return False
+        if x is not None and not np.allclose(x, y):
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CRAFT post-processing benchmark')
+    parser.add_argument('--image', default='../../images/aadhar-sample.jfif', type=str, help='input image')
+    parser.add_argument('--trained_model', default='weights/craft_mlt_25k.pth', type=str, help='pretrained model (optional)')
+    parser.add_argument('--text_threshold', default=0.7, type=float, help='text confidence threshold')
+    parser.add_argument('--low_text', default=0.4, type=float, help='text low-bound score')
+    parser.add_argument('--link_threshold', default=0.4, type=float, help='link confidence threshold')
+    parser.add_argument('--canvas_size', default=1280, type=int, help='image size for inference')
+    parser.add_argument('--mag_ratio', default=1.5, type=float, help='image magnification ratio')
+    parser.add_argument('--repeat', default=5, type=int, help='timed runs per implementation (best is reported)')
+    args = parser.parse_args()
+
+    # cv2 reads the JPEG regardless of the .jfif extension
+    image = cv2.imread(args.image)
+    if image is None:
+        raise FileNotFoundError(args.image)
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    if os.path.isfile(args.trained_model):
+        print('Score maps from ' + args.trained_model)
+        textmap, linkmap = network_score_maps(image, args)
+    else:
+        print('No trained model, using stand-in score maps derived from the image')
+        textmap, linkmap = proxy_score_maps(image, args)
+
+    thresholds = (args.text_threshold, args.link_threshold, args.low_text)
+    t_ref, (boxes_ref, labels_ref, mapper_ref) = best_time(lambda: getDetBoxes_core_reference(textmap, linkmap, *thresholds), args.repeat)
+    t_new, (boxes_new, labels_new, mapper_new) = best_time(lambda: craft_utils.getDetBoxes_core(textmap, linkmap, *thresholds), args.repeat)
+
+    identical = same_boxes(boxes_ref, boxes_new) and mapper_ref == mapper_new
+    print("score map {}x{}, {} components, {} boxes".format(textmap.shape[1], textmap.shape[0], labels_ref.max(), len(boxes_ref)))
+    print("getDetBoxes_core reference : {:.4f}s".format(t_ref))
+    print("getDetBoxes_core vectorized: {:.4f}s".format(t_new))
+    print("speedup: {:.1f}x, identical boxes: {}".format(t_ref / t_new, identical))
+
+    # both polygon implementations start from the same boxes and labels
+    t_ref, polys_ref = best_time(lambda: getPoly_core_reference(boxes_ref, labels_ref, mapper_ref, linkmap), args.repeat)
+    t_new, polys_new = best_time(lambda: craft_utils.getPoly_core(boxes_ref, labels_ref, mapper_ref, linkmap), args.repeat)
+
+    identical_polys = same_polys(polys_ref, polys_new)
+    print("{} polygons".format(sum(poly is not None for poly in polys_ref)))
+    print("getPoly_core reference : {:.4f}s".format(t_ref))
+    print("getPoly_core vectorized: {:.4f}s".format(t_new))
+    print("speedup: {:.1f}x, identical polygons: {}".format(t_ref / t_new, identical_polys))
+
+    if not (identical and identical_polys):
+        raise SystemExit(1)
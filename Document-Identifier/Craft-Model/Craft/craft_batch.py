@@ -0,0 +1,143 @@
+"""
+Batched CRAFT inference.
+
+Images are resized as for single-image inference (imgproc.resize_aspect_ratio),
+grouped into buckets of similar aspect ratio and size, padded to the largest
+size of their bucket (still a multiple of 32) and run through the network
+together. The score maps are cropped back per image and post-processed on a
+thread pool while the next batch runs.
+
+Extra zero padding is within the network's receptive field, so scores within
+a few pixels of the right/bottom edge can differ slightly from single-image
+inference; images whose padded size matches exactly give identical maps.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+
+import craft_utils
+import imgproc
+
+
+def make_buckets(shapes, batch_size, max_pad_ratio=0.25):
+    """ group image indices into batches of similar aspect ratio and size
+    Args:
+        shapes (list): padded (h, w) of every image, multiples of 32
+        batch_size (int): most images per batch
+        max_pad_ratio (float): most padding a batch may add, relative to the images' own area
+    Return:
+        list of index lists
+    """
+    # landscape and portrait images apart, then by size, so neighbours pad little
+    order = sorted(range(len(shapes)), key=lambda i: (shapes[i][0] > shapes[i][1], shapes[i][0], shapes[i][1]))
+
+    batches = []
+    batch, area, max_h, max_w = [], 0, 0, 0
+    for i in order:
+        h, w = shapes[i]
+        new_h, new_w = max(max_h, h), max(max_w, w)
+        if batch and (len(batch) == batch_size or new_h * new_w * (len(batch) + 1) > (1 + max_pad_ratio) * (area + h * w)):
+            batches.append(batch)
+            batch, area, new_h, new_w = [], 0, h, w
+        batch.append(i)
+        area += h * w
+        max_h, max_w = new_h, new_w
+    if batch:
+        batches.append(batch)
+    return batches
+
+def pad_batch(resized_images):
+    """ stack resized images on a zero canvas of the batch's largest size, normalized as [b, c, h, w] """
+    h = max(img.shape[0] for img in resized_images)
+    w = max(img.shape[1] for img in resized_images)
+    canvas = np.zeros((len(resized_images), h, w, 3), dtype=np.float32)
+    for i, img in enumerate(resized_images):
+        canvas[i, :img.shape[0], :img.shape[1], :] = img
+
+    x = imgproc.normalizeMeanVariance(canvas)
+    return torch.from_numpy(x).permute(0, 3, 1, 2)    # [b, h, w, c] to [b, c, h, w]
+
+def forward_batch(net, x, cuda, refine_net=None):
+    """ score and link maps of a batch, as numpy arrays [b, h/2, w/2] """
+    if cuda:
+        x = x.cuda()
+
+    with torch.no_grad():
+        y, feature = net(x)
+        score_text = y[:, :, :, 0].cpu().data.numpy()
+        score_link = y[:, :, :, 1].cpu().data.numpy()
+
+        # refine link
+        if refine_net is not None:
+            y_refiner = refine_net(y, feature)
+            score_link = y_refiner[:, :, :, 0].cpu().data.numpy()
+
+    return score_text, score_link
+
+def postprocess(score_text, score_link, target_ratio, text_threshold, link_threshold, low_text, poly):
+    """ boxes, polygons and heatmap image of one image's score maps, as test_net returns them """
+    ratio_h = ratio_w = 1 / target_ratio
+
+    boxes, polys = craft_utils.getDetBoxes(score_text, score_link, text_threshold, link_threshold, low_text, poly)
+
+    # coordinate adjustment
+    boxes = craft_utils.adjustResultCoordinates(boxes, ratio_w, ratio_h)
+    polys = craft_utils.adjustResultCoordinates(polys, ratio_w, ratio_h)
+    for k in range(len(polys)):
+        if polys[k] is None: polys[k] = boxes[k]
+
+    # render results (optional)
+    render_img = score_text.copy()
+    render_img = np.hstack((render_img, score_link))
+    ret_score_text = imgproc.cvt2HeatmapImg(render_img)
+
+    return boxes, polys, ret_score_text
+
+def detect_batch(net, images, text_threshold, link_threshold, low_text, cuda, poly, refine_net=None,
+                 canvas_size=1280, mag_ratio=1.5, batch_size=4, workers=None, lock=None):
+    """ detect text in a list of RGB images
+    Args:
+        net: CRAFT model in eval mode
+        images (list): RGB images as loaded by imgproc.loadImage
+        batch_size (int): most images per forward pass
+        workers (int): threads for resizing and post-processing (default: all cores)
+        lock: held around each forward pass when the networks are shared between threads
+    Return:
+        list of (boxes, polys, ret_score_text) per image, in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    results = [None] * len(images)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # resize
+        prepared = list(pool.map(
+            lambda image: imgproc.resize_aspect_ratio(image, canvas_size, interpolation=cv2.INTER_LINEAR, mag_ratio=mag_ratio),
+            images
+        ))
+
+        pending = []
+        for batch in make_buckets([img_resized.shape[:2] for img_resized, _, _ in prepared], batch_size):
+            x = pad_batch([prepared[i][0] for i in batch])
+            if lock is not None:
+                with lock:
+                    score_text, score_link = forward_batch(net, x, cuda, refine_net)
+            else:
+                score_text, score_link = forward_batch(net, x, cuda, refine_net)
+
+            # crop each image's maps back to its own heatmap size
+            for j, i in enumerate(batch):
+                img_resized, target_ratio, (heat_w, heat_h) = prepared[i]
+                pending.append((i, pool.submit(
+                    postprocess,
+                    np.ascontiguousarray(score_text[j, :heat_h, :heat_w]),
+                    np.ascontiguousarray(score_link[j, :heat_h, :heat_w]),
+                    target_ratio, text_threshold, link_threshold, low_text, poly
+                )))
+
+        for i, future in pending:
+            results[i] = future.result()
+
+    return results
@@ -1,5 +1,6 @@
 import os
 import time
+import threading
 import torch
 from torch.autograd import Variable
 import cv2
@@ -9,6 +10,7 @@ from PIL import Image
 from collections import OrderedDict
 import gdown
 import craft_utils
+import craft_batch
 import imgproc
 import file_utils
 from craft import CRAFT
@@ -19,14 +21,17 @@ weights = {
     'craft_refiner_CTW1500.pth': '1XSaFwBkOaFOdtk4Ane3DFyJGPRw6v5bO'
 }
 
-os.makedirs('weights', exist_ok=True)
+def ensure_weights(trained_model):
+    # Check if the specified trained model exists, if not, download it
+    model_file = os.path.basename(trained_model)
+    if model_file in weights and not os.path.isfile(trained_model):
+        print(f"{model_file} not found. Downloading...")
+        os.makedirs(os.path.dirname(trained_model) or '.', exist_ok=True)
+        url = f"https://drive.google.com/uc?id={weights[model_file]}"
+        gdown.download(url, trained_model, quiet=False)
 
-# Check if the specified trained model exists, if not, download it
-model_file = "weights/craft_mlt_25k.pth"
-if model_file in weights and not os.path.isfile(args.trained_model):
-    print(f"{model_file} not found. Downloading...")
-    url = f"https://drive.google.com/uc?id={weights[model_file]}"
-    gdown.download(url, args.trained_model, quiet=False)
+    if not os.path.isfile(trained_model):
+        raise FileNotFoundError(f"Model file not found: {trained_model}")
 
 
 def copyStateDict(state_dict):
@@ -41,6 +46,7 @@ def copyStateDict(state_dict):
     return new_state_dict
 
 def load_model(trained_model, cuda):
+    ensure_weights(trained_model)
     net = CRAFT()  # initialize
     if cuda:
         net.load_state_dict(copyStateDict(torch.load(trained_model)))
@@ -52,6 +58,79 @@ def load_model(trained_model, cuda):
     net.eval()
     return net
 
+def load_refiner(refiner_model, cuda):
+    from refinenet import RefineNet
+    ensure_weights(refiner_model)
+    refine_net = RefineNet()
+    if cuda:
+        refine_net.load_state_dict(copyStateDict(torch.load(refiner_model)))
+        refine_net = refine_net.cuda()
+        refine_net = torch.nn.DataParallel(refine_net)
+    else:
+        refine_net.load_state_dict(copyStateDict(torch.load(refiner_model, map_location='cpu')))
+    refine_net.eval()
+    return refine_net
+
+class CraftDetector:
+    """ CRAFT (and optionally the link RefineNet) loaded once and reused for every image
+    Args:
+        trained_model (str): CRAFT weights, downloaded if missing
+        cuda (bool): run on the GPU
+        refine (bool): refine links with RefineNet (implies polygons)
+        refiner_model (str): RefineNet weights, downloaded if missing
+    Thread safety:
+        forward passes are serialized by a lock; resizing and post-processing
+        of concurrent calls run in parallel.
+    """
+    def __init__(self, trained_model='weights/craft_mlt_25k.pth', cuda=True, refine=False,
+                 refiner_model='weights/craft_refiner_CTW1500.pth', text_threshold=0.7, link_threshold=0.4,
+                 low_text=0.4, poly=False, canvas_size=1280, mag_ratio=1.5, batch_size=4, workers=None):
+        self.cuda = cuda
+        self.text_threshold = text_threshold
+        self.link_threshold = link_threshold
+        self.low_text = low_text
+        self.poly = poly or refine
+        self.canvas_size = canvas_size
+        self.mag_ratio = mag_ratio
+        self.batch_size = batch_size
+        self.workers = workers
+
+        self.net = load_model(trained_model, cuda)
+        self.refine_net = load_refiner(refiner_model, cuda) if refine else None
+        self._lock = threading.Lock()
+
+    def detect(self, image):
+        """ boxes, polys and score heatmap image of one RGB image (as imgproc.loadImage returns it) """
+        return self._detect([image], workers=1)[0]
+
+    def detect_many(self, images):
+        """ detections of several RGB images, run in size-bucketed batches; in input order """
+        return self._detect(images, workers=self.workers)
+
+    def _detect(self, images, workers):
+        return craft_batch.detect_batch(
+            self.net, images, self.text_threshold, self.link_threshold, self.low_text, self.cuda, self.poly,
+            self.refine_net, canvas_size=self.canvas_size, mag_ratio=self.mag_ratio,
+            batch_size=self.batch_size, workers=workers, lock=self._lock
+        )
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+def get_detector(trained_model='weights/craft_mlt_25k.pth', cuda=True, refine=False,
+                 refiner_model='weights/craft_refiner_CTW1500.pth', **options):
+    """ the process-wide CraftDetector for these weights and settings, created on first use
+    Args:
+        options: the other CraftDetector arguments (thresholds, poly, canvas_size, ...);
+            every distinct combination gets its own detector
+    """
+    key = (os.path.abspath(trained_model), cuda, os.path.abspath(refiner_model) if refine else None,
+           tuple(sorted(options.items())))
+    with _detectors_lock:
+        if key not in _detectors:
+            _detectors[key] = CraftDetector(trained_model, cuda, refine=refine, refiner_model=refiner_model, **options)
+        return _detectors[key]
+
 def process_image(net, image, text_threshold, link_threshold, low_text, cuda, poly, refine_net=None):
     # resize
     img_resized, target_ratio, size_heatmap = imgproc.resize_aspect_ratio(image, 1280, interpolation=cv2.INTER_LINEAR, mag_ratio=1.5)
@@ -121,14 +200,14 @@ def extract_and_save_images(image_path, coordinates_file, output_folder):
         print(f"Segmented image saved: {output_path}")
 
 def craftseg(image_path, trained_model='weights/craft_mlt_25k.pth', cuda=True):
-    # Load model
-    net = load_model(trained_model, cuda)
+    # Model is loaded once per process and reused
+    detector = get_detector(trained_model, cuda)
 
     # Load image
     image = imgproc.loadImage(image_path)
 
     # Process image
-    bboxes, polys, score_text = process_image(net, image, 0.7, 0.4, 0.4, cuda, False)
+    bboxes, polys, score_text = detector.detect(image)
 
     # Save results
     result_folder = './result/'
@@ -1,12 +1,27 @@
 import numpy as np
 import cv2
 import math
+from scipy import ndimage
 
 """ auxilary functions """
 # unwarp corodinates
 def warpCoord(Minv, pt):
     out = np.matmul(Minv, (pt[0], pt[1], 1))
     return np.array([out[0]/out[2], out[1]/out[2]])
+
+# whether the segment p = (x1, y1, x2, y2), drawn as cv2.line does, touches the mask;
+# only the segment's bounding box of the (blank) scratch image is drawn, read and cleared
+def lineHitsMask(line_img, mask, p):
+    x1, y1, x2, y2 = int(p[0]), int(p[1]), int(p[2]), int(p[3])
+    img_h, img_w = mask.shape
+    sx, ex = max(min(x1, x2), 0), min(max(x1, x2) + 1, img_w)
+    sy, ey = max(min(y1, y2), 0), min(max(y1, y2) + 1, img_h)
+    if sx >= ex or sy >= ey:
+        return False
+    cv2.line(line_img, (x1, y1), (x2, y2), 1, thickness=1)
+    hit = np.any(np.logical_and(mask[sy:ey, sx:ex], line_img[sy:ey, sx:ex]))
+    line_img[sy:ey, sx:ex] = 0
+    return hit
 """ end of auxilary functions """
 
 
@@ -23,6 +38,13 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
     text_score_comb = np.clip(text_score + link_score, 0, 1)
     nLabels, labels, stats, centroids = cv2.connectedComponentsWithStats(text_score_comb.astype(np.uint8), connectivity=4)
 
+    # peak text score of every label, in one labeled reduction over the labeled pixels
+    label_max = np.zeros(nLabels, dtype=textmap.dtype)
+    if nLabels > 1:
+        fg = labels > 0
+        label_max[1:] = ndimage.maximum(textmap[fg], labels[fg], np.arange(1, nLabels))
+    link_area = np.logical_and(link_score==1, text_score==0)
+
     det = []
     mapper = []
     for k in range(1,nLabels):
@@ -31,12 +53,9 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
         if size < 10: continue
 
         # thresholding
-        if np.max(textmap[labels==k]) < text_threshold: continue
+        if label_max[k] < text_threshold: continue
 
-        # make segmentation map
-        segmap = np.zeros(textmap.shape, dtype=np.uint8)
-        segmap[labels==k] = 255
-        segmap[np.logical_and(link_score==1, text_score==0)] = 0   # remove link area
+        # dilation window around the component
         x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
         w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
         niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
@@ -46,11 +65,17 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
         if sy < 0 : sy = 0
         if ex >= img_w: ex = img_w
         if ey >= img_h: ey = img_h
+
+        # make segmentation map, only inside the window (the component never reaches outside it)
+        segmap = np.zeros((ey - sy, ex - sx), dtype=np.uint8)
+        segmap[labels[sy:ey, sx:ex]==k] = 255
+        segmap[link_area[sy:ey, sx:ex]] = 0   # remove link area
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT,(1 + niter, 1 + niter))
-        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+        segmap = cv2.dilate(segmap, kernel)
 
         # make box
-        np_contours = np.roll(np.array(np.where(segmap!=0)),1,axis=0).transpose().reshape(-1,2)
+        ys, xs = np.where(segmap!=0)
+        np_contours = np.stack((xs + sx, ys + sy), axis=1)
         rectangle = cv2.minAreaRect(np_contours)
         box = cv2.boxPoints(rectangle)
 
@@ -58,8 +83,8 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
         w, h = np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[1] - box[2])
         box_ratio = max(w, h) / (min(w, h) + 1e-5)
         if abs(1 - box_ratio) <= 0.1:
-            l, r = min(np_contours[:,0]), max(np_contours[:,0])
-            t, b = min(np_contours[:,1]), max(np_contours[:,1])
+            l, r = np_contours[:,0].min(), np_contours[:,0].max()
+            t, b = np_contours[:,1].min(), np_contours[:,1].max()
             box = np.array([[l, t], [r, t], [r, b], [l, b]], dtype=np.float32)
 
         # make clock-wise order
@@ -98,19 +123,16 @@ def getPoly_core(boxes, labels, mapper, linkmap):
 
         # binarization for selected label
         cur_label = mapper[k]
-        word_label[word_label != cur_label] = 0
-        word_label[word_label > 0] = 1
+        word_label = (word_label == cur_label).astype(np.uint8)
 
         """ Polygon generation """
-        # find top/bottom contours
-        cp = []
-        max_len = -1
-        for i in range(w):
-            region = np.where(word_label[:,i] != 0)[0]
-            if len(region) < 2 : continue
-            cp.append((i, region[0], region[-1]))
-            length = region[-1] - region[0] + 1
-            if length > max_len: max_len = length
+        # find top/bottom contours: first and last labeled row of every column with 2+ pixels
+        col_mask = word_label != 0
+        cols = np.nonzero(col_mask.sum(axis=0) >= 2)[0]
+        col_top = col_mask.argmax(axis=0)[cols]
+        col_bottom = h - 1 - col_mask[::-1].argmax(axis=0)[cols]
+        col_h = col_bottom - col_top + 1
+        max_len = col_h.max() if len(cols) > 0 else -1
 
         # pass if max_len is similar to h
         if h * max_len_ratio < max_len:
@@ -122,37 +144,33 @@ def getPoly_core(boxes, labels, mapper, linkmap):
         pp = [None] * num_cp    # init pivot points
         cp_section = [[0, 0]] * tot_seg
         seg_height = [0] * num_cp
+        col_cy = (col_top + col_bottom) * 0.5
+        # a column opens the next segment once it reaches the segment's right edge;
+        # segments advance by at most one per column, so a gap does not skip segments
+        seg_start = 0
         seg_num = 0
-        num_sec = 0
-        prev_h = -1
-        for i in range(0,len(cp)):
-            (x, sy, ey) = cp[i]
-            if (seg_num + 1) * seg_w <= x and seg_num <= tot_seg:
-                # average previous segment
-                if num_sec == 0: break
+        if len(cols) > 0 and cols[0] >= seg_w:
+            seg_start = len(cols)    # nothing accumulated before the first boundary
+        while seg_start < len(cols):
+            seg_end = max(int(np.searchsorted(cols, (seg_num + 1) * seg_w)), seg_start + 1)
+            sec = slice(seg_start, seg_end)
+            num_sec = seg_end - seg_start
+            cp_section[seg_num] = [cols[sec].sum(), col_cy[sec].sum()]
+            if seg_end < len(cols):
+                # average finished segment
                 cp_section[seg_num] = [cp_section[seg_num][0] / num_sec, cp_section[seg_num][1] / num_sec]
-                num_sec = 0
-
-                # reset variables
-                seg_num += 1
-                prev_h = -1
-
-            # accumulate center points
-            cy = (sy + ey) * 0.5
-            cur_h = ey - sy + 1
-            cp_section[seg_num] = [cp_section[seg_num][0] + x, cp_section[seg_num][1] + cy]
-            num_sec += 1
-
-            if seg_num % 2 == 0: continue # No polygon area
+            else:
+                # processing last segment
+                cp_section[-1] = [cp_section[-1][0] / num_sec, cp_section[-1][1] / num_sec]
 
-            if prev_h < cur_h:
-                pp[int((seg_num - 1)/2)] = (x, cy)
-                seg_height[int((seg_num - 1)/2)] = cur_h
-                prev_h = cur_h
+            if seg_num % 2 == 1:
+                # tallest column of the segment (first one on ties) is the pivot
+                peak = seg_start + int(col_h[sec].argmax())
+                pp[int((seg_num - 1)/2)] = (cols[peak], col_cy[peak])
+                seg_height[int((seg_num - 1)/2)] = col_h[peak]
 
-        # processing last segment
-        if num_sec != 0:
-            cp_section[-1] = [cp_section[-1][0] / num_sec, cp_section[-1][1] / num_sec]
+            seg_start = seg_end
+            seg_num += 1
 
         # pass if num of pivots is not sufficient or segment widh is smaller than character height 
         if None in pp or seg_w < np.max(seg_height) * 0.25:
@@ -177,22 +195,19 @@ def getPoly_core(boxes, labels, mapper, linkmap):
         isSppFound, isEppFound = False, False
         grad_s = (pp[1][1] - pp[0][1]) / (pp[1][0] - pp[0][0]) + (pp[2][1] - pp[1][1]) / (pp[2][0] - pp[1][0])
         grad_e = (pp[-2][1] - pp[-1][1]) / (pp[-2][0] - pp[-1][0]) + (pp[-3][1] - pp[-2][1]) / (pp[-3][0] - pp[-2][0])
+        line_img = np.zeros(word_label.shape, dtype=np.uint8)
         for r in np.arange(0.5, max_r, step_r):
             dx = 2 * half_char_h * r
             if not isSppFound:
-                line_img = np.zeros(word_label.shape, dtype=np.uint8)
                 dy = grad_s * dx
                 p = np.array(new_pp[0]) - np.array([dx, dy, dx, dy])
-                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
-                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                if not lineHitsMask(line_img, word_label, p) or r + 2 * step_r >= max_r:
                     spp = p
                     isSppFound = True
             if not isEppFound:
-                line_img = np.zeros(word_label.shape, dtype=np.uint8)
                 dy = grad_e * dx
                 p = np.array(new_pp[-1]) + np.array([dx, dy, dx, dy])
-                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
-                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                if not lineHitsMask(line_img, word_label, p) or r + 2 * step_r >= max_r:
                     epp = p
                     isEppFound = True
             if isSppFound and isEppFound:
@@ -14,11 +14,13 @@ import cv2
 from skimage import io
 import numpy as np
 import craft_utils
+import craft_batch
 import imgproc
 import file_utils
 import json
 import gdown
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 from craft import CRAFT
 
@@ -60,6 +62,9 @@ parser.add_argument('--test_folder', default='/data/', type=str, help='folder pa
 parser.add_argument('--image_path', default=None, type=str, help='path to a single input image')
 parser.add_argument('--refine', default=False, action='store_true', help='enable link refiner')
 parser.add_argument('--refiner_model', default='weights/craft_refiner_CTW1500.pth', type=str, help='pretrained refiner model')
+parser.add_argument('--batch_size', default=4, type=int, help='images per forward pass for folder runs')
+parser.add_argument('--workers', default=0, type=int, help='threads for loading and post-processing (0: all cores)')
+parser.add_argument('--window_batches', default=4, type=int, help='batches loaded, detected and saved at a time for folder runs')
 
 args = parser.parse_args()
 
@@ -170,18 +175,31 @@ if __name__ == '__main__':
 
     t = time.time()
 
-    # load data
-    for k, image_path in enumerate(image_list):
-        print("Test image {:d}/{:d}: {:s}".format(k+1, len(image_list), image_path), end='\r')
-        image = imgproc.loadImage(image_path)
+    def save_results(results, first):
+        for k, (image_path, image, bboxes, polys, score_text) in enumerate(results, first):
+            print("Test image {:d}/{:d}: {:s}".format(k+1, len(image_list), image_path), end='\r')
 
-        bboxes, polys, score_text = test_net(net, image, args.text_threshold, args.link_threshold, args.low_text, args.cuda, args.poly, refine_net)
+            # save score text
+            filename, file_ext = os.path.splitext(os.path.basename(image_path))
+            mask_file = result_folder + "/res_" + filename + '_mask.jpg'
+            cv2.imwrite(mask_file, score_text)
 
-        # save score text
-        filename, file_ext = os.path.splitext(os.path.basename(image_path))
-        mask_file = result_folder + "/res_" + filename + '_mask.jpg'
-        cv2.imwrite(mask_file, score_text)
+            file_utils.saveResult(image_path, image[:,:,::-1], polys, dirname=result_folder)
 
-        file_utils.saveResult(image_path, image[:,:,::-1], polys, dirname=result_folder)
+    if args.image_path:
+        image = imgproc.loadImage(args.image_path)
+        save_results([(args.image_path, image) + test_net(net, image, args.text_threshold, args.link_threshold, args.low_text, args.cuda, args.poly, refine_net)], 0)
+    else:
+        # folder run: a window of a few batches at a time is loaded, detected in size-bucketed
+        # batches (post-processed on all cores) and saved, so memory does not grow with the folder
+        workers = args.workers or os.cpu_count() or 1
+        window = max(args.batch_size, 1) * max(args.window_batches, 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for first in range(0, len(image_list), window):
+                paths = image_list[first:first + window]
+                images = list(pool.map(imgproc.loadImage, paths))
+                detections = craft_batch.detect_batch(net, images, args.text_threshold, args.link_threshold, args.low_text, args.cuda, args.poly, refine_net,
+                                                      canvas_size=args.canvas_size, mag_ratio=args.mag_ratio, batch_size=args.batch_size, workers=workers)
+                save_results([(image_path, image) + detection for image_path, image, detection in zip(paths, images, detections)], first)
 
     print("elapsed time : {}s".format(time.time() - t))
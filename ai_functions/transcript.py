@@ -32,22 +32,30 @@ def transcribe_audio(audio_path, translate=False):
         transform = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)
         waveform = transform(waveform)
 
+    # Mix down to mono
+    waveform = waveform.mean(dim=0)
+
+    # Whisper only sees 30 seconds per input, so split longer audio into
+    # 30 second windows and transcribe them together as one batch
+    window = 30 * 16000
+    windows = [waveform[start:start + window].numpy() for start in range(0, max(len(waveform), 1), window)]
+
     # Process audio
-    inputs = processor(waveform.squeeze().numpy(), return_tensors="pt", sampling_rate=16000)
+    inputs = processor(windows, return_tensors="pt", sampling_rate=16000)
     inputs = {k: v.to(model.device) for k, v in inputs.items()}  # Move to GPU if available
 
     # Transcription
     with torch.no_grad():
         predicted_ids = model.generate(**inputs)
 
-    text = processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
+    text = " ".join(t.strip() for t in processor.batch_decode(predicted_ids, skip_special_tokens=True))
 
     if translate:
         # Translate to English
         print("Translating to English...")
         with torch.no_grad():
             predicted_ids_translated = model.generate(**inputs, task="translate")
-        translated_text = processor.batch_decode(predicted_ids_translated, skip_special_tokens=True)[0]
+        translated_text = " ".join(t.strip() for t in processor.batch_decode(predicted_ids_translated, skip_special_tokens=True))
         return text, translated_text
 
     return text, None